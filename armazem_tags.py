@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+
+class ArmazemAlbumTag:
+    """
+    Tabela álbum x tag compacta: nomes de álbuns e tags viram ids inteiros (internados uma vez só)
+    e as entradas (álbum, tag, peso) ficam em arrays COO que crescem geometricamente.
+    Substitui o DataFrame longo + pivot_table: a matriz esparsa sai direto, sem matriz densa intermediária.
+    """
+
+    def __init__(self, capacidade=4096):
+        self.albuns = []        # id -> álbum: (artista, título), ou só o nome se não houver artista
+        self.tags = []          # id -> nome da tag
+        self._id_album = {}
+        self._id_tag = {}
+        self.n = 0              # entradas ocupadas nos buffers
+        self._linhas = np.zeros(capacidade, dtype=np.int32)
+        self._colunas = np.zeros(capacidade, dtype=np.int32)
+        self._pesos = np.zeros(capacidade, dtype=np.float64)
+
+    @classmethod
+    def de_dataframe(cls, df, coluna_album='Album', coluna_tag='Tag', coluna_peso='Peso', coluna_artista='Artista'):
+        armazem = cls(max(len(df), 4096))
+        armazem.adicionar_dataframe(df, coluna_album, coluna_tag, coluna_peso, coluna_artista)
+        return armazem
+
+    def adicionar_dataframe(self, df, coluna_album='Album', coluna_tag='Tag', coluna_peso='Peso',
+                            coluna_artista='Artista'):
+        """Com a coluna do artista, cada álbum é o par (artista, título): títulos iguais não se misturam."""
+        albuns = df[coluna_album].to_numpy()
+        if coluna_artista in df:
+            albuns = pd.MultiIndex.from_arrays([df[coluna_artista].to_numpy(), albuns])
+        self.adicionar(albuns, df[coluna_tag].to_numpy(), df[coluna_peso].to_numpy())
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def n_albuns(self):
+        return len(self.albuns)
+
+    @property
+    def n_tags(self):
+        return len(self.tags)
+
+    @staticmethod
+    def _internar(valores, ids, nomes):
+        # factorize agrupa os repetidos em C; o dicionário só é consultado uma vez por valor distinto
+        # (um MultiIndex é fatorado por nível e cada valor distinto sai como tupla)
+        if not isinstance(valores, pd.MultiIndex): valores = np.asarray(valores, dtype=object)
+        codigos, unicos = pd.factorize(valores)
+        ids_unicos = np.empty(len(unicos), dtype=np.int32)
+        for j, valor in enumerate(unicos):
+            i = ids.get(valor)
+            if i is None:
+                i = ids[valor] = len(nomes)
+                nomes.append(valor)
+            ids_unicos[j] = i
+        return ids_unicos[codigos]
+
+    def _crescer(self, extra):
+        if self.n + extra <= len(self._pesos): return
+        tamanho = max(len(self._pesos) * 2, self.n + extra)
+        for nome in ('_linhas', '_colunas', '_pesos'):
+            antigo = getattr(self, nome)
+            novo = np.zeros(tamanho, dtype=antigo.dtype)
+            novo[:self.n] = antigo[:self.n]
+            setattr(self, nome, novo)
+
+    def adicionar(self, albuns, tags, pesos):
+        """Acrescenta entradas (sequências paralelas de álbum, tag e peso) em O(1) amortizado por entrada."""
+        pesos = np.asarray(pesos, dtype=np.float64)
+        if len(pesos) == 0: return
+        linhas = self._internar(albuns, self._id_album, self.albuns)
+        colunas = self._internar(tags, self._id_tag, self.tags)
+
+        self._crescer(len(pesos))
+        fim = self.n + len(pesos)
+        self._linhas[self.n:fim] = linhas
+        self._colunas[self.n:fim] = colunas
+        self._pesos[self.n:fim] = pesos
+        self.n = fim
+
+    def como_csr(self, ordenar=True):
+        """
+        Matriz álbum x tag em CSR com a média dos pesos repetidos (como o pivot_table).
+        Retorna (matriz, nomes_albuns, nomes_tags). Com 'ordenar', linhas e colunas seguem a ordem
+        alfabética dos nomes, igual ao índice/colunas do pivot_table.
+        """
+        linhas, colunas, pesos = self._linhas[:self.n], self._colunas[:self.n], self._pesos[:self.n]
+        albuns, tags = list(self.albuns), list(self.tags)
+        if ordenar:
+            ordem_albuns = sorted(range(len(albuns)), key=albuns.__getitem__)
+            ordem_tags = sorted(range(len(tags)), key=tags.__getitem__)
+            posicao_album = np.empty(len(albuns), dtype=np.int32)
+            posicao_album[ordem_albuns] = np.arange(len(albuns), dtype=np.int32)
+            posicao_tag = np.empty(len(tags), dtype=np.int32)
+            posicao_tag[ordem_tags] = np.arange(len(tags), dtype=np.int32)
+            linhas, colunas = posicao_album[linhas], posicao_tag[colunas]
+            albuns = [albuns[i] for i in ordem_albuns]
+            tags = [tags[i] for i in ordem_tags]
+
+        formato = (len(albuns), len(tags))
+        soma = csr_matrix((pesos, (linhas, colunas)), shape=formato)
+        contagem = csr_matrix((np.ones(len(pesos)), (linhas, colunas)), shape=formato)
+        soma.sum_duplicates()
+        contagem.sum_duplicates()
+        soma.data /= contagem.data  # mesma estrutura nas duas: soma / repetições = média
+        return soma, albuns, tags
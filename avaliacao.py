@@ -0,0 +1,282 @@
+"""
+Avaliação offline do recomendador (qualidade e desempenho), só com dados locais: o CSV do RYM e as tags
+já salvas no checkpoint do ingestao.py (sem o checkpoint, só os blocos de gêneros/descritores/notas do CSV).
+
+Qualidade: cada perfil sintético são alguns álbuns de um mesmo artista; os outros álbuns dele ficam
+de fora e contam como acerto quando aparecem nas recomendações (precisão/recall/acerto@k).
+Desempenho: p50/p99 e pico de memória de carga do modelo, busca de nomes, recomendação (uma e em lote,
+com e sem o detalhamento) e inserção incremental. O cache de recomendações fica desligado: cada chamada
+medida (e a passada de memória, que repete as entradas) calcula tudo de novo.
+
+O resultado vai para um JSON; com --comparar, as métricas são comparadas com um relatório anterior
+(ex: de outro commit) e o programa sai com código 1 se alguma piorou além da tolerância.
+
+Uso:
+    python avaliacao.py --saida relatorio.json
+    python avaliacao.py --saida novo.json --comparar relatorio.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfTransformer
+
+from armazem_tags import ArmazemAlbumTag
+from cache_recomendacoes import CacheRecomendacoes
+from caracteristicas import construir_blocos
+from cliente_lastfm import limitador_global
+from indice_nomes import IndiceNomes
+from ingestao import ARQUIVO_CHECKPOINT, tags_coletadas
+from lastfm_falso import LastFmFalso
+from modelo_incremental import ModeloTfidfIncremental
+from pacote_modelo import carregar_pacote, salvar_pacote
+
+# ================= CONFIGURAÇÃO =================
+ARQUIVO_RELATORIO = 'relatorio_avaliacao.json'
+VERSAO_RELATORIO = 1
+KS = (5, 10, 20)
+ALBUNS_POR_PERFIL = 3           # no máximo; artistas com menos álbuns deixam ao menos um de fora
+TAMANHO_LOTE = 64
+AMOSTRA_MEMORIA = 20            # chamadas medidas com tracemalloc (mais lento) para o pico de memória
+TOLERANCIA_LATENCIA = 0.20      # piora relativa aceita no p50/p99
+PISO_LATENCIA_MS = 0.05         # diferenças menores que isso são ruído
+TOLERANCIA_QUALIDADE = 0.01     # queda absoluta aceita em precisão/recall/acerto
+
+
+def dados_locais(caminho_csv='rym_clean1.csv', caminho_tags=ARQUIVO_CHECKPOINT):
+    """(df_unique do CSV, tags no formato do ingerir(), origem das tags). Sem checkpoint, só os blocos do CSV."""
+    df_unique = pd.read_csv(caminho_csv).drop_duplicates(subset=['artist_name', 'release_name'])
+    if os.path.exists(caminho_tags):
+        return df_unique, tags_coletadas(df_unique, caminho_tags), 'checkpoint'
+    return df_unique, pd.DataFrame(columns=['Album', 'Tag', 'Peso', 'Artista']), 'nenhuma'
+
+
+def montar_modelo(df_unique, df_tags):
+    """Mesmo caminho do treinar.py: tags + blocos do CSV -> armazém -> TF-IDF -> modelo."""
+    armazem = ArmazemAlbumTag.de_dataframe(df_tags)
+    # Cache dos blocos num diretório temporário: a avaliação não deixa arquivos no diretório atual
+    with tempfile.TemporaryDirectory() as pasta, contextlib.redirect_stdout(io.StringIO()):
+        blocos = construir_blocos(df_unique, diretorio=pasta)
+    for df_bloco in blocos.values():
+        armazem.adicionar_dataframe(df_bloco)
+    matriz, chaves, tags = armazem.como_csr()
+    return ModeloTfidfIncremental.de_matriz(TfidfTransformer().fit_transform(matriz),
+                                            [titulo for _, titulo in chaves], tags,
+                                            artistas=[artista for artista, _ in chaves])
+
+
+def perfis_por_artista(modelo, n_perfis, albuns_por_perfil=ALBUNS_POR_PERFIL, semente=0):
+    """[(ids do perfil, ids deixados de fora)], um perfil por artista com dois álbuns ou mais."""
+    por_artista = {}
+    for linha, artista in enumerate(modelo.artistas):
+        if artista: por_artista.setdefault(artista, []).append(modelo.ids[linha])
+
+    rng = np.random.default_rng(semente)
+    elegiveis = sorted(artista for artista, ids in por_artista.items() if len(ids) >= 2)
+    rng.shuffle(elegiveis)
+    perfis = []
+    for artista in elegiveis[:n_perfis]:
+        ids = rng.permutation(por_artista[artista]).tolist()
+        n = min(albuns_por_perfil, len(ids) - 1)
+        perfis.append((ids[:n], ids[n:]))
+    return perfis
+
+
+def metricas_qualidade(recomendados, ocultos, ks=KS):
+    """Médias de precisão, recall e acerto (ao menos um oculto recomendado) para cada k."""
+    resultado = {}
+    for k in ks:
+        acertos = np.array([len(set(recs[:k]) & set(fora)) for recs, fora in zip(recomendados, ocultos)])
+        tamanhos = np.array([len(fora) for fora in ocultos])
+        resultado[str(k)] = {'precisao': float(np.mean(acertos / k)),
+                             'recall': float(np.mean(acertos / tamanhos)),
+                             'acerto': float(np.mean(acertos > 0))}
+    return resultado
+
+
+def medir(funcao, entradas, amostra_memoria=AMOSTRA_MEMORIA):
+    """p50/p99 de funcao(entrada) e, numa segunda passada curta com tracemalloc, o pico de memória alocada."""
+    tempos = []
+    with contextlib.redirect_stdout(io.StringIO()):  # o Sistema imprime o progresso de cada chamada
+        funcao(entradas[0])  # aquecimento: mapas montados sob demanda, páginas do memmap, pool de threads
+        for entrada in entradas:
+            inicio = time.perf_counter()
+            funcao(entrada)
+            tempos.append(time.perf_counter() - inicio)
+
+        tracemalloc.start()
+        for entrada in entradas[:amostra_memoria]:
+            tracemalloc.reset_peak()
+            funcao(entrada)
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    tempos = np.asarray(tempos) * 1000
+    return {'n': len(tempos), 'p50_ms': float(np.percentile(tempos, 50)),
+            'p99_ms': float(np.percentile(tempos, 99)), 'pico_memoria_mb': pico / 2**20}
+
+
+def consultas_de_busca(nomes, n, semente=0):
+    """Títulos inteiros, prefixos e títulos com um erro de digitação, em partes iguais."""
+    rng = np.random.default_rng(semente)
+    consultas = []
+    for i, linha in enumerate(rng.integers(0, len(nomes), n)):
+        nome = nomes[linha]
+        if i % 3 == 1: nome = nome[:max(3, len(nome) // 2)]
+        elif i % 3 == 2 and len(nome) > 4:
+            pos = int(rng.integers(1, len(nome) - 1))
+            nome = nome[:pos] + nome[pos + 1] + nome[pos] + nome[pos + 2:]
+        consultas.append(nome)
+    return consultas
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def avaliar(args):
+    from backend_logic import Sistema
+
+    df_unique, df_tags, origem_tags = dados_locais(args.csv, args.tags)
+    modelo = montar_modelo(df_unique, df_tags)
+    perfis = perfis_por_artista(modelo, args.perfis, semente=args.semente)
+    print(f"Catálogo: {len(modelo.nomes)} álbuns, {len(modelo.tags)} colunas (tags: {origem_tags}); "
+          f"{len(perfis)} perfis")
+
+    relatorio = {
+        'versao': VERSAO_RELATORIO,
+        'commit': _commit_atual(),
+        'data': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'parametros': {'csv': args.csv, 'origem_tags': origem_tags, 'perfis': len(perfis),
+                       'ks': list(args.ks), 'semente': args.semente},
+        'catalogo': {'albuns': len(modelo.nomes), 'colunas': len(modelo.tags),
+                     'nnz': int(modelo.matriz_tfidf.nnz)},
+    }
+    desempenho = relatorio['desempenho'] = {}
+
+    # O Last.fm falso não tem cota: sem isso o limitador global (5 req/s) domina o tempo do detalhamento
+    limite_original = limitador_global.taxa, limitador_global.capacidade
+    limitador_global.taxa = limitador_global.capacidade = limitador_global.fichas = 1e9
+    pasta_original = os.getcwd()
+    with tempfile.TemporaryDirectory() as pasta:
+        # O Sistema lê/grava modelo/ e metadados.db no diretório atual
+        os.chdir(pasta)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                salvar_pacote(modelo, IndiceNomes(modelo.nomes, modelo.ids))
+                sistema = Sistema(network=LastFmFalso(latencia=0))
+            # Sem isso o aquecimento, a passada de memória e a qualidade repetem perfis já calculados
+            sistema.cache_recomendacoes = CacheRecomendacoes(capacidade=0, qtd_minima=0)
+            desempenho['carga_modelo'] = medir(lambda _: carregar_pacote(), range(args.repeticoes_carga))
+
+            consultas = consultas_de_busca(modelo.nomes, args.buscas, args.semente)
+            desempenho['busca_nomes'] = medir(sistema.indice_nomes.buscar, consultas)
+
+            k = max(args.ks)
+            entradas = [[{'id': i} for i in ids] for ids, _ in perfis]
+            desempenho['recomendar'] = medir(lambda perfil: sistema.recomendar(perfil, k), entradas)
+            recomendados = [[rec['id'] for rec in sistema.recomendar(perfil, k)] for perfil in entradas]
+            relatorio['qualidade'] = metricas_qualidade(recomendados, [fora for _, fora in perfis], args.ks)
+
+            lotes = [entradas[i:i + TAMANHO_LOTE] for i in range(0, len(entradas), TAMANHO_LOTE)]
+            desempenho['recomendar_lote'] = medir(lambda lote: sistema.recomendar_lote(lote, k), lotes)
+            desempenho['recomendar_lote']['perfis_por_lote'] = TAMANHO_LOTE
+            desempenho['recomendacoes_com_detalhes'] = medir(
+                lambda perfil: sistema.gerar_recomendacoes_com_detalhes(perfil, 10), entradas[:args.detalhes])
+
+            # A passada de memória repete os primeiros álbuns: mede também a substituição de um álbum
+            tags = modelo.tags
+            novos = [(f"Novo {i}", [{'Album': f"Novo {i}", 'Tag': tags[i % len(tags)], 'Peso': 1.0}])
+                     for i in range(args.insercoes)]
+            desempenho['insercao'] = medir(lambda novo: sistema.adicionar_album(*novo, artista='Avaliação'), novos)
+            sistema.cache.fechar()
+        finally:
+            os.chdir(pasta_original)
+            limitador_global.taxa, limitador_global.capacidade = limite_original
+            limitador_global.fichas = min(limitador_global.fichas, limitador_global.capacidade)
+
+    import resource
+    relatorio['pico_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux: KB
+    return relatorio
+
+
+def comparar(atual, anterior, tolerancia_latencia=TOLERANCIA_LATENCIA, tolerancia_qualidade=TOLERANCIA_QUALIDADE):
+    """Linhas (métrica, anterior, atual, piorou) das métricas presentes nos dois relatórios."""
+    linhas = []
+    for k, metricas in atual.get('qualidade', {}).items():
+        for nome, valor in metricas.items():
+            antes = anterior.get('qualidade', {}).get(k, {}).get(nome)
+            if antes is None: continue
+            linhas.append((f"{nome}@{k}", antes, valor, valor < antes - tolerancia_qualidade))
+    for fase, metricas in atual.get('desempenho', {}).items():
+        for nome in ('p50_ms', 'p99_ms'):
+            antes = anterior.get('desempenho', {}).get(fase, {}).get(nome)
+            if antes is None: continue
+            valor = metricas[nome]
+            piorou = valor > antes * (1 + tolerancia_latencia) and valor - antes > PISO_LATENCIA_MS
+            linhas.append((f"{fase}.{nome}", antes, valor, piorou))
+    return linhas
+
+
+def imprimir(relatorio):
+    print(f"{'k':>4} {'precisão':>9} {'recall':>8} {'acerto':>8}")
+    for k, m in relatorio['qualidade'].items():
+        print(f"{k:>4} {m['precisao']:>9.3f} {m['recall']:>8.3f} {m['acerto']:>8.3f}")
+    print(f"{'fase':>28} {'n':>6} {'p50 (ms)':>10} {'p99 (ms)':>10} {'pico (MB)':>10}")
+    for fase, m in relatorio['desempenho'].items():
+        print(f"{fase:>28} {m['n']:>6} {m['p50_ms']:>10.3f} {m['p99_ms']:>10.3f} {m['pico_memoria_mb']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Avaliação offline do recomendador (qualidade e desempenho)")
+    parser.add_argument('--csv', default='rym_clean1.csv')
+    parser.add_argument('--tags', default=ARQUIVO_CHECKPOINT, help="checkpoint de tags do ingestao.py")
+    parser.add_argument('--perfis', type=int, default=1000, help="no máximo um por artista")
+    parser.add_argument('--ks', type=int, nargs='+', default=list(KS))
+    parser.add_argument('--buscas', type=int, default=3000)
+    parser.add_argument('--detalhes', type=int, default=200, help="perfis medidos com o detalhamento")
+    parser.add_argument('--insercoes', type=int, default=300)
+    parser.add_argument('--repeticoes-carga', type=int, default=20)
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--saida', default=ARQUIVO_RELATORIO)
+    parser.add_argument('--comparar', help="relatório anterior (JSON) para detectar regressões")
+    parser.add_argument('--tolerancia-latencia', type=float, default=TOLERANCIA_LATENCIA)
+    parser.add_argument('--tolerancia-qualidade', type=float, default=TOLERANCIA_QUALIDADE)
+    args = parser.parse_args()
+
+    relatorio = avaliar(args)
+    imprimir(relatorio)
+    with open(args.saida, 'w', encoding='utf-8') as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    print(f"Relatório salvo em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            anterior = json.load(f)
+        linhas = comparar(relatorio, anterior, args.tolerancia_latencia, args.tolerancia_qualidade)
+        print(f"Comparação com {args.comparar} (commit {anterior.get('commit')}):")
+        if anterior.get('parametros') != relatorio['parametros']:
+            print(f"   Aviso: parâmetros diferentes ({anterior.get('parametros')}); as métricas podem não ser comparáveis")
+        for nome, antes, valor, piorou in linhas:
+            print(f"   {nome:>40} {antes:>10.3f} -> {valor:>10.3f}{'   PIOROU' if piorou else ''}")
+        if any(piorou for *_, piorou in linhas): sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,68 +1,208 @@
-import joblib
-import pandas as pd
 import numpy as np
-import pylast
-from sklearn.neighbors import NearestNeighbors
-from scipy.sparse import csr_matrix
-from sklearn.feature_extraction.text import TfidfTransformer
+import csv
+import itertools
 import os
+import queue
+import threading
+from concurrent.futures import Future
+from modelo_incremental import ModeloTfidfIncremental, LIMIAR_DERIVA
+from pacote_modelo import carregar_indice_nomes, carregar_pacote, salvar_pacote, existe_pacote, caminho_diario
+from indice_nomes import IndiceNomes, normalizar
+from cliente_lastfm import buscar_tags, detalhar_albuns
+from cache_metadados import CacheMetadados
+from cache_recomendacoes import CacheRecomendacoes
+from caracteristicas import validar_pesos
+from telemetria import log, telemetria
 
 # ================= CONFIGURAÇÃO =================
 API_KEY = "API_KEY"
 API_SECRET = "API_SECRET"
+TIPO_INDICE = 'exato'  # 'exato' (força bruta), 'ivf' (aproximado, para catálogos grandes), 'fragmentado' (exato, um processo por núcleo)
+                       # ou 'compacto' (projeção int8, ~4x menos memória na varredura, aproximado)
+K_VIZINHOS = 0         # vizinhos pré-calculados por álbum (0 = desligado); recomendações sem varrer a matriz
 
 class Sistema:
-    def __init__(self):
-        self.network = None
-        self.knn = None
-        self.matriz_tfidf = None
-        self.lista_nomes = None
-        self.df_bruto = None
-        
-        self.inicializar_api()
+    def __init__(self, limiar_deriva=LIMIAR_DERIVA, tipo_indice=TIPO_INDICE, network=None, em_segundo_plano=False,
+                 k_vizinhos=K_VIZINHOS):
+        """
+        Com em_segundo_plano=True o construtor volta na hora e o modelo carrega numa thread:
+        'indice_pronto' marca quando a busca por nome já responde (índice de nomes + catálogo leve)
+        e 'pronto' quando o modelo inteiro está carregado. Recomendações esperam por 'pronto'.
+        """
+        self.network = network
+        self.tipo_indice = tipo_indice
+        self.k_vizinhos = k_vizinhos
+        self.modelo = ModeloTfidfIncremental(limiar_deriva, tipo_indice, k_vizinhos)
+        self.indice_nomes = IndiceNomes()
+        self.catalogo = None  # títulos/artistas do pacote para a busca antes do modelo ficar pronto
+        self.cache = CacheMetadados()
+        self.cache_recomendacoes = CacheRecomendacoes()  # invalidado sozinho quando 'self.instantaneo' muda
+        # O índice de nomes é alterado no lugar: buscas e inserções de nomes passam por esta trava
+        self.trava_nomes = threading.Lock()
+        self.indice_pronto = threading.Event()
+        self.pronto = threading.Event()
+
+        # 'self.modelo' só é alterado pela thread escritora; quem consulta usa 'self.instantaneo',
+        # uma visão imutável trocada por inteiro a cada lote de alterações (sem trava na leitura)
+        self.instantaneo = self.modelo.instantaneo()
+        self.fila_escrita = queue.Queue()
+        if em_segundo_plano:
+            threading.Thread(target=self._inicializar, name='carga-modelo', daemon=True).start()
+        else:
+            self._inicializar()
+
+    def _inicializar(self):
         self.carregar_dados()
+        if self.network is None: self.inicializar_api()  # 'network' permite injetar um Last.fm falso
+        self.instantaneo = self.modelo.instantaneo()
+        self.catalogo = None
+        self.pronto.set()
+        threading.Thread(target=self._laco_escritor, name='escritor-modelo', daemon=True).start()
+
+    def esperar_modelo(self, timeout=None):
+        """Bloqueia até o modelo inteiro estar carregado (imediato quando já está)."""
+        return self.pronto.wait(timeout)
+
+    # Atalhos para o instantâneo publicado (para várias leituras coerentes, guarde 'self.instantaneo' antes)
+    @property
+    def knn(self):
+        instantaneo = self.instantaneo
+        return instantaneo.indice if instantaneo.n_albuns else None
+
+    @property
+    def matriz_tfidf(self):
+        return self.instantaneo.matriz_tfidf
+
+    @property
+    def lista_nomes(self):
+        return self.instantaneo.nomes
 
     def inicializar_api(self):
         try:
-            self.network = pylast.LastFMNetwork(api_key=API_KEY, api_secret=API_SECRET)
-            print("[Backend] API Last.fm conectada.")
+            # Conexões reaproveitadas, novas tentativas e disjuntor (o pylast abre uma conexão por chamada)
+            from rede_lastfm import RedeHttp, RedeResiliente
+            self.network = RedeResiliente(RedeHttp(API_KEY))
+            log("[Backend] API Last.fm conectada.")
         except Exception as e:
-            print(f"[Backend] Erro API: {e}")
+            log(f"[Backend] Erro API: {e}")
 
+    @telemetria.cronometrar('carga_modelo')
     def carregar_dados(self):
-        print("[Backend] Carregando modelos .pkl...")
+        log("[Backend] Carregando modelo...")
         try:
-            if os.path.exists('modelo_knn.pkl'):
-                self.knn = joblib.load('modelo_knn.pkl')
-                self.matriz_tfidf = joblib.load('matriz_tfidf.pkl')
-                self.lista_nomes = joblib.load('lista_nomes.pkl')
-                self.df_bruto = joblib.load('dados_brutos.pkl')
-                print("[Backend] Dados carregados com sucesso.")
+            if existe_pacote():
+                # Primeiro o índice de nomes e o catálogo leve: a busca já responde enquanto a matriz carrega
+                indice_nomes, catalogo = carregar_indice_nomes()
+                if getattr(indice_nomes, 'albuns', None) is not None:  # ausente ou de antes dos ids: reconstruído abaixo
+                    with self.trava_nomes:
+                        self.indice_nomes, self.catalogo = indice_nomes, catalogo
+                    self.indice_pronto.set()
+                self.modelo, _ = carregar_pacote(limiar_deriva=self.modelo.limiar_deriva, tipo_indice=self.tipo_indice,
+                                                 com_indice_nomes=False, k_vizinhos=self.k_vizinhos)
+                if not self.indice_pronto.is_set():
+                    log("[Backend] Reconstruindo índice de nomes...")
+                    self.indice_nomes = IndiceNomes(self.modelo.nomes, self.modelo.ids)
+                log("[Backend] Dados carregados com sucesso.")
+            elif os.path.exists('matriz_tfidf.pkl'):
+                self._migrar_pickles()
             else:
                 raise FileNotFoundError("Arquivos não encontrados")
         except Exception as e:
-            print(f"[Backend] {e}. Iniciando modo limpo.")
-            self.df_bruto = pd.DataFrame(columns=['Album', 'Tag', 'Peso'])
-            self.lista_nomes = pd.Index([])
-            self.matriz_tfidf = None
-            self.knn = None
+            log(f"[Backend] {e}. Iniciando modo limpo.")
+            self.modelo = ModeloTfidfIncremental(self.modelo.limiar_deriva, self.tipo_indice, self.k_vizinhos)
+            with self.trava_nomes:
+                self.indice_nomes, self.catalogo = IndiceNomes(), None
 
-    def buscar_candidatos(self, nome_busca):
-        if self.lista_nomes is not None:
-            # Busca no Cache
-            match_exact = [n for n in self.lista_nomes if nome_busca.lower() == n.lower()]
-            if match_exact: return 'CACHE_HIT', match_exact[0]
+        self._reaplicar_diario()
+        self.indice_pronto.set()
 
-            match_partial = [n for n in self.lista_nomes if nome_busca.lower() in n.lower()]
-            if match_partial: return 'CACHE_HIT', match_partial[0]
+    def _migrar_pickles(self): # Converte os .pkl antigos (treinar.py de versões anteriores) para o pacote do modelo
+        import joblib
+        log("[Backend] Convertendo modelos .pkl para o novo formato...")
+        matriz_tfidf = joblib.load('matriz_tfidf.pkl')
+        lista_nomes = joblib.load('lista_nomes.pkl')
+        # As colunas do pivot são as tags ordenadas
+        lista_tags = sorted(joblib.load('dados_brutos.pkl')['Tag'].unique())
+        self.modelo = ModeloTfidfIncremental.de_matriz(matriz_tfidf, lista_nomes, lista_tags,
+                                                       self.modelo.limiar_deriva, self.tipo_indice,
+                                                       k_vizinhos=self.k_vizinhos)
+        self.indice_nomes = IndiceNomes(self.modelo.nomes, self.modelo.ids)
+        salvar_pacote(self.modelo, self.indice_nomes)
+        log("[Backend] Dados carregados com sucesso.")
+
+    def _reaplicar_diario(self): # Reaplica os álbuns salvos no diário desde o último salvamento completo
+        diario_path = caminho_diario()
+        if diario_path is None or not os.path.exists(diario_path): return
+        # Queda no meio de uma escrita deixa a última linha cortada: ela sai do arquivo (como no
+        # checkpoint da ingestão), senão o próximo álbum seria gravado colado nela
+        with open(diario_path, 'rb+') as f:
+            conteudo = f.read()
+            if conteudo and not conteudo.endswith(b'\n'):
+                f.truncate(conteudo.rfind(b'\n') + 1)
+
+        ruins = []
+        def linhas_validas(leitor):
+            for l in leitor:
+                if not l: continue
+                try:
+                    # Diários antigos não têm a coluna do artista: fica vazia
+                    yield l[0], l[1], float(l[2]), l[3] if len(l) > 3 else ''
+                except (IndexError, ValueError):
+                    ruins.append(leitor.line_num)
+
+        n_albuns = 0
+        with open(diario_path, newline='', encoding='utf-8') as f:
+            # Cada inserção é um bloco contíguo de linhas do mesmo álbum, aplicado assim que é lido
+            for (album, artista), grupo in itertools.groupby(linhas_validas(csv.reader(f)), key=lambda l: (l[0], l[3])):
+                try:
+                    self.modelo.adicionar_album(album, [(tag, peso) for _, tag, peso, _ in grupo], artista)
+                    with self.trava_nomes:
+                        self.indice_nomes.adicionar(album, self.modelo.id_album(album, artista))
+                except Exception as e:
+                    log(f"[Backend] Álbum do diário ignorado ({album}): {e}")
+                    continue
+                n_albuns += 1
+        if ruins: log(f"[Backend] Diário: {len(ruins)} linha(s) inválida(s) ignorada(s) (linhas {ruins[:5]}).")
+        log(f"[Backend] {n_albuns} álbuns recuperados do diário.")
+
+    def _buscar_no_indice(self, nome_busca):
+        with telemetria.span('busca.indice'), self.trava_nomes:
+            encontrados = self.indice_nomes.buscar(nome_busca, limite=1)
+            return (self.indice_nomes.albuns_de(encontrados[0]) if encontrados else []), self.catalogo
+
+    @telemetria.cronometrar('busca')
+    def buscar_candidatos(self, nome_busca):
+        # Busca no Cache (exato > prefixo > substring > nome parecido)
+        self.indice_pronto.wait()
+        ids, catalogo = self._buscar_no_indice(nome_busca)
+        if not ids and not self.pronto.is_set():
+            # O álbum pode estar no diário, que ainda está sendo reaplicado: só depois dele é "não está no cache"
+            self.pronto.wait()
+            ids, catalogo = self._buscar_no_indice(nome_busca)
+        # Título de um álbum só: acerto direto; de vários artistas: o usuário escolhe entre os do cache
+        albuns = None
+        if catalogo is not None and not self.pronto.is_set():
+            # Modelo ainda carregando: título/artista saem do catálogo do pacote
+            albuns = [catalogo.album(int(i)) for i in ids]
+            if None in albuns: albuns = None  # álbum do diário: só o modelo completo conhece
+        if albuns is None:
+            self.pronto.wait()
+            instantaneo = self.instantaneo
+            linhas = [instantaneo.linha_do_id(i) for i in ids]
+            albuns = [self._album(instantaneo, linha) for linha in linhas if linha is not None]
+        if len(albuns) == 1: return 'CACHE_HIT', albuns[0]
+        if albuns: return 'CACHE_OPTIONS', albuns
 
         # Busca na API
-        print(f"[Backend] Buscando '{nome_busca}' na API...")
+        log(f"[Backend] Buscando '{nome_busca}' na API...")
+        self.pronto.wait()  # a conexão com o Last.fm é aberta junto com a carga do modelo
         try:
             if not self.network: return 'ERROR', "API Offline"
             
-            search = self.network.search_for_album(nome_busca)
-            resultados = search.get_next_page()
+            telemetria.contar('api.chamadas')
+            with telemetria.span('api.busca'):
+                search = self.network.search_for_album(nome_busca)
+                resultados = search.get_next_page()
             
             if not resultados: return 'NOT_FOUND', None
             
@@ -80,141 +220,301 @@ class Sistema:
         except Exception as e:
             return 'ERROR', str(e)
 
+    def resolver_album(self, titulo, artista='', usar_api=True):
+        """
+        Álbum ({'id', 'titulo', 'artista'}) de uma entrada de lista importada, sem perguntar ao usuário:
+        primeiro o modelo (mesmo título normalizado e, se informado, mesmo artista), depois o Last.fm
+        (o álbum do artista, se o album.getInfo o achar, ou o primeiro resultado da busca pelo título),
+        que o adiciona ao modelo. None se não achar ou se o álbum não tiver tags.
+        """
+        self.pronto.wait()
+        instantaneo = self.instantaneo
+        with self.trava_nomes:
+            ids = self.indice_nomes.albuns_de(titulo)
+        linhas = [instantaneo.linha_do_id(int(i)) for i in ids]
+        albuns = [self._album(instantaneo, linha) for linha in linhas if linha is not None]
+        if artista: albuns = [a for a in albuns if normalizar(a['artista']) == normalizar(artista)]
+        if albuns: return albuns[0]
+        if not usar_api or not self.network: return None
+
+        telemetria.contar('api.chamadas')
+        try:
+            if artista:
+                objeto = self.network.get_album(artista, titulo)
+                # get_album não consulta a API: sem o album.getInfo (que já traz a capa), um título com erro
+                # de digitação entraria no modelo com as tags do artista. Álbum inexistente = erro 6 da API
+                objeto.get_cover_image(size=3)
+            else:
+                with telemetria.span('api.busca'):
+                    resultados = self.network.search_for_album(titulo).get_next_page()
+                if not resultados: return None
+                objeto = resultados[0]
+                titulo, artista = objeto.title, objeto.artist.name
+        except Exception as e:
+            log(f"[Backend] Erro ao buscar '{titulo}': {e}")
+            return None
+        return self.processar_escolha_usuario(objeto, titulo, artista)
+
+    @telemetria.cronometrar('adicionar')
     def processar_escolha_usuario(self, candidato_obj, titulo_real, artista_real): # Atualiza o sistema com o álbum escolhido pelo usuário. Busca as tags do album e caso nao existam, busca as do artista.
-        print(f"[Backend] Analisando tags: {titulo_real}...")
+        """Retorna o álbum adicionado ({'id', 'titulo', 'artista'}) ou None se não houver tags."""
+        log(f"[Backend] Analisando tags: {titulo_real}...")
         try:
-            # busca direta para garantir metadados frescos
-            album_final = self.network.get_album(artista_real, titulo_real)
-            top_tags = album_final.get_top_tags(limit=3)
-            
-            if not top_tags:
-                print("[Backend] Sem tags no álbum. Tentando artista...")
-                artist_obj = self.network.get_artist(artista_real)
-                top_tags = artist_obj.get_top_tags(limit=3)
+            # Tags do álbum (ou do artista), vindas do cache de metadados quando ainda válidas
+            top_tags = buscar_tags(self.network, artista_real, titulo_real, limite=3, cache=self.cache)
             
             if not top_tags:
-                print("[Backend] Falha: Sem tags disponíveis.")
-                return False
+                log("[Backend] Falha: Sem tags disponíveis.")
+                return None
 
-            max_weight = int(top_tags[0].weight)
+            max_weight = int(top_tags[0][1])
             if max_weight == 0: max_weight = 1
             novos_dados = []
             
-            for tag_item in top_tags:
+            for nome_tag, peso in top_tags:
                 novos_dados.append({
                     'Album': titulo_real,
-                    'Tag': tag_item.item.get_name().title(),
-                    'Peso': int(tag_item.weight) / max_weight
+                    'Tag': nome_tag.title(),
+                    'Peso': int(peso) / max_weight
                 })
+
+            # O resultado da busca já traz a capa: fica no cache para a recomendação deste álbum
+            if candidato_obj is not None:
+                try:
+                    self.cache.salvar(artista_real, titulo_real, 'capa', candidato_obj.get_cover_image(size=3))
+                except Exception: pass
             
-            novo_df = pd.DataFrame(novos_dados)
-            self.df_bruto = pd.concat([self.df_bruto, novo_df], ignore_index=True)
-            self.retreinar_sistema()
-            return True
+            id_album = self.adicionar_album(titulo_real, novos_dados, artista=artista_real)
+            return {'id': id_album, 'titulo': titulo_real, 'artista': artista_real}
 
         except Exception as e:
-            print(f"[Backend] Erro ao processar: {e}")
-            return False
+            log(f"[Backend] Erro ao processar: {e}")
+            return None
 
-    def retreinar_sistema(self): #Recalcula as matrizes com base no df_bruto atualizado e salva no disco.
+    def adicionar_album(self, titulo, novos_dados, esperar=True, artista=''): # Enfileira o álbum para a thread escritora
+        """
+        Insere o álbum (artista, título) no modelo sem re-treinar tudo (só reconstrói se o IDF derivou demais).
+        Com esperar=True retorna o id do álbum quando ele já está visível nas recomendações; senão um Future do id.
+        """
+        pronto = Future()
+        linhas = [(d['Album'], d['Tag'], d['Peso'], artista) for d in novos_dados]
+        self.fila_escrita.put((titulo, artista, linhas, pronto))
+        return pronto.result() if esperar else pronto
 
-        print("[Backend] Re-treinando inteligência com novos dados...")
-        try:
-            # Refaz a matriz pivô
-            matriz_albuns = self.df_bruto.pivot_table(index='Album', columns='Tag', values='Peso').fillna(0)
+    def retreinar_sistema(self): # Recalcula o IDF de toda a matriz e salva no disco (pela thread escritora)
+        pronto = Future()
+        self.fila_escrita.put((None, None, None, pronto))
+        return pronto.result()
 
-            # Prepara para o KNN
-            matriz_esparsa = csr_matrix(matriz_albuns.values)
-            transformer = TfidfTransformer()
-            matriz_tfidf_nova = transformer.fit_transform(matriz_esparsa)
-            
-            # Treina KNN
-            knn_novo = NearestNeighbors(metric='cosine', algorithm='brute')
-            knn_novo.fit(matriz_tfidf_nova)
-            
-            # Atualiza variáveis em memória
-            self.knn = knn_novo
-            self.matriz_tfidf = matriz_tfidf_nova
-            self.lista_nomes = matriz_albuns.index
-            
-            # Persiste no disco
-            joblib.dump(self.df_bruto, 'dados_brutos.pkl')
-            joblib.dump(self.knn, 'modelo_knn.pkl')
-            joblib.dump(self.matriz_tfidf, 'matriz_tfidf.pkl')
-            joblib.dump(self.lista_nomes, 'lista_nomes.pkl')
-            print("[Backend] Sistema salvo!")
-        except Exception as e:
-            print(f"[Backend] Erro treino: {e}")
+    def _laco_escritor(self):
+        while True:
+            # Junta no mesmo lote tudo o que chegou enquanto o lote anterior era aplicado:
+            # uma rajada de álbuns vira no máximo uma reconstrução e uma publicação
+            lote = [self.fila_escrita.get()]
+            while True:
+                try:
+                    lote.append(self.fila_escrita.get_nowait())
+                except queue.Empty:
+                    break
+            telemetria.contar('escrita.albuns', len(lote))
+            try:
+                ids = self._aplicar_lote(lote)
+            except Exception as e:
+                log(f"[Backend] Erro ao atualizar modelo: {e}")
+                for *_, pronto in lote: pronto.set_exception(e)
+                continue
+            for (*_, pronto), id_album in zip(lote, ids): pronto.set_result(id_album)
+
+    @telemetria.cronometrar('escrita.lote')
+    def _aplicar_lote(self, lote):
+        novas_linhas = []
+        ids = []
+        precisa_reconstruir = False
+        for titulo, artista, linhas, _ in lote:
+            if titulo is None:
+                precisa_reconstruir = True  # pedido explícito de retreinar_sistema()
+                ids.append(None)
+                continue
+            precisa_reconstruir |= self.modelo.adicionar_album(titulo, [(tag, peso) for _, tag, peso, _ in linhas],
+                                                               artista)
+            ids.append(self.modelo.id_album(titulo, artista))
+            with self.trava_nomes:
+                self.indice_nomes.adicionar(titulo, ids[-1])
+            novas_linhas.extend(linhas)
+
+        diario_path = caminho_diario()
+        if precisa_reconstruir or diario_path is None:
+            self._reconstruir_e_salvar()
+        else:
+            # Persistência barata: só anexa os álbuns ao diário da versão atual do modelo
+            with open(diario_path, 'a', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerows(novas_linhas)
+                f.flush()
+                os.fsync(f.fileno())  # o lote só é confirmado (pronto.set_result) depois de estar no disco
+            log(f"[Backend] {len(lote)} álbum(ns) adicionado(s) (deriva IDF: {self.modelo.deriva():.3f}).")
+        self.instantaneo = self.modelo.instantaneo()  # publicação atômica (troca de referência)
+        return ids
+
+    @telemetria.cronometrar('retreino')
+    def _reconstruir_e_salvar(self):
+        log("[Backend] Re-treinando inteligência com novos dados...")
+        self.modelo.reconstruir()
+
+        # Persiste no disco (versão nova completa, publicada de forma atômica, com diário vazio)
+        with self.trava_nomes:
+            versao = salvar_pacote(self.modelo, self.indice_nomes)
+        log(f"[Backend] Sistema salvo! ({versao})")
+
+    @staticmethod
+    def _album(instantaneo, linha):
+        return {'id': instantaneo.ids[linha], 'titulo': instantaneo.nomes[linha], 'artista': instantaneo.artistas[linha]}
+
+    def _linhas(self, instantaneo, albuns):
+        """
+        Linhas dos álbuns pedidos no instantâneo. Cada álbum pode ser o id, um dict com 'id' ou com
+        'titulo'/'artista', ou só o título (todos os álbuns com esse título, de qualquer artista).
+        """
+        linhas = []
+        for album in albuns:
+            if isinstance(album, dict) and album.get('id') is None:
+                linhas.append(instantaneo.linha(album['titulo'], album.get('artista', '')))
+                continue
+            if isinstance(album, dict):
+                ids = [album['id']]
+            elif isinstance(album, str):
+                with self.trava_nomes:
+                    ids = self.indice_nomes.albuns_de(album)
+            else:
+                ids = [album]
+            linhas.extend(instantaneo.linha_do_id(int(i)) for i in ids)
+        return list(dict.fromkeys(linha for linha in linhas if linha is not None))
+
+    @staticmethod
+    def _chave_perfil(linhas, pesos):
+        # Mesmo perfil = mesmas linhas (a ordem e a forma de citar os álbuns não mudam o centróide) e mesmos pesos
+        return tuple(sorted(linhas)), tuple(validar_pesos(pesos).values()) if pesos else None
+
+    def recomendar(self, albuns_selecionados, qtd=4, pesos=None):
+        """
+        Parte KNN da recomendação: retorna [{'id', 'album', 'artist', 'score'}] sem consultar a API.
+        'pesos' ({bloco: peso}, ex: {'descritores': 2.0, 'notas': 0}) muda a importância de cada bloco
+        de características só nesta consulta. Resultados ficam no cache_recomendacoes até o modelo mudar.
+        """
+        self.pronto.wait()
+        instantaneo = self.instantaneo  # todas as leituras abaixo vêm da mesma versão do modelo
+        if instantaneo.n_albuns == 0: return []
+
+        # Lógica KNN Padrão
+        # pega vetores dos álbuns selecionados
+        indices = self._linhas(instantaneo, albuns_selecionados)
+        if not indices: return []
+        return self._recomendar_linhas(instantaneo, indices, qtd, pesos)
+
+    def _recomendar_linhas(self, instantaneo, indices, qtd, pesos):
+        return self.cache_recomendacoes.obter(instantaneo, ('knn',) + self._chave_perfil(indices, pesos), qtd,
+                                              lambda n: self._calcular_recomendacoes(instantaneo, indices, n, pesos))
+
+    def _calcular_recomendacoes(self, instantaneo, indices, qtd, pesos):
+        pesos_colunas = instantaneo.pesos_colunas(pesos)
+        if pesos_colunas is None and instantaneo.vizinhos is not None:
+            # Junta os vizinhos pré-calculados dos álbuns do perfil (a tabela não conhece pesos por bloco)
+            with telemetria.span('knn.tabela'):
+                resultado = instantaneo.vizinhos.recomendar(instantaneo.matriz_tfidf, indices, qtd, instantaneo.mortas)
+            if resultado is not None:
+                return [dict(instantaneo.album(idx), score=score * 100) for idx, score in zip(*resultado)]
+
+        vetores = instantaneo.matriz_tfidf[indices]
 
-    def gerar_recomendacoes_com_detalhes(self, albuns_selecionados, qtd=4):
+        # calcula Centróide (Vetor do perfil de gosto do usuário)
+        user_vector = np.asarray(vetores.mean(axis=0))
+        if pesos_colunas is not None: user_vector = user_vector * pesos_colunas
+
+        # Busca mais vizinhos para garantir que teremos 'qtd' únicos após filtrar os inputs e as linhas mortas
+        num_vizinhos = qtd + len(indices) + len(instantaneo.mortas) + 5
+        with telemetria.span('knn'):
+            distancias, result_indices = instantaneo.indice.kneighbors(user_vector, n_neighbors=num_vizinhos)
+        
+        # Recomendações brutas (o artista vem do modelo; a capa fica para o detalhamento)
+        raw_recs = []
+        result_indices = result_indices.flatten()
+        distancias = distancias.flatten()
+        selecionados = set(indices)
+        
+        for i, idx in enumerate(result_indices):
+            if idx in instantaneo.mortas: continue  # versão antiga de um álbum re-adicionado
+            if idx not in selecionados:
+                score = (1 - distancias[i]) * 100
+                raw_recs.append(dict(instantaneo.album(idx), score=score))
+                if len(raw_recs) >= qtd: break
+        return raw_recs
+
+    def recomendar_lote(self, perfis, qtd=4, detalhar=False, pesos=None):
+        """
+        'recomendar' para muitos perfis de uma vez (ex: recomendações pré-calculadas para todos os usuários).
+        Retorna uma lista [{'id', 'album', 'artist', 'score'}] por perfil, na ordem de 'perfis'.
+        Usa sempre a busca exata.
+        Com detalhar=True os itens ganham a capa, como em gerar_recomendacoes_com_detalhes.
+        """
+        self.pronto.wait()
+        instantaneo = self.instantaneo
+        if instantaneo.n_albuns == 0: return [[] for _ in perfis]
+
+        with telemetria.span('knn.lote'):
+            linhas, sims = instantaneo.recomendar_lote([self._linhas(instantaneo, albuns) for albuns in perfis], qtd,
+                                                       pesos)
+        resultados = [[dict(instantaneo.album(idx), score=score * 100)
+                       for idx, score in zip(linhas_p, sims_p) if score > -np.inf]
+                      for linhas_p, sims_p in zip(linhas, sims)]
+        if not detalhar: return resultados
+
+        # Cada álbum é detalhado uma vez só, mesmo que apareça em vários perfis
+        unicos = list({rec['id']: rec for recs in resultados for rec in recs}.values())
+        por_id = {d['id']: d for d in detalhar_albuns(self.network, unicos, cache=self.cache)}
+        return [[dict(por_id[rec['id']], score=rec['score']) for rec in recs] for recs in resultados]
+
+    @telemetria.cronometrar('recomendacao')
+    def gerar_recomendacoes_com_detalhes(self, albuns_selecionados, qtd=4, ao_detalhar=None, pesos=None):
         """
-        Gera recomendações e busca capa/artista na API para cada recomendação.
+        Gera recomendações e busca a capa na API para cada recomendação.
+        As buscas na API rodam em paralelo; 'ao_detalhar(posicao, item)' recebe cada álbum assim que fica pronto.
+        A lista detalhada também fica no cache_recomendacoes: o mesmo perfil não volta à API até o modelo mudar.
+        Listas com álbuns que ficaram sem detalhes (erro ou timeout da API) não são guardadas: o próximo
+        pedido tenta a API de novo em vez de repetir a falha.
         """
-        if self.knn is None: return []
+        self.pronto.wait()
+        instantaneo = self.instantaneo
+        if instantaneo.n_albuns == 0: return []
 
         # Limite de segurança para não travar a UI com muitas requisições
         if qtd > 20: qtd = 20
         
-        print(f"[Backend] Calculando {qtd} recomendações para: {albuns_selecionados}...")
+        log(f"[Backend] Calculando {qtd} recomendações para: {albuns_selecionados}...")
         
         try:
-            # Lógica KNN Padrão
-            # pega vetores dos álbuns selecionados
-            indices = [self.lista_nomes.get_loc(a) for a in albuns_selecionados if a in self.lista_nomes]
+            indices = self._linhas(instantaneo, albuns_selecionados)
             if not indices: return []
+            detalhados_aqui = []
+            falhas = []
 
-            vetores = self.matriz_tfidf[indices]
+            def detalhar(n):
+                raw_recs = self._recomendar_linhas(instantaneo, indices, n, pesos)
+                if not raw_recs: return []
+                detalhados_aqui.append(True)
+                # Busca a capa de cada album recomendado na API (o artista já vem do modelo)
+                log("[Backend] Buscando capas dos recomendados...")
+                with telemetria.span('detalhamento'):
+                    final_recs = detalhar_albuns(self.network, raw_recs, ao_detalhar, cache=self.cache,
+                                                 ao_falhar=falhas.append)
+                log(f"[Backend] Cache de metadados: {self.cache.estatisticas()}")
+                return final_recs
 
-            # calcula Centróide (Vetor do perfil de gosto do usuário)
-            user_vector = np.asarray(vetores.mean(axis=0))
-
-            # Busca mais vizinhos para garantir que teremos 'qtd' únicos após filtrar os inputs
-            num_vizinhos = qtd + len(indices) + 5
-            distancias, result_indices = self.knn.kneighbors(user_vector, n_neighbors=num_vizinhos)
-            
-            # Recomendações brutas (sem detalhes como artista/capa)
-            raw_recs = []
-            result_indices = result_indices.flatten()
-            distancias = distancias.flatten()
-            
-            for i, idx in enumerate(result_indices):
-                nome = self.lista_nomes[idx]
-                if nome not in albuns_selecionados:
-                    score = (1 - distancias[i]) * 100
-                    raw_recs.append((nome, score))
-                    if len(raw_recs) >= qtd: break
-            
-            # Busca artista e capa de cada album recomendado na API
-            print("[Backend] Buscando capas e artistas dos recomendados...")
-            final_recs = []
-            
-            for nome_album, score in raw_recs:
-                try:
-                    # Busca direta para pegar metadados frescos
-                    res = self.network.search_for_album(nome_album)
-                    page = res.get_next_page()
-                    
-                    if page:
-                        best_match = page[0] # Pega o primeiro resultado
-                        artist_name = best_match.artist.name
-                        image_url = best_match.get_cover_image(size=3) 
-                    else:
-                        artist_name = "Desconhecido"
-                        image_url = None
-                        
-                    final_recs.append({
-                        'album': nome_album,
-                        'artist': artist_name,
-                        'image_url': image_url,
-                        'score': score
-                    })
-                except Exception as e:
-                    print(f"[Backend] Erro ao detalhar {nome_album}: {e}")
-                    # Caso nao encontrar as informações, adiciona mesmo sem detalhes para não perder a recomendação
-                    final_recs.append({'album': nome_album, 'artist': '?', 'image_url': None, 'score': score})
-            
+            # qtd_minima=0: detalhar é caro por álbum, então só as 'qtd' pedidas (o top-k maior fica no 'knn')
+            final_recs = self.cache_recomendacoes.obter(instantaneo, ('detalhes',) + self._chave_perfil(indices, pesos),
+                                                        qtd, detalhar, qtd_minima=0, guardar=lambda: not falhas)
+            if ao_detalhar and not detalhados_aqui:
+                for posicao, item in enumerate(final_recs): ao_detalhar(posicao, item)
             return final_recs
 
         except Exception as e:
-            print(f"[Backend] Erro recomendação: {e}")
-            return []
\ No newline at end of file
+            log(f"[Backend] Erro recomendação: {e}")
+            return []
@@ -0,0 +1,1153 @@
+"""
+Benchmarks do KNAlbuns (não acessam a API: usam dados sintéticos ou locais).
+
+Uso:
+    python benchmark.py insercao
+    python benchmark.py busca
+    python benchmark.py enriquecimento
+    python benchmark.py carga
+    python benchmark.py ann
+    python benchmark.py compacto
+    python benchmark.py lote
+    python benchmark.py fragmentos
+    python benchmark.py vizinhos
+    python benchmark.py caracteristicas
+    python benchmark.py telemetria
+    python benchmark.py inicializacao
+    python benchmark.py capas
+    python benchmark.py servidor
+    python benchmark.py concorrencia
+    python benchmark.py repetidas
+    python benchmark.py resiliencia
+    python benchmark.py memoria
+    python benchmark.py fluxo
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+
+import joblib
+import pandas as pd
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+
+from cache_capas import BaixadorCapas, CacheCapas
+from cliente_lastfm import LimitadorTaxa, detalhar_album, detalhar_albuns
+from indice_nomes import IndiceNomes
+from indices_vizinhos import IndiceCosseno, IndiceFragmentado, IndiceIVF, TabelaVizinhos
+from lastfm_falso import LastFmFalso
+from pacote_modelo import carregar_pacote, salvar_pacote
+from modelo_incremental import ModeloTfidfIncremental
+
+
+def gerar_catalogo_sintetico(n_albuns, n_tags=2000, tags_por_album=3, semente=0, temas=0):
+    """
+    Matriz TF-IDF sintética com popularidade de tags em Zipf (como tags reais do Last.fm).
+    Com 'temas' > 0 cada álbum tem um tema (um gênero) com a sua própria ordem de popularidade das tags:
+    tags que aparecem juntas, como no catálogo real. Sem temas, as tags de um álbum são independentes.
+    """
+    rng = np.random.default_rng(semente)
+    popularidade = 1.0 / np.arange(1, n_tags + 1)
+    popularidade /= popularidade.sum()
+
+    indices = rng.choice(n_tags, size=(n_albuns, tags_por_album), p=popularidade)
+    if temas:
+        ordens = np.stack([rng.permutation(n_tags) for _ in range(temas)])
+        indices = ordens[rng.integers(0, temas, n_albuns)[:, None], indices]
+    indices.sort(axis=1)
+    data = rng.random((n_albuns, tags_por_album)) + 0.1
+    indptr = np.arange(0, n_albuns * tags_por_album + 1, tags_por_album)
+    matriz = csr_matrix((data.ravel(), indices.ravel(), indptr), shape=(n_albuns, n_tags))
+    matriz.sum_duplicates()
+
+    nomes = [f"Album {i}" for i in range(n_albuns)]
+    tags = [f"Tag {j}" for j in range(n_tags)]
+    return normalize(matriz), nomes, tags, popularidade
+
+
+def percentis_ms(tempos):
+    tempos = np.asarray(tempos) * 1000
+    return np.percentile(tempos, 50), np.percentile(tempos, 99)
+
+
+def bench_insercao(args):
+    print(f"{'álbuns':>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'reconstruções':>14} {'t. reconstr. (ms)':>18}")
+    for n_albuns in args.tamanhos:
+        matriz, nomes, tags, popularidade = gerar_catalogo_sintetico(n_albuns)
+        modelo = ModeloTfidfIncremental.de_matriz(matriz, nomes, tags, args.limiar)
+        rng = np.random.default_rng(1)
+
+        tempos, tempos_reconstrucao = [], []
+        for i in range(args.insercoes):
+            escolhidas = rng.choice(len(tags), size=3, replace=False, p=popularidade)
+            tags_pesos = [(tags[j], rng.random() + 0.1) for j in escolhidas]
+            if i % 50 == 0: tags_pesos.append((f"Tag Nova {i}", 1.0))  # vocabulário novo de vez em quando
+
+            inicio = time.perf_counter()
+            precisa_reconstruir = modelo.adicionar_album(f"Novo {i}", tags_pesos)
+            tempos.append(time.perf_counter() - inicio)
+
+            if precisa_reconstruir:
+                inicio = time.perf_counter()
+                modelo.reconstruir()
+                tempos_reconstrucao.append(time.perf_counter() - inicio)
+
+        p50, p99 = percentis_ms(tempos)
+        media_reconstr = np.mean(tempos_reconstrucao) * 1000 if tempos_reconstrucao else 0.0
+        print(f"{n_albuns:>10} {p50:>10.3f} {p99:>10.3f} {len(tempos_reconstrucao):>14} {media_reconstr:>18.1f}")
+
+
+def gerar_titulos_sinteticos(n_titulos, semente=0):
+    rng = np.random.default_rng(semente)
+    silabas = ['ka', 'lo', 'mi', 'ra', 'ton', 'vel', 'dor', 'sun', 'ne', 'gro', 'sha', 'li', 'ber', 'qua', 'zi']
+    palavras = [''.join(silabas[j] for j in rng.integers(0, len(silabas), size=rng.integers(2, 5))).title()
+                for _ in range(20_000)]
+    escolhas = rng.integers(0, len(palavras), size=(n_titulos, 4))
+    tamanhos = rng.integers(1, 5, size=n_titulos)
+    return [' '.join(palavras[j] for j in escolhas[i, :tamanhos[i]]) + f" {i}" for i in range(n_titulos)]
+
+
+def bench_busca(args):
+    titulos = gerar_titulos_sinteticos(args.titulos)
+    inicio = time.perf_counter()
+    indice = IndiceNomes(titulos)
+    print(f"Índice com {len(indice)} títulos construído em {time.perf_counter() - inicio:.1f}s")
+
+    rng = np.random.default_rng(2)
+    amostra = [titulos[i] for i in rng.integers(0, len(titulos), size=args.consultas)]
+    consultas = {
+        'exata': [t.upper() for t in amostra],
+        'prefixo': [t[:max(3, len(t) // 2)] for t in amostra],
+        'substring': [t[t.find(' ') + 1:] if ' ' in t else t for t in amostra],  # sem a primeira palavra
+        'fuzzy': [t[:3] + t[4:] for t in amostra],  # uma letra a menos
+    }
+    print(f"{'tipo':>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'acertos':>8}")
+    for tipo, lista in consultas.items():
+        tempos, acertos = [], 0
+        for consulta, original in zip(lista, amostra):
+            inicio = time.perf_counter()
+            resultado = indice.buscar(consulta, limite=5)
+            tempos.append(time.perf_counter() - inicio)
+            acertos += original in resultado
+        p50, p99 = percentis_ms(tempos)
+        print(f"{tipo:>10} {p50:>10.3f} {p99:>10.3f} {acertos / len(lista):>8.0%}")
+
+
+def bench_enriquecimento(args):
+    rede = LastFmFalso(latencia=args.latencia)
+    raw_recs = [{'id': i, 'album': f"Album {i}", 'artist': f"Artista {i}", 'score': 90.0 - i}
+                for i in range(args.recomendacoes)]
+    sem_limite = LimitadorTaxa(taxa=1e6, capacidade=1e6)
+
+    inicio = time.perf_counter()
+    for rec in raw_recs:
+        detalhar_album(rede, rec, sem_limite)
+    serial = time.perf_counter() - inicio
+
+    prontos = []
+    inicio = time.perf_counter()
+    resultado = detalhar_albuns(rede, raw_recs, lambda i, item: prontos.append(time.perf_counter() - inicio))
+    paralelo = time.perf_counter() - inicio
+
+    print(f"{len(raw_recs)} álbuns, latência simulada de {args.latencia * 1000:.0f} ms por requisição")
+    print(f"  serial:   {serial:.2f}s")
+    detalhados = sum(r['artist'] != '?' for r in resultado)
+    print(f"  paralelo: {paralelo:.2f}s (primeiro pronto em {prontos[0]:.2f}s, {detalhados}/{len(resultado)} detalhados)")
+    assert detalhados == len(resultado) == len(prontos), f"só {detalhados}/{len(resultado)} álbuns detalhados"
+    assert paralelo < serial / 2, f"paralelo ({paralelo:.2f}s) não foi mais rápido que o serial ({serial:.2f}s)"
+
+
+def servidor_capas_local(n_capas, latencia, lado=600):
+    """Servidor HTTP local com capas JPEG sintéticas e latência artificial. Retorna (servidor, urls)."""
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from io import BytesIO
+    from PIL import Image
+
+    capas = []
+    for i in range(n_capas):
+        buffer = BytesIO()
+        Image.effect_noise((lado, lado), 30 + i % 50).convert('RGB').save(buffer, 'JPEG', quality=90)
+        capas.append(buffer.getvalue())
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latencia)
+            corpo = capas[int(self.path.strip('/').split('.')[0])]
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args): pass
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    urls = [f"http://127.0.0.1:{servidor.server_port}/{i}.jpg" for i in range(n_capas)]
+    return servidor, urls
+
+
+def bench_capas(args):
+    import requests
+    from concurrent.futures import wait
+    from io import BytesIO
+    from PIL import Image
+
+    servidor, urls = servidor_capas_local(args.capas, args.latencia, args.lado)
+    print(f"{args.capas} capas {args.lado}px, latência simulada de {args.latencia * 1000:.0f} ms")
+
+    # Como a interface fazia: uma Session, uma capa por vez, decodificação completa
+    sessao = requests.Session()
+    inicio = time.perf_counter()
+    for url in urls:
+        Image.open(BytesIO(sessao.get(url, timeout=10).content)).resize((160, 160))
+    print(f"  serial:                   {time.perf_counter() - inicio:.2f}s")
+
+    with tempfile.TemporaryDirectory() as pasta:
+        baixador = BaixadorCapas(CacheCapas(pasta))
+        for rotulo in ('paralelo (cache frio)', 'paralelo (cache quente)'):
+            primeira = []
+            inicio = time.perf_counter()
+            futuros = [baixador.agendar(url, lambda img: primeira.append(time.perf_counter() - inicio)) for url in urls]
+            wait(futuros)
+            print(f"  {rotulo + ':':<25} {time.perf_counter() - inicio:.2f}s (primeira capa em {min(primeira):.3f}s)")
+    servidor.shutdown()
+
+
+def bench_servidor(args):
+    import json
+    import random
+    import threading
+    import requests
+    from backend_logic import Sistema
+    from cache_recomendacoes import CacheRecomendacoes
+    from servidor import iniciar_servidor
+
+    pasta_original = os.getcwd()
+    with tempfile.TemporaryDirectory() as pasta:
+        # O Sistema lê/grava modelo/ e metadados.db no diretório atual
+        os.chdir(pasta)
+        try:
+            matriz, nomes, tags, _ = gerar_catalogo_sintetico(args.albuns)
+            modelo = ModeloTfidfIncremental.de_matriz(matriz, nomes, tags)
+            salvar_pacote(modelo, IndiceNomes(modelo.nomes, modelo.ids))
+            sistema = Sistema(network=LastFmFalso(latencia=args.latencia))
+            sistema.cache_recomendacoes = CacheRecomendacoes(capacidade=0, qtd_minima=0)  # mede o cálculo, não o cache
+            servidor = iniciar_servidor(sistema, porta=0)
+            threading.Thread(target=servidor.serve_forever, daemon=True).start()
+            base = f"http://127.0.0.1:{servidor.server_port}"
+
+            tempos = {}
+            lock = threading.Lock()
+
+            def cliente(semente):
+                rng = random.Random(semente)
+                sessao = requests.Session()
+                for i in range(args.requisicoes):
+                    sorteio = rng.random()
+                    inicio = time.perf_counter()
+                    if sorteio < args.frac_adicionar:
+                        rota = 'POST /albuns'
+                        sessao.post(f"{base}/albuns", json={'titulo': f"Novo {semente}-{i}", 'artista': 'Artista X'})
+                    elif sorteio < args.frac_adicionar + args.frac_recomendar:
+                        rota = 'POST /recomendar'
+                        perfil = [nomes[rng.randrange(len(nomes))] for _ in range(3)]
+                        sessao.post(f"{base}/recomendar", json={'albuns': perfil, 'qtd': 10, 'detalhes': False})
+                    else:
+                        rota = 'GET /buscar'
+                        sessao.get(f"{base}/buscar", params={'nome': nomes[rng.randrange(len(nomes))][:9]})
+                    with lock:
+                        tempos.setdefault(rota, []).append(time.perf_counter() - inicio)
+
+            threads = [threading.Thread(target=cliente, args=(c,)) for c in range(args.clientes)]
+            inicio = time.perf_counter()
+            for t in threads: t.start()
+            for t in threads: t.join()
+            duracao = time.perf_counter() - inicio
+
+            total = sum(len(t) for t in tempos.values())
+            print(f"{args.albuns} álbuns, {args.clientes} clientes: {total} requisições em {duracao:.1f}s "
+                  f"({total / duracao:.0f} req/s)")
+            print(f"{'rota':>18} {'n':>6} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+            for rota, lista in sorted(tempos.items()):
+                p50, p99 = percentis_ms(lista)
+                print(f"{rota:>18} {len(lista):>6} {p50:>10.2f} {p99:>10.2f}")
+            metricas = requests.get(f"{base}/metricas").json()
+            print("Histogramas do servidor:", json.dumps(metricas['latencias'], ensure_ascii=False))
+            servidor.shutdown()
+            sistema.cache.fechar()
+        finally:
+            os.chdir(pasta_original)
+
+
+def bench_concorrencia(args):
+    import threading
+    from backend_logic import Sistema
+    from cache_recomendacoes import CacheRecomendacoes
+
+    pasta_original = os.getcwd()
+    with tempfile.TemporaryDirectory() as pasta:
+        os.chdir(pasta)
+        try:
+            matriz, nomes, tags, _ = gerar_catalogo_sintetico(args.albuns)
+            modelo = ModeloTfidfIncremental.de_matriz(matriz, nomes, tags)
+            salvar_pacote(modelo, IndiceNomes(modelo.nomes, modelo.ids))
+            sistema = Sistema(network=LastFmFalso(latencia=0))
+            sistema.cache_recomendacoes = CacheRecomendacoes(capacidade=0, qtd_minima=0)  # mede o cálculo, não o cache
+            rng = np.random.default_rng(5)
+
+            def medir_leituras(duracao):
+                tempos = []
+                fim = time.perf_counter() + duracao
+                while time.perf_counter() < fim:
+                    perfil = [nomes[i] for i in rng.integers(0, len(nomes), 3)]
+                    inicio = time.perf_counter()
+                    sistema.recomendar(perfil, 10)
+                    tempos.append(time.perf_counter() - inicio)
+                return percentis_ms(tempos)
+
+            p50, p99 = medir_leituras(args.duracao)
+            print(f"leituras sem escrita:              p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+
+            # Rajada de inserções sem esperar + reconstruções forçadas enquanto as leituras continuam
+            publicados = []
+            original = sistema._aplicar_lote
+            sistema._aplicar_lote = lambda lote: (publicados.append(len(lote)), original(lote))[1]
+
+            def escritor():
+                futuros = [sistema.adicionar_album(f"Novo {i}", [{'Album': f"Novo {i}", 'Tag': tags[i % 50], 'Peso': 1.0}],
+                                                   esperar=False) for i in range(args.rajada)]
+                for f in futuros: f.result()
+                sistema.retreinar_sistema()
+
+            thread = threading.Thread(target=escritor)
+            thread.start()
+            p50, p99 = medir_leituras(args.duracao)
+            thread.join()
+            print(f"leituras durante rajada+reconstr.: p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+            print(f"{args.rajada} inserções aplicadas em {len(publicados)} lotes (maior: {max(publicados)})")
+            sistema.cache.fechar()
+        finally:
+            os.chdir(pasta_original)
+
+
+def bench_repetidas(args):
+    import threading
+    from backend_logic import Sistema
+    from cache_recomendacoes import CacheRecomendacoes
+
+    pasta_original = os.getcwd()
+    with tempfile.TemporaryDirectory() as pasta:
+        os.chdir(pasta)
+        try:
+            matriz, nomes, tags, _ = gerar_catalogo_sintetico(args.albuns)
+            modelo = ModeloTfidfIncremental.de_matriz(matriz, nomes, tags)
+            salvar_pacote(modelo, IndiceNomes(modelo.nomes, modelo.ids))
+            sistema = Sistema(network=LastFmFalso(latencia=args.latencia))
+            rng = np.random.default_rng(11)
+            perfis = [[{'id': int(i)} for i in rng.integers(0, args.albuns, 3)] for _ in range(args.perfis)]
+            chamadas = []
+            original = sistema._calcular_recomendacoes
+            sistema._calcular_recomendacoes = lambda *a: (chamadas.append(1), original(*a))[1]
+
+            # Cliques repetidos com o mesmo perfil, mexendo só no slider (qtd de 1 a 20)
+            print(f"{args.albuns} álbuns, {args.perfis} perfis x {args.cliques} cliques (qtd variando), "
+                  f"Last.fm falso com {args.latencia * 1000:.0f} ms")
+            print(f"{'cache':>8} {'p50 (ms)':>10} {'p99 (ms)':>10} {'cálculos KNN':>13}")
+            for nome, cache in (('sem', CacheRecomendacoes(capacidade=0, qtd_minima=0)), ('com', CacheRecomendacoes())):
+                sistema.cache_recomendacoes = cache
+                chamadas.clear()
+                tempos = []
+                with contextlib.redirect_stdout(io.StringIO()):  # o log de cada recomendação
+                    for perfil in perfis:
+                        for qtd in rng.integers(1, 21, args.cliques):
+                            inicio = time.perf_counter()
+                            sistema.gerar_recomendacoes_com_detalhes(perfil, int(qtd))
+                            tempos.append(time.perf_counter() - inicio)
+                p50, p99 = percentis_ms(tempos)
+                print(f"{nome:>8} {p50:>10.2f} {p99:>10.2f} {len(chamadas):>13}")
+
+            # Pedidos iguais simultâneos (ex: vários clientes do servidor com o mesmo perfil)
+            sistema.cache_recomendacoes = CacheRecomendacoes()
+            chamadas.clear()
+            barreira = threading.Barrier(args.clientes)
+
+            def cliente():
+                barreira.wait()
+                sistema.recomendar(perfis[0], 10)
+
+            threads = [threading.Thread(target=cliente) for _ in range(args.clientes)]
+            for t in threads: t.start()
+            for t in threads: t.join()
+            print(f"{args.clientes} pedidos simultâneos iguais: {len(chamadas)} cálculo(s) KNN, "
+                  f"{sistema.cache_recomendacoes.estatisticas()}")
+
+            # Um álbum novo publica outro instantâneo: o cache não devolve mais o resultado antigo
+            sistema.adicionar_album("Novo", [{'Album': "Novo", 'Tag': tags[0], 'Peso': 1.0}])
+            chamadas.clear()
+            sistema.recomendar(perfis[0], 10)
+            print(f"depois de adicionar um álbum: {len(chamadas)} cálculo(s) KNN")
+            sistema.cache.fechar()
+        finally:
+            os.chdir(pasta_original)
+
+
+def bench_resiliencia(args):
+    import cliente_lastfm
+    from concurrent.futures import ThreadPoolExecutor
+    from cache_metadados import CacheMetadados
+    from cliente_lastfm import buscar_tags
+    from lastfm_falso import ServidorLastfmFalso
+    from rede_lastfm import FALHAS_PARA_ABRIR, Disjuntor, RedeHttp, RedeResiliente
+
+    # Discografias em sequência, como no CSV: álbuns do mesmo artista são buscados ao mesmo tempo
+    por_artista = max(1, args.albuns // args.artistas)
+    albuns = [(f"Artista {i // por_artista}", f"Album {i}") for i in range(args.albuns)]
+    limitador = cliente_lastfm.limitador_global
+    original = (limitador.taxa, limitador.capacidade)
+    limitador.taxa = limitador.capacidade = limitador.fichas = 1e9  # mede a camada de rede, não o limite/s
+
+    def coletar(servidor, rede, pasta, nome):
+        servidor.chamadas.clear()
+        servidor.conexoes = 0
+        cache = CacheMetadados(os.path.join(pasta, f"{nome}.db"))
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(args.workers) as executor, contextlib.redirect_stdout(io.StringIO()):
+            futuros = [executor.submit(buscar_tags, rede, artista, album, cache=cache) for artista, album in albuns]
+        com_tags = 0
+        for futuro in futuros:
+            try:
+                com_tags += bool(futuro.result())
+            except Exception:
+                pass
+        duracao = time.perf_counter() - inicio
+        cache.fechar()
+        resultado = {'com_tags': com_tags, 'duracao': duracao, 'requisicoes': sum(servidor.chamadas.values()),
+                     'conexoes': servidor.conexoes, 'artistas': servidor.chamadas['artist.getTopTags']}
+        print(f"{nome:>30} {com_tags:>6}/{len(albuns)} {duracao:>8.2f} {resultado['requisicoes']:>11} "
+              f"{resultado['conexoes']:>9} {resultado['artistas']:>9}")
+        return resultado
+
+    def resiliente(rede, tentativas=None, disjuntor=True):
+        return RedeResiliente(rede, tentativas=tentativas or args.tentativas, espera_base=args.espera_base,
+                              disjuntor=Disjuntor() if disjuntor else Disjuntor(limite=float('inf')))
+
+    print(f"{args.albuns} álbuns de {args.artistas} artistas ({args.frac_sem_tags:.0%} sem tags próprias), "
+          f"{args.workers} threads, servidor falso com {args.latencia * 1000:.0f} ms")
+    print(f"{'cenário':>30} {'com tags':>13} {'tempo (s)':>8} {'requisições':>11} {'conexões':>9} {'artistas':>9}")
+    try:
+        with tempfile.TemporaryDirectory() as pasta:
+            servidor = ServidorLastfmFalso(latencia=args.latencia, frac_sem_tags=args.frac_sem_tags)
+            nova = coletar(servidor, resiliente(RedeHttp('x', servidor.url, reaproveitar_conexoes=False)), pasta,
+                           'conexão nova por requisição')
+            sessao = coletar(servidor, resiliente(RedeHttp('x', servidor.url)), pasta, 'sessão compartilhada')
+
+            servidor.taxa_falhas = args.taxa_falhas
+            sem_repetir = coletar(servidor, resiliente(RedeHttp('x', servidor.url), tentativas=1),
+                                  pasta, f"{args.taxa_falhas:.0%} falhas, sem repetir")
+            repetindo = coletar(servidor, resiliente(RedeHttp('x', servidor.url)), pasta,
+                                f"{args.taxa_falhas:.0%} falhas, repetindo")
+
+            servidor.fora_do_ar = True
+            sem_disjuntor = coletar(servidor, resiliente(RedeHttp('x', servidor.url), disjuntor=False), pasta,
+                                    'fora do ar, sem disjuntor')
+            com_disjuntor = coletar(servidor, resiliente(RedeHttp('x', servidor.url)), pasta, 'fora do ar, com disjuntor')
+            servidor.fechar()
+    finally:
+        limitador.taxa, limitador.capacidade = original
+
+    # O que o cenário deve garantir (o repositório não tem testes: a conferência fica aqui)
+    n_artistas = len({artista for artista, _ in albuns})
+    for resultado in (nova, sessao):
+        assert resultado['com_tags'] == len(albuns), f"sem falhas, só {resultado['com_tags']} álbuns com tags"
+        assert resultado['artistas'] <= n_artistas, \
+            f"{resultado['artistas']} buscas de artista para {n_artistas} artistas (deviam ser compartilhadas)"
+    assert sessao['conexoes'] <= args.workers < nova['conexoes'], \
+        f"sessão compartilhada abriu {sessao['conexoes']} conexões para {args.workers} threads"
+    if args.taxa_falhas and args.tentativas > 1:
+        assert repetindo['com_tags'] >= 0.98 * len(albuns) and repetindo['com_tags'] > sem_repetir['com_tags'], \
+            f"com novas tentativas só {repetindo['com_tags']}/{len(albuns)} álbuns com tags"
+    # Disjuntor: abre depois de FALHAS_PARA_ABRIR falhas; no máximo as chamadas já em andamento passam
+    assert com_disjuntor['requisicoes'] <= FALHAS_PARA_ABRIR + args.workers < sem_disjuntor['requisicoes'], \
+        f"fora do ar: {com_disjuntor['requisicoes']} requisições com o disjuntor, {sem_disjuntor['requisicoes']} sem"
+
+
+def gerar_dados_brutos(fator, caminho_csv='rym_clean1.csv'):
+    """(Album, Tag, Peso) no formato longo do ingerir(), com o CSV distribuído repetido 'fator' vezes."""
+    from caracteristicas import CONSTRUTORES
+    df = pd.read_csv(caminho_csv).drop_duplicates(subset=['release_name'])
+    # Até 3 entradas por álbum (gêneros, depois descritores), como as 3 tags do Last.fm por álbum
+    base = pd.concat([CONSTRUTORES[bloco][0](df) for bloco in ('generos', 'descritores')], ignore_index=True)
+    base = base.groupby('Album', sort=False).head(3)
+    albuns, tags, pesos = base['Album'].tolist(), base['Tag'].tolist(), base['Peso'].tolist()
+    # Cada cópia ganha nomes de álbum distintos; as tags se repetem (como no catálogo real)
+    return pd.DataFrame({
+        'Album': [f"{album} #{k}" for k in range(fator) for album in albuns],
+        'Tag': list(tags) * fator,
+        'Peso': np.tile(np.asarray(pesos, dtype=np.float64), fator),
+    })
+
+
+def _pico_memoria_mb():
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux: KB
+
+
+def _medir_matriz(caminho, fator, fila):
+    # Roda num processo novo: o pico de RSS de cada caminho não se mistura com o dos outros
+    from armazem_tags import ArmazemAlbumTag
+    df = gerar_dados_brutos(fator)
+    base = _pico_memoria_mb()
+    inicio = time.perf_counter()
+    if caminho == 'pivot':
+        tabela = df.pivot_table(index='Album', columns='Tag', values='Peso').fillna(0)
+        matriz = csr_matrix(tabela.values)
+    else:
+        matriz, _, _ = ArmazemAlbumTag.de_dataframe(df).como_csr()
+    fila.put((_pico_memoria_mb() - base, time.perf_counter() - inicio, matriz.shape, matriz.nnz))
+
+
+def bench_memoria(args):
+    import multiprocessing
+    contexto = multiprocessing.get_context('spawn')
+    df = gerar_dados_brutos(1)
+    n_albuns, n_tags = df['Album'].nunique(), df['Tag'].nunique()
+    print(f"CSV distribuído: {n_albuns} álbuns, {n_tags} tags, {len(df)} entradas")
+    print(f"{'fator':>6} {'caminho':>8} {'álbuns':>9} {'pico extra (MB)':>16} {'tempo (s)':>10}")
+    for fator in args.fatores:
+        for caminho in ('pivot', 'armazem'):
+            denso_gb = n_albuns * fator * n_tags * 8 / 1e9
+            if caminho == 'pivot' and denso_gb > args.limite_denso_gb:
+                print(f"{fator:>6} {caminho:>8} {n_albuns * fator:>9} {'pulado':>16}   (matriz densa ~{denso_gb:.0f} GB)")
+                continue
+            fila = contexto.Queue()
+            processo = contexto.Process(target=_medir_matriz, args=(caminho, fator, fila))
+            processo.start()
+            pico, duracao, formato, nnz = fila.get()
+            processo.join()
+            print(f"{fator:>6} {caminho:>8} {formato[0]:>9} {pico:>16.0f} {duracao:>10.2f}")
+
+
+def _escrever_csv_repetido(caminho_csv, fator, destino):
+    # Cada cópia ganha títulos distintos (' #k') e mantém as linhas repetidas do original
+    df = pd.read_csv(caminho_csv)
+    for k in range(fator):
+        df.assign(release_name=df['release_name'].astype(str) + f" #{k}").to_csv(
+            destino, mode='a' if k else 'w', header=not k, index=False)
+
+
+def _medir_treino(caminho, caminho_csv, linhas_por_bloco, pasta, fila):
+    # Processo novo (como no _medir_matriz); sem checkpoint de tags: só os blocos do CSV nos dois caminhos
+    import avaliacao
+    from treino_fluxo import montar_em_fluxo
+    os.chdir(pasta)  # o cache de blocos do caminho em memória fica na pasta temporária
+    sem_tags = os.path.join(pasta, 'sem_tags.csv')
+    base = _pico_memoria_mb()
+    inicio = time.perf_counter()
+    if caminho == 'memoria':
+        with contextlib.redirect_stdout(io.StringIO()):
+            modelo = avaliacao.montar_modelo(*avaliacao.dados_locais(caminho_csv, sem_tags)[:2])
+    else:
+        with contextlib.redirect_stdout(io.StringIO()):
+            modelo = montar_em_fluxo(caminho_csv, sem_tags, os.path.join(pasta, 'fluxo'), linhas_por_bloco)
+    matriz = modelo.matriz_tfidf
+    pico_modelo, duracao = _pico_memoria_mb() - base, time.perf_counter() - inicio
+    # Como no treinar_em_fluxo: o índice de nomes fica inteiro na memória enquanto o pacote é salvo
+    with contextlib.redirect_stdout(io.StringIO()):
+        salvar_pacote(modelo, IndiceNomes(modelo.nomes, modelo.ids), diretorio=os.path.join(pasta, 'modelo'))
+    fila.put((pico_modelo, _pico_memoria_mb() - base, duracao, matriz.shape, matriz.nnz))
+
+
+def bench_fluxo(args):
+    import multiprocessing
+    contexto = multiprocessing.get_context('spawn')
+    print(f"{'fator':>6} {'caminho':>8} {'linhas/bloco':>13} {'álbuns':>9} {'nnz':>10} {'pico extra (MB)':>16} "
+          f"{'+ pacote (MB)':>14} {'tempo (s)':>10}")
+    for fator in args.fatores:
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho_csv = os.path.join(pasta, 'catalogo.csv')
+            _escrever_csv_repetido(args.csv, fator, caminho_csv)
+            rodadas = [('memoria', 0)] if fator <= args.limite_memoria else []
+            rodadas += [('fluxo', linhas) for linhas in args.linhas_por_bloco]
+            for caminho, linhas in rodadas:
+                fila = contexto.Queue()
+                processo = contexto.Process(target=_medir_treino, args=(caminho, caminho_csv, linhas or None, pasta, fila))
+                processo.start()
+                pico, pico_pacote, duracao, formato, nnz = fila.get()
+                processo.join()
+                print(f"{fator:>6} {caminho:>8} {linhas or '-':>13} {formato[0]:>9} {nnz:>10} {pico:>16.0f} "
+                      f"{pico_pacote:>14.0f} {duracao:>10.2f}")
+
+
+def bench_carga(args):
+    from sklearn.neighbors import NearestNeighbors
+
+    print(f"{'álbuns':>10} {'pickles (s)':>12} {'pacote (s)':>11} {'1ª recomendação (ms)':>21}")
+    for n_albuns in args.tamanhos:
+        matriz, nomes, tags, _ = gerar_catalogo_sintetico(n_albuns)
+        with tempfile.TemporaryDirectory() as pasta:
+            # Formato antigo: quatro pickles (o KNN duplica a matriz)
+            joblib.dump(NearestNeighbors(metric='cosine', algorithm='brute').fit(matriz),
+                        os.path.join(pasta, 'modelo_knn.pkl'))
+            joblib.dump(matriz, os.path.join(pasta, 'matriz_tfidf.pkl'))
+            joblib.dump(pd.Index(nomes), os.path.join(pasta, 'lista_nomes.pkl'))
+            inicio = time.perf_counter()
+            for arquivo in ('modelo_knn.pkl', 'matriz_tfidf.pkl', 'lista_nomes.pkl'):
+                joblib.load(os.path.join(pasta, arquivo))
+            t_pickles = time.perf_counter() - inicio
+
+            diretorio = os.path.join(pasta, 'modelo')
+            salvar_pacote(ModeloTfidfIncremental.de_matriz(matriz, nomes, tags), diretorio=diretorio)
+            inicio = time.perf_counter()
+            modelo, _ = carregar_pacote(diretorio)
+            t_pacote = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            modelo.indice.kneighbors(modelo.matriz_tfidf[:1].toarray(), n_neighbors=10)
+            t_consulta = (time.perf_counter() - inicio) * 1000
+        print(f"{n_albuns:>10} {t_pickles:>12.3f} {t_pacote:>11.4f} {t_consulta:>21.1f}")
+
+
+def gerar_perfis(matriz, n_perfis, albuns_por_perfil=3, semente=3):
+    """Consultas no formato do Sistema: centróide de alguns álbuns do catálogo."""
+    rng = np.random.default_rng(semente)
+    escolhidos = rng.integers(0, matriz.shape[0], size=(n_perfis, albuns_por_perfil))
+    return np.vstack([np.asarray(matriz[linha].mean(axis=0)) for linha in escolhidos])
+
+
+def recall_com_empates(sims_exatas_k, sims_aprox):
+    # Conta como acerto qualquer vizinho tão parecido quanto o k-ésimo exato (o catálogo tem muitos empates)
+    return float(np.mean(sims_aprox >= sims_exatas_k[:, None] - 1e-9))
+
+
+def bench_ann(args):
+    matriz, _, _, _ = gerar_catalogo_sintetico(args.albuns)
+    consultas = gerar_perfis(matriz, args.consultas)
+    k = args.k
+
+    exato = IndiceCosseno(matriz)
+    inicio = time.perf_counter()
+    dist_exatas = np.vstack([exato.kneighbors(q, k)[0] for q in consultas])
+    t_exato = (time.perf_counter() - inicio) / len(consultas) * 1000
+    sims_exatas_k = 1.0 - dist_exatas[:, -1]
+
+    inicio = time.perf_counter()
+    ivf = IndiceIVF()
+    ivf.construir(matriz)
+    print(f"{args.albuns} álbuns; IVF com {len(ivf.offsets) - 1} listas construído em {time.perf_counter() - inicio:.1f}s")
+    print(f"{'índice':>12} {'recall@' + str(k):>10} {'ms/consulta':>12}")
+    print(f"{'exato':>12} {1.0:>10.3f} {t_exato:>12.2f}")
+
+    for n_sondas in args.sondas:
+        ivf.n_sondas = n_sondas
+        inicio = time.perf_counter()
+        dist_aprox = np.vstack([ivf.kneighbors(q, k)[0] for q in consultas])
+        t_ivf = (time.perf_counter() - inicio) / len(consultas) * 1000
+        recall = recall_com_empates(sims_exatas_k, 1.0 - dist_aprox)
+        print(f"{'ivf/' + str(n_sondas):>12} {recall:>10.3f} {t_ivf:>12.2f}")
+
+
+def bench_compacto(args):
+    from indices_vizinhos import IndiceCompacto, _similaridades_linhas
+    matriz, _, _, _ = gerar_catalogo_sintetico(args.albuns, tags_por_album=args.tags_por_album, temas=args.temas)
+    consultas = normalize(gerar_perfis(matriz, args.consultas))
+    k = args.k
+
+    exato = IndiceCosseno(matriz)
+    inicio = time.perf_counter()
+    dist_exatas = np.vstack([exato.kneighbors(q, k)[0] for q in consultas])
+    t_exato = (time.perf_counter() - inicio) / len(consultas) * 1000
+    sims_exatas_k = 1.0 - dist_exatas[:, -1]
+    bytes_tfidf = matriz.data.nbytes + matriz.indices.nbytes + matriz.indptr.nbytes
+
+    print(f"{args.albuns} álbuns, {matriz.nnz / args.albuns:.1f} tags/álbum, {args.temas} temas, "
+          f"{args.consultas} consultas top-{k}")
+    print(f"{'índice':>30} {'memória (MB)':>13} {'construção (s)':>15} {'ms/consulta':>12} {'recall@' + str(k):>10}")
+    print(f"{'exato (TF-IDF float64)':>30} {bytes_tfidf / 1e6:>13.1f} {'-':>15} {t_exato:>12.2f} {1.0:>10.3f}")
+    for dimensoes in args.dimensoes:
+        for metodo in args.metodos:
+            for precisao in args.precisoes:
+                inicio = time.perf_counter()
+                indice = IndiceCompacto(dimensoes, metodo, precisao)
+                indice.construir(matriz)
+                t_construcao = time.perf_counter() - inicio
+                for candidatos in args.candidatos:
+                    indice.candidatos = candidatos
+                    inicio = time.perf_counter()
+                    vizinhos = np.vstack([indice.kneighbors(q, k)[1] for q in consultas])
+                    t_consulta = (time.perf_counter() - inicio) / len(consultas) * 1000
+                    # Recall pela similaridade exata dos devolvidos (sem reavaliar, as distâncias são aproximadas)
+                    sims = np.vstack([_similaridades_linhas(matriz, linhas, q) for linhas, q in zip(vizinhos, consultas)])
+                    nome = f"{metodo}/{dimensoes} {precisao} x{candidatos}"
+                    print(f"{nome:>30} {indice.memoria() / 1e6:>13.1f} {t_construcao:>15.1f} {t_consulta:>12.2f} "
+                          f"{recall_com_empates(sims_exatas_k, sims):>10.3f}")
+
+
+def bench_lote(args):
+    matriz, nomes, tags, _ = gerar_catalogo_sintetico(args.albuns)
+    modelo = ModeloTfidfIncremental.de_matriz(matriz, nomes, tags)
+    rng = np.random.default_rng(4)
+    perfis = [rng.integers(0, args.albuns, 3).tolist() for _ in range(args.perfis)]  # linhas do modelo
+
+    # Caminho de um perfil por vez, como o Sistema.recomendar (centróide + kneighbors)
+    amostra = perfis[:args.amostra_serial]
+    inicio = time.perf_counter()
+    for linhas in amostra:
+        centroide = np.asarray(modelo.matriz_tfidf[linhas].mean(axis=0))
+        modelo.indice.kneighbors(centroide, n_neighbors=args.qtd + len(linhas) + 5)
+    t_serial = (time.perf_counter() - inicio) / len(amostra)
+
+    inicio = time.perf_counter()
+    modelo.recomendar_lote(perfis, args.qtd)
+    t_lote = (time.perf_counter() - inicio) / len(perfis)
+
+    print(f"{args.albuns} álbuns, {args.perfis} perfis, top-{args.qtd}")
+    print(f"   um por vez: {t_serial * 1000:.2f} ms/perfil")
+    print(f"   em lote:    {t_lote * 1000:.2f} ms/perfil ({t_serial / t_lote:.1f}x)")
+
+
+def _vazao(indice, consultas, qtd, clientes):
+    # Consultas por segundo com 'clientes' threads simultâneas (como o servidor HTTP) e latência p50/p99
+    from concurrent.futures import ThreadPoolExecutor
+
+    def consultar(q):
+        inicio = time.perf_counter()
+        indice.kneighbors(q, n_neighbors=qtd)
+        return time.perf_counter() - inicio
+
+    with ThreadPoolExecutor(clientes) as executor:
+        list(executor.map(consultar, consultas[:clientes]))  # aquecimento
+        inicio = time.perf_counter()
+        tempos = list(executor.map(consultar, consultas))
+    return len(consultas) / (time.perf_counter() - inicio), *percentis_ms(tempos)
+
+
+def bench_fragmentos(args):
+    matriz, nomes, tags, _ = gerar_catalogo_sintetico(args.albuns)
+    rng = np.random.default_rng(6)
+    # Centróides de perfis de 3 álbuns, como no Sistema.recomendar
+    consultas = [np.asarray(matriz[rng.integers(0, args.albuns, 3)].mean(axis=0)) for _ in range(args.consultas)]
+    print(f"{args.albuns} álbuns, {args.consultas} consultas top-{args.qtd}, {args.clientes} clientes, "
+          f"{os.cpu_count()} núcleos")
+    print(f"{'índice':>14} {'consultas/s':>12} {'aceleração':>11} {'p50 (ms)':>9} {'p99 (ms)':>9} {'iguais':>7}")
+
+    referencia = IndiceCosseno(matriz)
+    qps_base, p50, p99 = _vazao(referencia, consultas, args.qtd, args.clientes)
+    print(f"{'exato':>14} {qps_base:>12.0f} {1.0:>10.2f}x {p50:>9.2f} {p99:>9.2f} {'-':>7}")
+    amostra = np.vstack(consultas[:50])
+    esperado = referencia.kneighbors(amostra, args.qtd)[0]
+    for n_processos in args.processos:
+        indice = IndiceFragmentado(n_processos)
+        inicio = time.perf_counter()
+        indice.construir(matriz)
+        t_publicar = time.perf_counter() - inicio
+        qps, p50, p99 = _vazao(indice, consultas, args.qtd, args.clientes)
+        iguais = np.allclose(indice.kneighbors(amostra, args.qtd)[0], esperado)
+        nome = f"fragmentado x{n_processos}"
+        print(f"{nome:>14} {qps:>12.0f} {qps / qps_base:>10.2f}x {p50:>9.2f} {p99:>9.2f} {str(iguais):>7}"
+              f"   (publicação {t_publicar:.2f} s)")
+        indice.pool.fechar()
+
+
+def _divergencia_tabela(indice, csr, linhas, resposta, qtd, tolerancia):
+    """None se a resposta da tabela é a da busca exata (similaridades até 'tolerancia'); senão a diferença."""
+    linhas_t, sims_t = resposta
+    centroide = np.asarray(csr[linhas].mean(axis=0))
+    distancias, indices = indice.kneighbors(centroide, n_neighbors=qtd + len(linhas) + 1)
+    sims_e = np.array([1 - d for i, d in zip(indices[0], distancias[0]) if i not in linhas][:qtd])
+    if len(sims_t) != len(sims_e) or not np.allclose(sims_t, sims_e, atol=tolerancia):
+        return f"similaridades {np.round(sims_t, 4)} != exato {np.round(sims_e, 4)}"
+    # Os álbuns devolvidos têm de fato essas similaridades (álbuns diferentes do exato só em empates)
+    reais = np.asarray(csr[linhas_t] @ (centroide / np.linalg.norm(centroide)).T).ravel()
+    if len(set(linhas_t.tolist())) < len(linhas_t) or set(linhas_t.tolist()) & set(linhas) \
+            or not np.allclose(reais, sims_e, atol=tolerancia):
+        return f"álbuns {linhas_t.tolist()} com similaridades reais {np.round(reais, 4)} != exato {np.round(sims_e, 4)}"
+    return None
+
+
+def bench_vizinhos(args):
+    print(f"Respostas da tabela conferidas com a busca exata (tolerância {args.tolerancia:g} na similaridade)")
+    print(f"{'álbuns':>8} {'k':>4} {'montagem (s)':>13} {'MB':>6} {'perfil':>7} {'pela tabela':>12} "
+          f"{'tabela p50/p99 (ms)':>20} {'exato p50/p99 (ms)':>19} {'inserção (ms)':>14}")
+    divergencias = []
+    for n_albuns in args.tamanhos:
+        matriz, nomes, tags, _ = gerar_catalogo_sintetico(n_albuns)
+        modelo = ModeloTfidfIncremental.de_matriz(matriz, nomes, tags)
+        csr = modelo.matriz_tfidf
+        # Perfis coerentes (um álbum + vizinhos próximos dele), como os de um usuário real
+        rng = np.random.default_rng(5)
+        sementes = rng.integers(0, n_albuns, args.perfis)
+        _, proximos = modelo.indice.kneighbors(csr[sementes].toarray(), n_neighbors=20)
+        perfis = {1: [[int(a)] for a in sementes],
+                  3: [[int(a)] + rng.choice(p[1:], 2, replace=False).tolist() for a, p in zip(sementes, proximos)]}
+
+        tempos_exato = {}
+        for tamanho, lista in perfis.items():
+            tempos = []
+            for linhas in lista:
+                inicio = time.perf_counter()
+                modelo.indice.kneighbors(np.asarray(csr[linhas].mean(axis=0)), n_neighbors=args.qtd + len(linhas) + 5)
+                tempos.append(time.perf_counter() - inicio)
+            tempos_exato[tamanho] = percentis_ms(tempos)
+
+        for k in args.ks:
+            tabela = TabelaVizinhos(k)
+            inicio = time.perf_counter()
+            tabela.construir(csr)
+            t_montagem = time.perf_counter() - inicio
+            mb = (tabela.vizinhos.nbytes + tabela.sims.nbytes) / 2**20
+            for tamanho, lista in perfis.items():
+                tempos, respondidos = [], 0
+                for linhas in lista:
+                    inicio = time.perf_counter()
+                    resposta = tabela.recomendar(csr, linhas, args.qtd)
+                    tempos.append(time.perf_counter() - inicio)
+                    if resposta is None: continue
+                    respondidos += 1
+                    erro = _divergencia_tabela(modelo.indice, csr, linhas, resposta, args.qtd, args.tolerancia)
+                    if erro: divergencias.append(f"{n_albuns} álbuns, k={k}, perfil {linhas}: {erro}")
+                p50, p99 = percentis_ms(tempos)
+                e50, e99 = tempos_exato[tamanho]
+                print(f"{n_albuns:>8} {k:>4} {t_montagem:>13.2f} {mb:>6.1f} {tamanho:>7} "
+                      f"{respondidos / len(lista):>12.0%} {p50:>9.3f}/{p99:<10.3f} {e50:>8.3f}/{e99:<10.3f}", end='')
+                if tamanho != 1:
+                    print()
+                    continue
+                # Inserções: só as listas afetadas mudam (a cópia do instantâneo não altera 'tabela')
+                copia = ModeloTfidfIncremental.de_matriz(matriz, nomes, tags)
+                copia.vizinhos = tabela.instantaneo()
+                inicio = time.perf_counter()
+                for i in range(args.insercoes):
+                    escolhidas = rng.choice(len(tags), 3, replace=False)
+                    copia.adicionar_album(f"Novo {i}", [(tags[j], 1.0) for j in escolhidas])
+                print(f" {(time.perf_counter() - inicio) / args.insercoes * 1000:>14.3f}")
+    for erro in divergencias[:10]:
+        print(f"  DIVERGENTE: {erro}")
+    assert not divergencias, f"{len(divergencias)} resposta(s) da tabela diferente(s) da busca exata"
+
+
+def bench_ids(args):
+    matriz, nomes, tags, _ = gerar_catalogo_sintetico(args.albuns)
+    # Títulos repetidos entre artistas: só o par (artista, título) identifica o álbum
+    titulos = [f"Album {i % (args.albuns // 4)}" for i in range(args.albuns)]
+    artistas = [f"Artista {i}" for i in range(args.albuns)]
+    modelo = ModeloTfidfIncremental.de_matriz(matriz, titulos, tags, artistas=artistas)
+    for i in range(args.insercoes):  # parte das consultas cai no delta (inserções depois da carga)
+        modelo.adicionar_album(f"Novo {i}", [(tags[i % 50], 1.0)], f"Artista novo {i}")
+    instantaneo = modelo.instantaneo()
+
+    rng = np.random.default_rng(6)
+    linhas = rng.integers(0, instantaneo.matriz_tfidf.shape[0], args.consultas)
+    pares = [(instantaneo.nomes[i], instantaneo.artistas[i]) for i in linhas]
+    ids = [instantaneo.ids[i] for i in linhas]
+    mapa_nomes = {nome: i for i, nome in enumerate(nomes)}  # o mapa nome -> linha de antes (só títulos)
+    consultas_nomes = [nomes[i % len(nomes)] for i in linhas]
+
+    print(f"{args.albuns} álbuns + {args.insercoes} inserções, {args.consultas} consultas")
+    for rotulo, consulta, entradas in (('nome (antes)', mapa_nomes.get, consultas_nomes),
+                                       ('id', instantaneo.linha_do_id, ids),
+                                       ('(artista, título)', lambda par: instantaneo.linha(*par), pares)):
+        consulta(entradas[0])  # monta os mapas sob demanda fora da medição
+        inicio = time.perf_counter()
+        for entrada in entradas: consulta(entrada)
+        print(f"   {rotulo:>18}: {(time.perf_counter() - inicio) / len(entradas) * 1e9:.0f} ns/consulta")
+    assert [instantaneo.linha_do_id(i) for i in ids] == linhas.tolist()
+    assert [instantaneo.linha(*par) for par in pares] == linhas.tolist()
+
+
+def bench_caracteristicas(args):
+    from caracteristicas import construir_blocos
+    df = pd.read_csv(args.csv).drop_duplicates(subset=['artist_name', 'release_name'])
+    df = pd.concat([df.assign(release_name=df['release_name'] + f" #{k}") for k in range(args.fator)],
+                   ignore_index=True)
+    print(f"{len(df)} álbuns ({args.fator}x o CSV)")
+
+    # Referência: a montagem linha a linha (iterrows + split em Python) só dos gêneros/descritores
+    inicio = time.perf_counter()
+    linhas = [(linha.artist_name, linha.release_name, f"genero:{g.strip()}", 1.0)
+              for _, linha in df.iterrows() for coluna in ('primary_genres', 'secondary_genres', 'descriptors')
+              if isinstance(linha[coluna], str) and linha[coluna] != 'NA'
+              for g in linha[coluna].split(',') if g.strip()]
+    t_iterrows = time.perf_counter() - inicio
+
+    with tempfile.TemporaryDirectory() as pasta:
+        def medir(dados):
+            inicio = time.perf_counter()
+            blocos = construir_blocos(dados, diretorio=pasta)
+            return time.perf_counter() - inicio, sum(len(b) for b in blocos.values())
+
+        t_frio, entradas = medir(df)
+        t_cache, _ = medir(df)
+        alterado = df.copy()
+        alterado.loc[0, 'descriptors'] = 'melancholic'  # só o bloco de descritores muda
+        t_parcial, _ = medir(alterado)
+
+    print(f"   iterrows (referência):  {t_iterrows:.2f} s ({len(linhas)} entradas)")
+    print(f"   vetorizado, sem cache:  {t_frio:.2f} s ({entradas} entradas, {t_iterrows / t_frio:.0f}x)")
+    print(f"   tudo do cache:          {t_cache:.2f} s")
+    print(f"   uma coluna alterada:    {t_parcial:.2f} s")
+
+
+def bench_telemetria(args):
+    from telemetria import RegistroLog, Telemetria
+    telemetria = Telemetria()
+    registro = RegistroLog()
+    registro.em_buffer = True
+    matriz, _, _, _ = gerar_catalogo_sintetico(args.albuns)
+    modelo = ModeloTfidfIncremental.de_matriz(matriz, [f"Album {i}" for i in range(args.albuns)],
+                                              [f"Tag {j}" for j in range(matriz.shape[1])])
+    consulta = modelo.matriz_tfidf[:1].toarray()
+
+    def por_chamada(funcao):
+        inicio = time.perf_counter()
+        for _ in range(args.repeticoes): funcao()
+        return (time.perf_counter() - inicio) / args.repeticoes * 1e6
+
+    def span():
+        with telemetria.span('trecho'): pass
+
+    t_knn = por_chamada(lambda: modelo.indice.kneighbors(consulta, n_neighbors=10))
+    print(f"{args.repeticoes} repetições; consulta KNN ({args.albuns} álbuns) para comparação: {t_knn:.1f} us")
+    for rotulo, funcao in (('span', span), ('contador', lambda: telemetria.contar('contador')),
+                           ('log em buffer', lambda: registro("[Backend] mensagem de teste"))):
+        t = por_chamada(funcao)
+        print(f"   {rotulo:>14}: {t:.2f} us/chamada ({t / t_knn * 100:.2f}% de uma consulta)")
+        registro.drenar()
+
+
+# Roda num processo novo (imports e carga a frio), no diretório do pacote sintético
+_SCRIPT_INICIALIZACAO = """
+import json, sys, time
+inicio = time.perf_counter()
+from backend_logic import Sistema
+from lastfm_falso import LastFmFalso
+marcas = {'import': time.perf_counter() - inicio}
+sistema = Sistema(network=LastFmFalso(latencia=0), em_segundo_plano=sys.argv[1] == '1')
+marcas['construtor'] = time.perf_counter() - inicio
+sistema.indice_pronto.wait()
+marcas['indice_pronto'] = time.perf_counter() - inicio
+status, album = sistema.buscar_candidatos(sys.argv[2])
+marcas['primeira_busca'] = time.perf_counter() - inicio
+sistema.esperar_modelo()
+marcas['modelo_pronto'] = time.perf_counter() - inicio
+recs = sistema.recomendar([album], 10)
+marcas['primeira_recomendacao'] = time.perf_counter() - inicio
+assert status == 'CACHE_HIT' and recs, (status, len(recs))
+print(json.dumps(marcas))
+"""
+
+
+def _tempos_de_import(modulo, n=8):
+    """Os 'n' imports mais caros (tempo acumulado, ms) de 'modulo' num processo novo, via -X importtime."""
+    saida = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {modulo}'], capture_output=True,
+                           text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stderr
+    tempos = []
+    for linha in saida.splitlines():
+        if not linha.startswith('import time:') or 'cumulative' in linha: continue
+        _, acumulado, nome = linha.split('|')  # 'import time: próprio | acumulado | módulo'
+        profundidade = (len(nome) - len(nome.lstrip())) // 2
+        if profundidade <= 2: tempos.append((int(acumulado) / 1000, nome.strip()))
+    return sorted(tempos, reverse=True)[:n]
+
+
+def bench_inicializacao(args):
+    for modulo in ('backend_logic', 'interface'):
+        try:
+            tempos = _tempos_de_import(modulo)
+        except subprocess.CalledProcessError as e:
+            print(f"import {modulo}: falhou ({e.stderr.strip().splitlines()[-1]})")
+            continue
+        print(f"import {modulo} (-X importtime, acumulado):")
+        for ms, nome in tempos: print(f"   {ms:>8.1f} ms  {nome}")
+
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    ambiente = dict(os.environ, PYTHONPATH=raiz + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    colunas = ('import', 'construtor', 'indice_pronto', 'primeira_busca', 'modelo_pronto', 'primeira_recomendacao')
+    print(f"\n{'álbuns':>9} {'modo':>14} " + ' '.join(f"{c:>21}" for c in colunas) + "   (s desde o início)")
+    for n_albuns in args.tamanhos:
+        matriz, nomes, tags, _ = gerar_catalogo_sintetico(n_albuns)
+        modelo = ModeloTfidfIncremental.de_matriz(matriz, nomes, tags)
+        indice = IndiceNomes(modelo.nomes, modelo.ids)
+        with tempfile.TemporaryDirectory() as pasta:
+            salvar_pacote(modelo, indice, diretorio=os.path.join(pasta, 'modelo'))
+            for em_segundo_plano in (False, True):
+                saida = subprocess.run([sys.executable, '-c', _SCRIPT_INICIALIZACAO, str(int(em_segundo_plano)),
+                                        nomes[n_albuns // 2]], capture_output=True, text=True, cwd=pasta,
+                                       env=ambiente, check=True).stdout
+                marcas = json.loads(saida.strip().splitlines()[-1])
+                modo = 'segundo plano' if em_segundo_plano else 'bloqueante'
+                print(f"{n_albuns:>9} {modo:>14} " + ' '.join(f"{marcas[c]:>21.3f}" for c in colunas))
+
+            # Índice de nomes: formato antigo (joblib) vs. pickle puro
+            caminho = os.path.join(pasta, 'indice_nomes.joblib')
+            joblib.dump(indice, caminho)
+            inicio = time.perf_counter()
+            joblib.load(caminho)
+            t_joblib = time.perf_counter() - inicio
+            with open(caminho, 'wb') as f: pickle.dump(indice, f, pickle.HIGHEST_PROTOCOL)
+            inicio = time.perf_counter()
+            with open(caminho, 'rb') as f: pickle.load(f)
+            t_pickle = time.perf_counter() - inicio
+            print(f"{'':>9} {'':>14} índice de nomes: joblib.load {t_joblib:.3f} s, pickle {t_pickle:.3f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do KNAlbuns")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p = sub.add_parser('insercao', help="latência por inserção incremental vs. tamanho do catálogo")
+    p.add_argument('--tamanhos', type=int, nargs='+', default=[5_000, 50_000, 500_000])
+    p.add_argument('--insercoes', type=int, default=2000)
+    p.add_argument('--limiar', type=float, default=0.05)
+    p.set_defaults(func=bench_insercao)
+
+    p = sub.add_parser('busca', help="latência da busca de nomes (exata, prefixo, substring, fuzzy)")
+    p.add_argument('--titulos', type=int, default=1_000_000)
+    p.add_argument('--consultas', type=int, default=500)
+    p.set_defaults(func=bench_busca)
+
+    p = sub.add_parser('enriquecimento', help="detalhamento serial vs. paralelo com Last.fm falso")
+    p.add_argument('--recomendacoes', type=int, default=20)
+    p.add_argument('--latencia', type=float, default=0.3)
+    p.set_defaults(func=bench_enriquecimento)
+
+    p = sub.add_parser('capas', help="download de capas: serial vs. paralelo com cache de miniaturas")
+    p.add_argument('--capas', type=int, default=12)
+    p.add_argument('--latencia', type=float, default=0.3)
+    p.add_argument('--lado', type=int, default=600)
+    p.set_defaults(func=bench_capas)
+
+    p = sub.add_parser('servidor', help="teste de carga do servidor HTTP com Last.fm falso")
+    p.add_argument('--albuns', type=int, default=50_000)
+    p.add_argument('--clientes', type=int, default=8)
+    p.add_argument('--requisicoes', type=int, default=200, help="por cliente")
+    p.add_argument('--frac-recomendar', type=float, default=0.35)
+    p.add_argument('--frac-adicionar', type=float, default=0.02)
+    p.add_argument('--latencia', type=float, default=0.05, help="latência do Last.fm falso (s)")
+    p.set_defaults(func=bench_servidor)
+
+    p = sub.add_parser('concorrencia', help="latência de leitura durante inserções/reconstruções")
+    p.add_argument('--albuns', type=int, default=200_000)
+    p.add_argument('--rajada', type=int, default=500)
+    p.add_argument('--duracao', type=float, default=3.0)
+    p.set_defaults(func=bench_concorrencia)
+
+    p = sub.add_parser('repetidas', help="cache de recomendações: cliques repetidos, slider e pedidos simultâneos")
+    p.add_argument('--albuns', type=int, default=200_000)
+    p.add_argument('--perfis', type=int, default=20)
+    p.add_argument('--cliques', type=int, default=10)
+    p.add_argument('--clientes', type=int, default=16)
+    p.add_argument('--latencia', type=float, default=0.05)
+    p.set_defaults(func=bench_repetidas)
+
+    p = sub.add_parser('resiliencia', help="Last.fm por HTTP contra um servidor falso com falhas: conexões, "
+                                           "novas tentativas, disjuntor e artistas repetidos")
+    p.add_argument('--albuns', type=int, default=600)
+    p.add_argument('--artistas', type=int, default=100)
+    p.add_argument('--frac-sem-tags', type=float, default=0.5)
+    p.add_argument('--taxa-falhas', type=float, default=0.2)
+    p.add_argument('--latencia', type=float, default=0.01)
+    p.add_argument('--workers', type=int, default=8)
+    p.add_argument('--tentativas', type=int, default=4)
+    p.add_argument('--espera-base', type=float, default=0.05)
+    p.set_defaults(func=bench_resiliencia)
+
+    p = sub.add_parser('memoria', help="memória para montar a matriz álbum x tag: pivot_table vs. armazém")
+    p.add_argument('--fatores', type=int, nargs='+', default=[10, 100, 1000])
+    p.add_argument('--limite-denso-gb', type=float, default=2.0,
+                   help="não roda o pivot_table quando a matriz densa estimada passa disso")
+    p.set_defaults(func=bench_memoria)
+
+    p = sub.add_parser('fluxo', help="treino em fluxo (CSV em blocos, TF-IDF em disco) vs. em memória: pico de RSS (sem e com o pacote salvo) e tempo")
+    p.add_argument('--csv', default='rym_clean1.csv')
+    p.add_argument('--fatores', type=int, nargs='+', default=[20, 200], help="quantas vezes o CSV é repetido")
+    p.add_argument('--linhas-por-bloco', type=int, nargs='+', default=[20_000, 50_000])
+    p.add_argument('--limite-memoria', type=int, default=200, help="fator acima do qual o caminho em memória não roda")
+    p.set_defaults(func=bench_fluxo)
+
+    p = sub.add_parser('carga', help="tempo de carga: pickles antigos vs. pacote com memmap")
+    p.add_argument('--tamanhos', type=int, nargs='+', default=[50_000, 500_000])
+    p.set_defaults(func=bench_carga)
+
+    p = sub.add_parser('ann', help="recall@k vs. latência: índice IVF aproximado contra o exato")
+    p.add_argument('--albuns', type=int, default=1_000_000)
+    p.add_argument('--consultas', type=int, default=200)
+    p.add_argument('--k', type=int, default=10)
+    p.add_argument('--sondas', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    p.set_defaults(func=bench_ann)
+
+    p = sub.add_parser('compacto', help="índice compacto (SVD/projeção em int8/float16): memória, latência e recall")
+    p.add_argument('--albuns', type=int, default=1_000_000)
+    p.add_argument('--consultas', type=int, default=200)
+    p.add_argument('--k', type=int, default=10)
+    p.add_argument('--dimensoes', type=int, nargs='+', default=[64, 128])
+    p.add_argument('--tags-por-album', type=int, default=30,
+                   help="colunas por álbum (tags + gêneros + descritores do CSV); com poucas, o TF-IDF esparso já é menor")
+    p.add_argument('--temas', type=int, default=50,
+                   help="gêneros do catálogo sintético; 0 = tags independentes (sem estrutura para a projeção achar)")
+    p.add_argument('--metodos', nargs='+', default=['svd', 'projecao'])
+    p.add_argument('--precisoes', nargs='+', default=['int8', 'float16'])
+    p.add_argument('--candidatos', type=int, nargs='+', default=[0, 30, 100])
+    p.set_defaults(func=bench_compacto)
+
+    p = sub.add_parser('lote', help="recomendação em lote vs. um perfil por vez")
+    p.add_argument('--albuns', type=int, default=200_000)
+    p.add_argument('--perfis', type=int, default=5000)
+    p.add_argument('--amostra-serial', type=int, default=500)
+    p.add_argument('--qtd', type=int, default=10)
+    p.set_defaults(func=bench_lote)
+
+    p = sub.add_parser('fragmentos', help="consultas/s da busca exata fragmentada entre processos vs. núcleos")
+    p.add_argument('--albuns', type=int, default=1_000_000)
+    p.add_argument('--processos', type=int, nargs='+', default=[1, 2, 4, 8])
+    p.add_argument('--consultas', type=int, default=2000)
+    p.add_argument('--clientes', type=int, default=16, help="threads consultando ao mesmo tempo")
+    p.add_argument('--qtd', type=int, default=10)
+    p.set_defaults(func=bench_fragmentos)
+
+    p = sub.add_parser('vizinhos', help="vizinhos pré-calculados: montagem, cobertura e latência vs. busca exata")
+    p.add_argument('--tamanhos', type=int, nargs='+', default=[5_000, 20_000])
+    p.add_argument('--ks', type=int, nargs='+', default=[20, 50, 100])
+    p.add_argument('--perfis', type=int, default=500)
+    p.add_argument('--qtd', type=int, default=10)
+    p.add_argument('--insercoes', type=int, default=200)
+    p.add_argument('--tolerancia', type=float, default=1e-3,
+                   help="diferença máxima de similaridade aceita em relação à busca exata")
+    p.set_defaults(func=bench_vizinhos)
+
+    p = sub.add_parser('caracteristicas', help="blocos de características do CSV: iterrows vs. vetorizado vs. cache")
+    p.add_argument('--csv', default='rym_clean1.csv')
+    p.add_argument('--fator', type=int, default=20, help="quantas vezes o CSV é repetido")
+    p.set_defaults(func=bench_caracteristicas)
+
+    p = sub.add_parser('telemetria', help="custo de spans, contadores e log em buffer")
+    p.add_argument('--albuns', type=int, default=50_000)
+    p.add_argument('--repeticoes', type=int, default=20_000)
+    p.set_defaults(func=bench_telemetria)
+
+    p = sub.add_parser('inicializacao', help="imports, janela/busca/recomendação desde o início: bloqueante vs. segundo plano")
+    p.add_argument('--tamanhos', type=int, nargs='+', default=[50_000, 500_000])
+    p.set_defaults(func=bench_inicializacao)
+
+    p = sub.add_parser('ids', help="consulta de álbum por id e por (artista, título) vs. o mapa de nomes")
+    p.add_argument('--albuns', type=int, default=1_000_000)
+    p.add_argument('--insercoes', type=int, default=5000)
+    p.add_argument('--consultas', type=int, default=200_000)
+    p.set_defaults(func=bench_ids)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from telemetria import log, telemetria
+
+# ================= CONFIGURAÇÃO =================
+DIRETORIO_CAPAS = 'capas'
+TAMANHO_MINIATURA = (160, 160)          # tamanho dos cards da interface
+LIMITE_CACHE_CAPAS = 64 * 1024 * 1024   # bytes em disco; as capas usadas há mais tempo saem primeiro
+WORKERS_CAPAS = 6                       # downloads simultâneos
+TIMEOUT_DOWNLOAD = 10.0
+
+
+class CacheCapas:
+    """
+    Miniaturas das capas em disco, já no tamanho do card (JPEG 160x160), endereçadas pelo hash da URL.
+    As URLs de capa do Last.fm já são derivadas do conteúdo, então a mesma imagem não é guardada duas vezes.
+    O tamanho total é limitado: ao passar de 'limite_bytes', as menos usadas recentemente são apagadas.
+    """
+
+    def __init__(self, diretorio=DIRETORIO_CAPAS, limite_bytes=LIMITE_CACHE_CAPAS, tamanho=TAMANHO_MINIATURA):
+        self.diretorio = diretorio
+        self.limite_bytes = limite_bytes
+        self.tamanho = tamanho
+        self.lock = threading.Lock()
+        os.makedirs(diretorio, exist_ok=True)
+
+        # Ordem LRU reconstruída pela data de acesso dos arquivos (atualizada com os.utime a cada uso)
+        arquivos = []
+        for nome in os.listdir(diretorio):
+            if not nome.endswith('.jpg'): continue
+            info = os.stat(os.path.join(diretorio, nome))
+            arquivos.append((info.st_mtime, nome, info.st_size))
+        self.uso = OrderedDict((nome, tamanho_arq) for _, nome, tamanho_arq in sorted(arquivos))
+        self.total_bytes = sum(self.uso.values())
+
+    def _arquivo(self, url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest() + '.jpg'
+
+    def obter(self, url):
+        """Miniatura guardada (PIL.Image) ou None."""
+        nome = self._arquivo(url)
+        caminho = os.path.join(self.diretorio, nome)
+        with self.lock:
+            if nome not in self.uso: return None
+            self.uso.move_to_end(nome)
+        try:
+            os.utime(caminho)
+            with Image.open(caminho) as img:
+                img.load()
+                return img.copy()
+        except OSError:
+            # Apagado por fora ou corrompido: esquece a entrada e baixa de novo
+            self._remover(nome)
+            return None
+
+    def salvar(self, url, conteudo):
+        """Reduz a imagem baixada para a miniatura, grava e retorna a miniatura (PIL.Image)."""
+        with Image.open(BytesIO(conteudo)) as img:
+            # JPEG: decodifica já em escala reduzida (1/2, 1/4, 1/8) em vez da imagem inteira
+            img.draft('RGB', (self.tamanho[0] * 2, self.tamanho[1] * 2))
+            miniatura = ImageOps.fit(img.convert('RGB'), self.tamanho, Image.LANCZOS)
+
+        nome = self._arquivo(url)
+        caminho = os.path.join(self.diretorio, nome)
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        miniatura.save(temporario, 'JPEG', quality=88)
+        os.replace(temporario, caminho)
+
+        with self.lock:
+            self.total_bytes += os.path.getsize(caminho) - self.uso.pop(nome, 0)
+            self.uso[nome] = os.path.getsize(caminho)
+            while self.total_bytes > self.limite_bytes and len(self.uso) > 1:
+                antigo, tamanho_arq = self.uso.popitem(last=False)
+                self.total_bytes -= tamanho_arq
+                try:
+                    os.remove(os.path.join(self.diretorio, antigo))
+                except FileNotFoundError:
+                    pass
+        return miniatura
+
+    def _remover(self, nome):
+        with self.lock:
+            self.total_bytes -= self.uso.pop(nome, 0)
+
+
+class BaixadorCapas:
+    """Baixa capas em paralelo (no máximo 'workers' por vez), passando pelo CacheCapas."""
+
+    def __init__(self, cache=None, workers=WORKERS_CAPAS, timeout=TIMEOUT_DOWNLOAD):
+        self.cache = cache if cache is not None else CacheCapas()
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='capas')
+        self.local = threading.local()  # uma requests.Session por thread (Session não é thread-safe)
+
+    def _sessao(self):
+        if not hasattr(self.local, 'sessao'):
+            import requests  # só no primeiro download: fora do caminho de abertura da janela
+            self.local.sessao = requests.Session()
+        return self.local.sessao
+
+    def buscar(self, url):
+        """Miniatura da capa (PIL.Image), do disco ou baixada agora. Levanta exceção se o download falhar."""
+        miniatura = self.cache.obter(url)
+        if miniatura is not None:
+            telemetria.contar('capas.acerto')
+            return miniatura
+
+        telemetria.contar('capas.falta')
+        with telemetria.span('capas.download'):
+            resp = self._sessao().get(url, timeout=self.timeout)
+            resp.raise_for_status()
+        with telemetria.span('capas.miniatura'):
+            return self.cache.salvar(url, resp.content)
+
+    def agendar(self, url, ao_carregar):
+        """Busca em segundo plano; 'ao_carregar(miniatura ou None)' roda na thread do download."""
+        def tarefa():
+            try:
+                miniatura = self.buscar(url)
+            except Exception as e:
+                log(f"Erro download {url}: {e}")
+                miniatura = None
+            ao_carregar(miniatura)
+        return self.executor.submit(tarefa)
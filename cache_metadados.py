@@ -0,0 +1,111 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from indice_nomes import normalizar
+from telemetria import telemetria
+
+# ================= CONFIGURAÇÃO =================
+ARQUIVO_CACHE = 'metadados.db'
+CAPACIDADE_MEMORIA = 10_000         # entradas mantidas na camada LRU em memória
+DIA = 24 * 3600
+TTL_CAMPOS = {                      # validade (s) de cada campo
+    'artista': 90 * DIA,
+    'capa': 7 * DIA,                # URLs de capa mudam com mais frequência
+    'tags': 30 * DIA,
+}
+TTL_NEGATIVO = 1 * DIA              # validade de um "não encontrado"
+
+AUSENTE = object()  # nada no cache (diferente de None, que é um "não encontrado" guardado)
+
+
+class CacheMetadados:
+    """
+    Cache de metadados do Last.fm por (artista, álbum, campo), persistido em SQLite.
+    Na frente do disco fica um LRU em memória. Respostas vazias da API também são guardadas
+    (cache negativo) para não repetir buscas que sabidamente falham.
+    """
+
+    def __init__(self, caminho=ARQUIVO_CACHE, capacidade=CAPACIDADE_MEMORIA, ttls=None, ttl_negativo=TTL_NEGATIVO):
+        self.capacidade = capacidade
+        self.ttls = dict(TTL_CAMPOS, **(ttls or {}))
+        self.ttl_negativo = ttl_negativo
+        self.memoria = OrderedDict()
+        self.lock = threading.Lock()
+        self.acertos = 0
+        self.acertos_negativos = 0
+        self.falhas = 0
+
+        self.conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self.conexao.execute('PRAGMA journal_mode=WAL')
+        self.conexao.execute("""
+            CREATE TABLE IF NOT EXISTS metadados (
+                artista TEXT, album TEXT, campo TEXT, valor TEXT, atualizado REAL,
+                PRIMARY KEY (artista, album, campo))
+        """)
+        self.conexao.commit()
+
+    def _valido(self, campo, valor, atualizado):
+        ttl = self.ttl_negativo if valor is None else self.ttls.get(campo, TTL_NEGATIVO)
+        return time.time() - atualizado <= ttl
+
+    def obter(self, artista, album, campo, aceitar_vencido=False):
+        """
+        Retorna o valor guardado, None para um "não encontrado" guardado, ou AUSENTE.
+        Com aceitar_vencido=True devolve também o que já passou da validade (reserva com a API fora do ar).
+        """
+        chave = (normalizar(artista), normalizar(album), campo)
+        with self.lock:
+            entrada = self.memoria.get(chave)
+            if entrada is not None:
+                self.memoria.move_to_end(chave)
+            else:
+                linha = self.conexao.execute(
+                    "SELECT valor, atualizado FROM metadados WHERE artista=? AND album=? AND campo=?", chave).fetchone()
+                if linha is not None:
+                    entrada = (None if linha[0] is None else json.loads(linha[0]), linha[1])
+                    self._lembrar(chave, entrada)
+
+            if entrada is None or not (aceitar_vencido or self._valido(campo, *entrada)):
+                self.falhas += 1
+                resultado = AUSENTE
+            else:
+                if entrada[0] is None:
+                    self.acertos_negativos += 1
+                else:
+                    self.acertos += 1
+                resultado = entrada[0]
+        telemetria.contar(f"cache_metadados.{campo}.{'falta' if resultado is AUSENTE else 'acerto'}")
+        return resultado
+
+    def salvar(self, artista, album, campo, valor):
+        """Guarda o valor do campo; valor None registra que a API não tem o dado."""
+        chave = (normalizar(artista), normalizar(album), campo)
+        entrada = (valor, time.time())
+        with self.lock:
+            self._lembrar(chave, entrada)
+            self.conexao.execute("INSERT OR REPLACE INTO metadados VALUES (?, ?, ?, ?, ?)",
+                                 (*chave, None if valor is None else json.dumps(valor), entrada[1]))
+            self.conexao.commit()
+
+    def _lembrar(self, chave, entrada):
+        self.memoria[chave] = entrada
+        self.memoria.move_to_end(chave)
+        while len(self.memoria) > self.capacidade:
+            self.memoria.popitem(last=False)
+
+    def estatisticas(self):
+        total = self.acertos + self.acertos_negativos + self.falhas
+        return {
+            'acertos': self.acertos,
+            'acertos_negativos': self.acertos_negativos,
+            'falhas': self.falhas,
+            'taxa_acerto': (self.acertos + self.acertos_negativos) / total if total else 0.0,
+            'em_memoria': len(self.memoria),
+        }
+
+    def fechar(self):
+        with self.lock:
+            self.conexao.close()
@@ -0,0 +1,104 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from telemetria import telemetria
+
+# ================= CONFIGURAÇÃO =================
+CAPACIDADE = 1_000      # perfis guardados (LRU)
+QTD_MINIMA = 20         # top-k calculado por perfil: mexer no slider (até 20) não recalcula
+
+
+class CacheRecomendacoes:
+    """
+    Resultados de recomendação em memória por chave (perfil normalizado, pesos...) de um instantâneo do modelo.
+
+    Guarda um top-k maior que o pedido (QTD_MINIMA): pedidos com 'qtd' menor saem do prefixo. Chamadas
+    iguais ao mesmo tempo fazem um cálculo só (as outras esperam o resultado dele). Quando chega um
+    instantâneo mais novo (álbum novo, reconstrução), tudo o que estava guardado é descartado; pedidos
+    que ainda seguram um instantâneo mais antigo calculam direto, sem ler nem mexer no cache.
+    """
+
+    def __init__(self, capacidade=CAPACIDADE, qtd_minima=QTD_MINIMA):
+        self.capacidade = capacidade
+        self.qtd_minima = qtd_minima
+        self.versao = None              # instantâneo a que as entradas pertencem
+        self.entradas = OrderedDict()   # chave -> (recomendações, completo)
+        self.em_andamento = {}          # chave -> (qtd calculada, Future)
+        self.lock = threading.Lock()
+        self.acertos = 0
+        self.coalescidos = 0
+        self.falhas = 0
+        self.antigos = 0
+
+    def obter(self, versao, chave, qtd, calcular, qtd_minima=None, guardar=None):
+        """
+        As primeiras 'qtd' recomendações de 'chave' no instantâneo 'versao' (um InstantaneoModelo: a
+        'geracao' dele diz qual é o mais novo). 'calcular(n)' retorna as n primeiras e só roda quando o
+        cache não tem o bastante e nenhuma chamada igual está em andamento.
+        'qtd_minima' troca a QTD_MINIMA (0 = calcula só as 'qtd' pedidas, ex: quando calcular é caro por item).
+        'guardar()', chamado depois de 'calcular', decide se o resultado fica no cache (ex: não guardar uma
+        lista com álbuns que a API deixou sem detalhes); quem esperava pela mesma chave recebe-o de todo jeito.
+        """
+        n = max(qtd, self.qtd_minima if qtd_minima is None else qtd_minima)
+        with self.lock:
+            if self.versao is None or versao.geracao > self.versao.geracao:
+                self.versao = versao
+                self.entradas.clear()
+                self.em_andamento = {}
+            antigo = versao is not self.versao
+            if antigo:
+                self.antigos += 1
+            else:
+                entrada = self.entradas.get(chave)
+                if entrada is not None and (len(entrada[0]) >= qtd or entrada[1]):
+                    self.entradas.move_to_end(chave)
+                    self.acertos += 1
+                    telemetria.contar('cache_recomendacoes.acertos')
+                    return [dict(rec) for rec in entrada[0][:qtd]]
+                andamento = self.em_andamento.get(chave)
+                if andamento is not None and andamento[0] >= qtd:
+                    self.coalescidos += 1
+                    telemetria.contar('cache_recomendacoes.coalescidos')
+                    futuro = andamento[1]
+                else:
+                    self.falhas += 1
+                    telemetria.contar('cache_recomendacoes.falhas')
+                    andamento = (n, Future())
+                    self.em_andamento[chave] = andamento
+                    futuro = None
+
+        if antigo:
+            # Pedido que começou antes da última publicação: calcula fora do cache, que é do instantâneo novo
+            telemetria.contar('cache_recomendacoes.antigos')
+            return [dict(rec) for rec in calcular(qtd)[:qtd]]
+
+        if futuro is not None:
+            recs, completo = futuro.result()  # erro de quem calculou chega aqui também
+            return [dict(rec) for rec in recs[:qtd]]
+
+        try:
+            recs = calcular(n)
+        except Exception as e:
+            with self.lock:
+                if self.em_andamento.get(chave) is andamento: del self.em_andamento[chave]
+            andamento[1].set_exception(e)
+            raise
+        resultado = (recs, len(recs) < n)  # menos que o pedido: não há mais o que recomendar
+        with self.lock:
+            if self.em_andamento.get(chave) is andamento: del self.em_andamento[chave]
+            if versao is self.versao and (guardar is None or guardar()):
+                self.entradas[chave] = resultado
+                self.entradas.move_to_end(chave)
+                while len(self.entradas) > self.capacidade:
+                    self.entradas.popitem(last=False)
+        andamento[1].set_result(resultado)
+        return [dict(rec) for rec in recs[:qtd]]
+
+    def estatisticas(self):
+        with self.lock:
+            total = self.acertos + self.coalescidos + self.falhas
+            return {'acertos': self.acertos, 'coalescidos': self.coalescidos, 'falhas': self.falhas,
+                    'antigos': self.antigos,
+                    'taxa_acerto': (self.acertos + self.coalescidos) / total if total else 0.0,
+                    'entradas': len(self.entradas)}
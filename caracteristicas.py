@@ -0,0 +1,143 @@
+"""
+Blocos de características dos álbuns além das tags do Last.fm, tirados das colunas do CSV do RYM.
+
+    tags         -> tags do Last.fm (vêm do ingestao.py, que já tem o próprio checkpoint)
+    generos      -> primary_genres e secondary_genres          (colunas 'genero:<nome>')
+    descritores  -> descriptors                                (colunas 'descritor:<nome>')
+    notas        -> avg_rating e rating_count normalizados      (colunas 'nota:media', 'nota:popularidade')
+
+Cada bloco é uma tabela longa (Artista, Album, Tag, Peso), no mesmo formato do ingerir(), e fica
+guardado em disco com o hash das colunas do CSV que ele usa (e dos seus parâmetros) no nome: rodar o
+treino de novo só recalcula o bloco cuja entrada mudou. O peso de cada bloco na recomendação é escolhido na consulta
+(PESOS_BLOCOS), sem reconstruir o modelo nem o índice.
+
+O pandas é importado dentro das funções: o modelo (e a interface) só usa as constantes e
+validar_pesos(), e não deve pagar a importação do pandas ao abrir.
+"""
+import hashlib
+import os
+
+import numpy as np
+
+from telemetria import log
+
+# ================= CONFIGURAÇÃO =================
+DIRETORIO_CARACTERISTICAS = 'caracteristicas'
+VERSAO_BLOCOS = 1                   # mude ao alterar o cálculo de algum bloco (invalida o cache)
+PESO_GENERO_PRIMARIO = 1.0
+PESO_GENERO_SECUNDARIO = 0.5
+PESO_DESCRITOR = 1.0
+BLOCOS = ('tags', 'generos', 'descritores', 'notas')
+PREFIXOS = {'generos': 'genero:', 'descritores': 'descritor:', 'notas': 'nota:'}
+PESOS_BLOCOS = {bloco: 1.0 for bloco in BLOCOS}  # peso padrão de cada bloco na consulta
+
+
+def bloco_da_coluna(nome):
+    """Bloco de uma coluna do modelo pelo prefixo do nome; sem prefixo é tag do Last.fm."""
+    for bloco, prefixo in PREFIXOS.items():
+        if nome.startswith(prefixo): return bloco
+    return 'tags'
+
+
+def chave_equivalencia(nome):
+    """Nome sem prefixo, caixa, acentos, espaços e pontuação: 'Post-Rock', 'post rock' e 'genero:Postrock' casam."""
+    from indice_nomes import normalizar
+    for prefixo in PREFIXOS.values():
+        if nome.startswith(prefixo):
+            nome = nome[len(prefixo):]
+            break
+    return ''.join(c for c in normalizar(nome) if c.isalnum())
+
+
+def validar_pesos(pesos):
+    desconhecidos = set(pesos) - set(BLOCOS)
+    if desconhecidos: raise ValueError(f"blocos desconhecidos: {sorted(desconhecidos)}")
+    return {bloco: float(pesos.get(bloco, PESOS_BLOCOS[bloco])) for bloco in BLOCOS}
+
+
+def hash_colunas(df, colunas):
+    import pandas as pd
+    # Hash vetorizado das linhas (pandas) e depois um sha256 só sobre os hashes
+    linhas = pd.util.hash_pandas_object(df[list(colunas)], index=False).to_numpy()
+    return hashlib.sha256(linhas.tobytes()).hexdigest()
+
+
+def _explodir(df, coluna, prefixo, peso):
+    import pandas as pd
+    # Split vetorizado: "Art Rock, Electronic" -> uma linha por item, sem iterrows
+    texto = df[coluna].astype('string')  # 'NA' e vazios do CSV viram ausentes
+    itens = texto.where(texto != 'NA').str.split(',')
+    longo = pd.DataFrame({'Artista': df['artist_name'].to_numpy(), 'Album': df['release_name'].to_numpy(),
+                          'Tag': itens.to_numpy()}).explode('Tag')
+    longo['Tag'] = longo['Tag'].str.strip()
+    longo = longo[longo['Tag'].notna() & (longo['Tag'] != '')]
+    longo['Tag'] = prefixo + longo['Tag']
+    longo['Peso'] = peso
+    return longo
+
+
+def _bloco_generos(df):
+    import pandas as pd
+    return pd.concat([_explodir(df, 'primary_genres', PREFIXOS['generos'], PESO_GENERO_PRIMARIO),
+                      _explodir(df, 'secondary_genres', PREFIXOS['generos'], PESO_GENERO_SECUNDARIO)],
+                     ignore_index=True)
+
+
+def _bloco_descritores(df):
+    return _explodir(df, 'descriptors', PREFIXOS['descritores'], PESO_DESCRITOR).reset_index(drop=True)
+
+
+def _bloco_notas(df, maximo_votos=None):
+    # maximo_votos: log1p do maior número de votos; None usa o do próprio df (o treino em fluxo passa 1.0
+    # e normaliza a coluna no fim, quando o máximo do arquivo inteiro é conhecido)
+    import pandas as pd
+    media = pd.to_numeric(df['avg_rating'], errors='coerce').to_numpy(dtype=np.float64)
+    votos = np.log1p(pd.to_numeric(df['rating_count'], errors='coerce').to_numpy(dtype=np.float64))
+    if maximo_votos is None: maximo_votos = np.nanmax(votos, initial=0.0) or 1.0
+    partes = []
+    for nome, valores in (('media', media / 5.0), ('popularidade', votos / maximo_votos)):
+        validos = np.isfinite(valores) & (valores > 0)
+        partes.append(pd.DataFrame({'Artista': df['artist_name'].to_numpy()[validos],
+                                    'Album': df['release_name'].to_numpy()[validos],
+                                    'Tag': PREFIXOS['notas'] + nome, 'Peso': valores[validos]}))
+    return pd.concat(partes, ignore_index=True)
+
+
+# bloco -> (função, colunas do CSV que ela lê, parâmetros que entram na chave do cache)
+CONSTRUTORES = {
+    'generos': (_bloco_generos, ('primary_genres', 'secondary_genres'),
+                (PESO_GENERO_PRIMARIO, PESO_GENERO_SECUNDARIO)),
+    'descritores': (_bloco_descritores, ('descriptors',), (PESO_DESCRITOR,)),
+    'notas': (_bloco_notas, ('avg_rating', 'rating_count'), ()),
+}
+
+
+def construir_blocos(df_csv, blocos=tuple(CONSTRUTORES), diretorio=DIRETORIO_CARACTERISTICAS):
+    """
+    Blocos do CSV como {bloco: DataFrame(Artista, Album, Tag, Peso)}; 'df_csv' são as linhas já
+    deduplicadas por (artista, título). Bloco cujas colunas de entrada e parâmetros não mudaram
+    é lido de 'diretorio' (o cache) em vez de recalculado.
+    """
+    import pandas as pd
+    os.makedirs(diretorio, exist_ok=True)
+    resultado = {}
+    for bloco in blocos:
+        construtor, colunas, parametros = CONSTRUTORES[bloco]
+        entrada = hash_colunas(df_csv, ('artist_name', 'release_name') + colunas)
+        chave = hashlib.sha256(repr((VERSAO_BLOCOS, bloco, parametros, entrada)).encode()).hexdigest()[:16]
+        caminho = os.path.join(diretorio, f"{bloco}_{chave}.pkl")
+        if os.path.exists(caminho):
+            resultado[bloco] = pd.read_pickle(caminho)
+            log(f"   bloco '{bloco}': do cache ({len(resultado[bloco])} entradas)")
+            continue
+
+        resultado[bloco] = construtor(df_csv)
+        temporario = f"{caminho}.tmp"
+        resultado[bloco].to_pickle(temporario)
+        os.replace(temporario, caminho)
+        # Versões antigas do mesmo bloco não voltam a ser usadas
+        for nome in os.listdir(diretorio):
+            if nome.startswith(f"{bloco}_") and nome != os.path.basename(caminho):
+                os.remove(os.path.join(diretorio, nome))
+        log(f"   bloco '{bloco}': calculado ({len(resultado[bloco])} entradas)")
+    return resultado
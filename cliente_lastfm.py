@@ -0,0 +1,251 @@
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, TimeoutError
+
+from cache_metadados import AUSENTE
+from indice_nomes import normalizar
+from telemetria import log, telemetria
+
+# ================= CONFIGURAÇÃO =================
+TAXA_REQUISICOES = 5.0      # requisições/s permitidas pelo Last.fm (média)
+RAJADA_REQUISICOES = 20     # requisições que podem sair de uma vez antes do limite agir
+MAX_WORKERS = 20            # requisições simultâneas no pool compartilhado (= máximo de recomendações)
+TIMEOUT_REQUISICAO = 10.0   # segundos que uma requisição pode levar antes de ser abandonada
+
+
+class LimitadorTaxa:
+    """Token bucket thread-safe: 'taxa' fichas por segundo, acumulando até 'capacidade'."""
+
+    def __init__(self, taxa=TAXA_REQUISICOES, capacidade=RAJADA_REQUISICOES):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.fichas = float(capacidade)
+        self.ultimo = time.monotonic()
+        self.lock = threading.Lock()
+
+    def adquirir(self, timeout=None):
+        """Bloqueia até conseguir uma ficha. Retorna False se o timeout acabar antes."""
+        limite = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                agora = time.monotonic()
+                self.fichas = min(self.capacidade, self.fichas + (agora - self.ultimo) * self.taxa)
+                self.ultimo = agora
+                if self.fichas >= 1:
+                    self.fichas -= 1
+                    return True
+                espera = (1 - self.fichas) / self.taxa
+
+            if limite is not None:
+                if agora + espera > limite: return False
+            time.sleep(espera)
+
+
+# Compartilhados por todos os chamadores do processo (interface, servidor, scripts)
+limitador_global = LimitadorTaxa()
+executor_global = ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix='lastfm')
+
+_prazos = threading.local()
+
+
+@contextmanager
+def prazo_requisicoes(segundos):
+    """
+    Dentro do bloco, as requisições desta thread terminam em até 'segundos' (contados a partir de agora):
+    a RedeHttp limita o timeout do HTTP ao que sobra e a RedeResiliente não tenta de novo depois dele.
+    Blocos aninhados ficam com o prazo mais curto.
+    """
+    anterior = getattr(_prazos, 'fim', None)
+    fim = time.monotonic() + segundos
+    _prazos.fim = fim if anterior is None else min(anterior, fim)
+    try:
+        yield
+    finally:
+        _prazos.fim = anterior
+
+
+def tempo_restante():
+    """Segundos até o prazo da thread (pode ser <= 0), ou None fora de um prazo_requisicoes."""
+    fim = getattr(_prazos, 'fim', None)
+    return None if fim is None else fim - time.monotonic()
+
+
+def detalhar_album(network, rec, limitador=limitador_global, timeout=TIMEOUT_REQUISICAO, cache=None):
+    """
+    Completa uma recomendação ({'album', 'artist', 'score', ...}) com a capa (uma requisição ao Last.fm,
+    ou nenhuma se estiver no cache). O artista já vem do modelo; só álbuns sem artista o buscam pelo título.
+    'timeout' vale para tudo: a espera no limitador e as requisições (inclusive novas tentativas).
+    """
+    titulo, artista = rec['album'], rec.get('artist') or ''
+    if cache is not None:
+        image_url = cache.obter(artista, titulo, 'capa')
+        if artista and image_url is not AUSENTE:
+            return dict(rec, image_url=image_url)
+        if not artista:
+            artist_name = cache.obter('', titulo, 'artista')
+            if artist_name is not AUSENTE and image_url is not AUSENTE:
+                return dict(rec, artist=artist_name or "Desconhecido", image_url=image_url)
+
+    with prazo_requisicoes(timeout):
+        with telemetria.span('api.espera_limite'):
+            restante = tempo_restante()
+            if restante <= 0 or not limitador.adquirir(restante):
+                raise TimeoutError("limite de requisições")
+        return _detalhar_pela_api(network, rec, titulo, artista, cache)
+
+
+def _detalhar_pela_api(network, rec, titulo, artista, cache):
+    telemetria.contar('api.chamadas')
+    if artista:
+        # Álbum exato pelo par (artista, título): sem a busca por nome, que pode escolher outro artista
+        def chamar():
+            with telemetria.span('api.capa'):
+                image_url = network.get_album(artista, titulo).get_cover_image(size=3)
+            if cache is not None: cache.salvar(artista, titulo, 'capa', image_url)
+            return image_url
+        return dict(rec, image_url=_com_reserva(cache, artista, titulo, 'capa', chamar))
+
+    # Álbum sem artista (modelos antigos): busca direta pelo título, fica com o primeiro resultado
+    with telemetria.span('api.busca'):
+        res = network.search_for_album(titulo)
+        page = res.get_next_page()
+
+    if page:
+        best_match = page[0]
+        artist_name = best_match.artist.name
+        image_url = best_match.get_cover_image(size=3)
+    else:
+        artist_name = None
+        image_url = None
+
+    if cache is not None:
+        cache.salvar('', titulo, 'artista', artist_name)
+        cache.salvar('', titulo, 'capa', image_url)
+
+    return dict(rec, artist=artist_name or "Desconhecido", image_url=image_url)
+
+
+def _com_reserva(cache, artista, album, campo, chamar):
+    """
+    Resultado de 'chamar()'; se a API falhar (fora do ar, disjuntor aberto), o valor vencido do cache
+    serve de reserva. Sem nada guardado, o erro segue para quem chamou.
+    """
+    try:
+        return chamar()
+    except Exception:
+        reserva = AUSENTE if cache is None else cache.obter(artista, album, campo, aceitar_vencido=True)
+        if reserva is AUSENTE: raise
+        telemetria.contar('api.reserva_cache')
+        return reserva
+
+
+def _tags_da_api(top_tags):
+    return [(t.item.get_name(), int(t.weight)) for t in top_tags] or None
+
+
+# Tags de artista em andamento: álbuns do mesmo artista sem tags próprias esperam a mesma chamada
+_artistas_em_andamento = {}
+_lock_artistas = threading.Lock()
+
+
+def _tags_do_artista(network, artista, limite, cache):
+    chave = (normalizar(artista), limite)
+    with _lock_artistas:
+        futuro = _artistas_em_andamento.get(chave)
+        dono = futuro is None
+        if dono: futuro = _artistas_em_andamento[chave] = Future()
+    if not dono:
+        telemetria.contar('api.artista_compartilhado')
+        return futuro.result()
+
+    try:
+        tags = AUSENTE if cache is None else cache.obter(artista, '', 'tags')
+        if tags is AUSENTE:
+            def chamar():
+                limitador_global.adquirir()
+                telemetria.contar('api.chamadas')
+                with telemetria.span('api.tags'):
+                    tags = _tags_da_api(network.get_artist(artista).get_top_tags(limit=limite))
+                if cache is not None: cache.salvar(artista, '', 'tags', tags)
+                return tags
+            tags = _com_reserva(cache, artista, '', 'tags', chamar)
+    except Exception as e:
+        futuro.set_exception(e)
+        raise
+    else:
+        futuro.set_result(tags)
+        return tags
+    finally:
+        # Quem chegar depois já acha o resultado no cache
+        with _lock_artistas:
+            del _artistas_em_andamento[chave]
+
+
+def buscar_tags(network, artista, album, limite=3, cache=None, fallback_artista=True):
+    """
+    Top tags do álbum como [(nome, peso)], usando o cache quando possível.
+    Sem tags no álbum, tenta as do artista (se 'fallback_artista'); chamadas simultâneas para o mesmo
+    artista viram uma só. Com a API fora do ar, usa o que houver no cache mesmo vencido.
+    """
+    tags = AUSENTE if cache is None else cache.obter(artista, album, 'tags')
+    if tags is AUSENTE:
+        def chamar():
+            limitador_global.adquirir()
+            telemetria.contar('api.chamadas')
+            with telemetria.span('api.tags'):
+                tags = _tags_da_api(network.get_album(artista, album).get_top_tags(limit=limite))
+            if cache is not None: cache.salvar(artista, album, 'tags', tags)
+            return tags
+        tags = _com_reserva(cache, artista, album, 'tags', chamar)
+
+    if not tags and fallback_artista:
+        log("[Backend] Sem tags no álbum. Tentando artista...")
+        tags = _tags_do_artista(network, artista, limite, cache)
+
+    return tags or []
+
+
+def detalhar_albuns(network, recs, ao_detalhar=None, timeout=TIMEOUT_REQUISICAO,
+                    limitador=limitador_global, executor=executor_global, cache=None, ao_falhar=None):
+    """
+    Detalha (capa, e artista se faltar) uma lista de recomendações {'album', 'artist', 'score', ...} em paralelo.
+    'ao_detalhar(posicao, item)' é chamado assim que cada álbum fica pronto; o retorno mantém a ordem
+    de 'recs'. Álbuns que dão erro ou não respondem dentro do prazo entram sem detalhes, e
+    'ao_falhar(posicao)' é chamado para cada um (ex: para não guardar a lista num cache).
+    """
+    # O prazo considera a fila do limitador: quem espera ficha não pode ser penalizado pelo timeout
+    prazo = timeout + len(recs) / limitador.taxa
+    fim = time.monotonic() + prazo
+
+    def detalhar(rec):
+        # Quem ficou na fila do pool só tem o que sobrou do prazo: ninguém trabalha depois que desistimos dele
+        return detalhar_album(network, rec, limitador, fim - time.monotonic(), cache)
+
+    futuros = {executor.submit(detalhar, rec): i for i, rec in enumerate(recs)}
+
+    final_recs = [None] * len(recs)
+    try:
+        for futuro in as_completed(futuros, timeout=prazo):
+            i = futuros[futuro]
+            try:
+                final_recs[i] = futuro.result()
+            except Exception as e:
+                log(f"[Backend] Erro ao detalhar {recs[i]['album']}: {e}")
+                # Caso nao encontrar as informações, adiciona mesmo sem detalhes para não perder a recomendação
+                final_recs[i] = _sem_detalhes(recs[i])
+                if ao_falhar: ao_falhar(i)
+            if ao_detalhar: ao_detalhar(i, final_recs[i])
+    except TimeoutError:
+        log(f"[Backend] Timeout: {final_recs.count(None)} álbuns ficaram sem detalhes.")
+
+    for i, rec in enumerate(recs):
+        if final_recs[i] is None:
+            final_recs[i] = _sem_detalhes(rec)
+            if ao_falhar: ao_falhar(i)
+            if ao_detalhar: ao_detalhar(i, final_recs[i])
+    return final_recs
+
+
+def _sem_detalhes(rec):
+    return dict(rec, artist=rec.get('artist') or '?', image_url=None)
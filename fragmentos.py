@@ -0,0 +1,252 @@
+"""
+Busca exata fragmentada entre processos (usada pelo IndiceFragmentado, tipo de índice 'fragmentado').
+
+A matriz TF-IDF é dividida em faixas de linhas com o mesmo número de entradas, uma por processo; cada
+processo calcula o top-k da sua faixa e o coordenador fica com o top-k dos parciais.
+
+    - A matriz não é copiada para os processos: cada um abre a sua faixa com np.memmap. Arrays que já
+      são np.memmap de arquivo (o pacote do modelo) são abertos direto do mesmo arquivo (páginas
+      compartilhadas pelo cache do sistema); os demais são gravados uma vez num arquivo temporário,
+      apagado assim que todos os processos o abriram.
+    - Consultas e respostas trafegam como bytes crus pelos Pipes (send_bytes/recv_bytes), sem pickle;
+      o pickle só aparece ao anexar uma matriz nova.
+    - Uma thread despachante junta num lote as consultas que chegam enquanto o lote anterior roda (como
+      a thread escritora do backend_logic): cada processo faz um produto faixa x lote por vez.
+
+Cada matriz publicada é uma geração. Os processos mantêm as GERACOES_MANTIDAS últimas, para um
+instantâneo de antes de uma reconstrução continuar sendo atendido; consulta a uma geração já
+descartada falha com LookupError (e o índice responde no próprio processo).
+"""
+import multiprocessing
+import os
+import pickle
+import queue
+import struct
+import tempfile
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from indices_vizinhos import _top_k, _top_k_colunas
+
+# ================= CONFIGURAÇÃO =================
+GERACOES_MANTIDAS = 2       # matrizes mantidas abertas nos processos (a atual e a anterior)
+MAX_CONSULTAS_LOTE = 256    # consultas juntadas numa mesma ida aos processos
+
+_CABECALHO = struct.Struct('<5q')  # tipo, geração, consultas, colunas, k
+_CONSULTAR, _ANEXAR, _SAIR = 0, 1, 2
+
+
+def _abrir_array(descricao):
+    caminho, tipo, offset, n = descricao
+    if n == 0: return np.zeros(0, dtype=tipo)
+    return np.memmap(caminho, dtype=tipo, mode='r', offset=offset, shape=(n,))
+
+
+def _abrir_faixa(descricao, inicio, fim, n_colunas):
+    data, indices, indptr = (_abrir_array(d) for d in descricao)
+    ponteiros = np.asarray(indptr[inicio:fim + 1], dtype=np.int64)
+    a, b = ponteiros[0], ponteiros[-1]
+    faixa = csr_matrix((fim - inicio, n_colunas))
+    # Atribuição direta, como no MatrizIncremental.como_csr: o construtor copiaria os memmaps
+    faixa.data, faixa.indices, faixa.indptr = data[a:b], indices[a:b], (ponteiros - a).astype(np.int32)
+    return faixa
+
+
+def _top_k_faixa(faixa, consultas, k):
+    # (m x k) linhas da faixa e similaridades; vagas além das linhas da faixa ficam com -1 e -inf
+    linhas = np.full((consultas.shape[0], k), -1, dtype=np.int64)
+    sims = np.full((consultas.shape[0], k), -np.inf)
+    if faixa.shape[0] and k:
+        posicoes, valores = _top_k_colunas(np.asarray(faixa @ consultas.T), k)
+        linhas[:, :posicoes.shape[1]], sims[:, :valores.shape[1]] = posicoes, valores
+    return linhas, sims
+
+
+def _laco_fragmento(conexao):
+    """Processo de um fragmento: responde consultas sobre a sua faixa de cada geração anexada."""
+    faixas = {}  # geração -> (primeira linha, csr da faixa)
+    while True:
+        mensagem = conexao.recv_bytes()
+        tipo, geracao, m, n_colunas, k = _CABECALHO.unpack_from(mensagem)
+        if tipo == _SAIR: return
+        if tipo == _ANEXAR:
+            descricao, inicio, fim, manter = pickle.loads(mensagem[_CABECALHO.size:])
+            faixas[geracao] = (inicio, _abrir_faixa(descricao, inicio, fim, n_colunas))
+            for antiga in set(faixas) - set(manter): del faixas[antiga]
+            conexao.send_bytes(b'')
+            continue
+        inicio, faixa = faixas[geracao]
+        consultas = np.frombuffer(mensagem, dtype=np.float64, offset=_CABECALHO.size).reshape(m, n_colunas)
+        linhas, sims = _top_k_faixa(faixa, consultas, k)
+        linhas[linhas >= 0] += inicio
+        conexao.send_bytes(linhas.tobytes() + sims.tobytes())
+
+
+def _origem_memmap(array):
+    """(arquivo, tipo, offset, n) se o array é um trecho contíguo de um np.memmap somente leitura; senão None."""
+    raiz, atual = None, array
+    while isinstance(atual, np.ndarray):
+        if isinstance(atual, np.memmap): raiz = atual
+        atual = atual.base
+    if raiz is None or not raiz.filename or raiz.mode not in ('r', 'r+') or not array.flags.c_contiguous:
+        return None
+    deslocamento = array.__array_interface__['data'][0] - raiz.__array_interface__['data'][0]
+    return raiz.filename, array.dtype.str, raiz.offset + deslocamento, len(array)
+
+
+def _descrever(matriz):
+    """Descrição dos arrays da matriz para os processos e os arquivos temporários a apagar depois de abertos."""
+    descricao, temporarios = [], []
+    for array in (matriz.data, matriz.indices, matriz.indptr):
+        origem = _origem_memmap(array)
+        if origem is None:
+            fd, caminho = tempfile.mkstemp(prefix='fragmento_', suffix='.bin')
+            with os.fdopen(fd, 'wb') as f:
+                np.ascontiguousarray(array).tofile(f)
+            origem = (caminho, array.dtype.str, 0, len(array))
+            temporarios.append(caminho)
+        descricao.append(origem)
+    return descricao, temporarios
+
+
+def _faixas(indptr, n):
+    # n faixas de linhas consecutivas com ~o mesmo número de entradas (o custo do produto é proporcional a elas)
+    n_linhas = len(indptr) - 1
+    cortes = np.searchsorted(indptr, np.linspace(0, indptr[-1], n + 1), side='left')
+    cortes[0], cortes[-1] = 0, n_linhas
+    cortes = np.minimum(np.maximum.accumulate(cortes), n_linhas)
+    return [(int(a), int(b)) for a, b in zip(cortes[:-1], cortes[1:])]
+
+
+class PoolFragmentos:
+    """Processos dos fragmentos e a thread despachante que conversa com eles."""
+
+    def __init__(self, n_processos):
+        # 'spawn': fork com threads vivas (interface, servidor) pode herdar travas presas
+        contexto = multiprocessing.get_context('spawn')
+        self.conexoes, self.processos = [], []
+        for i in range(n_processos):
+            nossa, deles = contexto.Pipe()
+            processo = contexto.Process(target=_laco_fragmento, args=(deles,), name=f'fragmento-{i}', daemon=True)
+            processo.start()
+            deles.close()
+            self.conexoes.append(nossa)
+            self.processos.append(processo)
+        self.geracoes = {}          # geração mantida -> número de colunas
+        self.proxima_geracao = 0
+        self.quebrado = False
+        self.fila = queue.Queue()
+        threading.Thread(target=self._laco_despachante, name='despachante-fragmentos', daemon=True).start()
+
+    def __len__(self):
+        return len(self.conexoes)
+
+    def tem(self, geracao):
+        return not self.quebrado and geracao in self.geracoes
+
+    def publicar(self, matriz):
+        """Anexa a matriz como uma geração nova nos processos; retorna a geração."""
+        pedido = Future()
+        self.fila.put((_ANEXAR, matriz, pedido))
+        return pedido.result()
+
+    def consultar(self, geracao, consultas, k):
+        """Future de (linhas, similaridades), ambos (consultas x k); 'consultas' já normalizadas."""
+        pedido = Future()
+        self.fila.put((_CONSULTAR, (geracao, consultas, k), pedido))
+        return pedido
+
+    def fechar(self):
+        self.fila.put((_SAIR, None, None))
+
+    def _laco_despachante(self):
+        while True:
+            lote = [self.fila.get()]
+            while len(lote) < MAX_CONSULTAS_LOTE:
+                try:
+                    lote.append(self.fila.get_nowait())
+                except queue.Empty:
+                    break
+            # Consultas antes das anexações do mesmo lote: a geração que elas pedem ainda está mantida
+            por_geracao = {}
+            for tipo, dados, pedido in lote:
+                if tipo == _CONSULTAR: por_geracao.setdefault(dados[0], []).append((dados, pedido))
+            for geracao, pedidos in por_geracao.items():
+                self._atender(geracao, pedidos)
+            for tipo, dados, pedido in lote:
+                if tipo == _ANEXAR:
+                    self._executar(pedido, self._anexar, dados)
+                elif tipo == _SAIR:
+                    self._encerrar()
+                    return
+
+    def _executar(self, pedido, funcao, *args):
+        try:
+            pedido.set_result(funcao(*args))
+        except Exception as e:
+            if isinstance(e, (OSError, EOFError)): self.quebrado = True  # processo morto: o índice cria outro pool
+            pedido.set_exception(e)
+
+    def _atender(self, geracao, pedidos):
+        if not self.tem(geracao):
+            erro = LookupError(f"geração {geracao} não está mais nos processos")
+            for _, pedido in pedidos: pedido.set_exception(erro)
+            return
+        k = max(dados[2] for dados, _ in pedidos)
+        consultas = np.vstack([dados[1] for dados, _ in pedidos])
+        resultado = Future()
+        self._executar(resultado, self._consultar_lote, geracao, consultas, k)
+        if resultado.exception() is not None:
+            for _, pedido in pedidos: pedido.set_exception(resultado.exception())
+            return
+        linhas, sims = resultado.result()
+        inicio = 0
+        for (_, consultas_pedido, k_pedido), pedido in pedidos:
+            fim = inicio + consultas_pedido.shape[0]
+            pedido.set_result((linhas[inicio:fim, :k_pedido], sims[inicio:fim, :k_pedido]))
+            inicio = fim
+
+    def _consultar_lote(self, geracao, consultas, k):
+        n_colunas = self.geracoes[geracao]
+        m = consultas.shape[0]
+        # Colunas (tags) criadas depois da geração não existem nas linhas dela: ficam de fora da consulta
+        lote = np.zeros((m, n_colunas))
+        lote[:, :min(n_colunas, consultas.shape[1])] = consultas[:, :n_colunas]
+        mensagem = _CABECALHO.pack(_CONSULTAR, geracao, m, n_colunas, k) + lote.tobytes()
+        for conexao in self.conexoes:
+            conexao.send_bytes(mensagem)
+        partes = [conexao.recv_bytes() for conexao in self.conexoes]  # os processos calculam em paralelo
+        linhas = np.hstack([np.frombuffer(p, dtype=np.int64, count=m * k).reshape(m, k) for p in partes])
+        sims = np.hstack([np.frombuffer(p, dtype=np.float64, offset=m * k * 8).reshape(m, k) for p in partes])
+        posicoes, sims = _top_k(sims, k)
+        return np.take_along_axis(linhas, posicoes, axis=1), sims
+
+    def _anexar(self, matriz):
+        geracao = self.proxima_geracao
+        self.proxima_geracao += 1
+        manter = sorted(self.geracoes)[len(self.geracoes) - GERACOES_MANTIDAS + 1:] + [geracao]
+        descricao, temporarios = _descrever(matriz)
+        try:
+            for conexao, (inicio, fim) in zip(self.conexoes, _faixas(matriz.indptr, len(self.conexoes))):
+                conexao.send_bytes(_CABECALHO.pack(_ANEXAR, geracao, 0, matriz.shape[1], 0)
+                                   + pickle.dumps((descricao, inicio, fim, manter)))
+            for conexao in self.conexoes:
+                conexao.recv_bytes()
+        finally:
+            for caminho in temporarios:
+                os.remove(caminho)  # os processos já o mapearam: o conteúdo vive até eles o soltarem
+        self.geracoes = {g: self.geracoes.get(g, matriz.shape[1]) for g in manter}
+        return geracao
+
+    def _encerrar(self):
+        for conexao in self.conexoes:
+            try:
+                conexao.send_bytes(_CABECALHO.pack(_SAIR, 0, 0, 0, 0))
+            except OSError:
+                pass
+        for processo in self.processos:
+            processo.join(timeout=5)
+        self.quebrado = True
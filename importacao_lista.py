@@ -0,0 +1,77 @@
+"""
+Importação de listas de álbuns de um arquivo (menu "Arquivo" da interface).
+
+    .csv    -> uma coluna de título (release_name, como no CSV do treino, titulo ou album) e, opcional,
+               uma de artista (artist_name, artista ou artist)
+    outros  -> um álbum por linha: "Artista - Título" (separa no primeiro " - ") ou só o título;
+               linhas vazias e começadas com '#' são ignoradas
+
+Os álbuns que já estão no modelo saem primeiro, na ordem do arquivo; os que faltam vão ao Last.fm em
+paralelo e chegam conforme ficam prontos (cada um entra no modelo, como um álbum escolhido na busca).
+"""
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from telemetria import log, telemetria
+
+# ================= CONFIGURAÇÃO =================
+COLUNAS_TITULO = ('release_name', 'titulo', 'título', 'album', 'álbum')
+COLUNAS_ARTISTA = ('artist_name', 'artista', 'artist')
+SEPARADOR = ' - '
+WORKERS_IMPORTACAO = 4      # álbuns buscados no Last.fm ao mesmo tempo (o limitador do cliente_lastfm vale igual)
+
+
+def _coluna(campos, nomes):
+    por_nome = {campo.strip().casefold(): campo for campo in campos or ()}
+    return next((por_nome[nome] for nome in nomes if nome in por_nome), None)
+
+
+def ler_lista(caminho):
+    """[(titulo, artista)] do arquivo, na ordem, sem repetidos; artista '' quando o arquivo não diz."""
+    entradas = []
+    with open(caminho, newline='', encoding='utf-8-sig') as f:
+        if os.path.splitext(caminho)[1].lower() == '.csv':
+            leitor = csv.DictReader(f)
+            col_titulo = _coluna(leitor.fieldnames, COLUNAS_TITULO)
+            col_artista = _coluna(leitor.fieldnames, COLUNAS_ARTISTA)
+            if col_titulo is None: raise ValueError(f"{caminho}: nenhuma coluna de título ({', '.join(COLUNAS_TITULO)})")
+            for linha in leitor:
+                titulo = (linha.get(col_titulo) or '').strip()
+                if titulo: entradas.append((titulo, (linha.get(col_artista) or '').strip() if col_artista else ''))
+        else:
+            for linha in f:
+                linha = linha.strip()
+                if not linha or linha.startswith('#'): continue
+                artista, separou, titulo = linha.partition(SEPARADOR)
+                entradas.append((titulo.strip(), artista.strip()) if separou else (linha, ''))
+    return list(dict.fromkeys(entradas))
+
+
+@telemetria.cronometrar('importacao')
+def importar(sistema, entradas, ao_importar, cancelar=None, workers=WORKERS_IMPORTACAO):
+    """
+    Resolve as entradas com sistema.resolver_album e chama ao_importar(album) para cada álbum achado
+    (na thread que importa ou numa do pool). 'cancelar' (threading.Event) faz as entradas que ainda
+    não começaram serem puladas. Retorna as entradas não encontradas.
+    """
+    faltando = []
+    for titulo, artista in entradas:
+        if cancelar is not None and cancelar.is_set(): return faltando
+        album = sistema.resolver_album(titulo, artista, usar_api=False)
+        if album:
+            ao_importar(album)
+        else:
+            faltando.append((titulo, artista))
+    if not faltando: return []
+    log(f"[Importação] {len(entradas) - len(faltando)} álbum(ns) do cache; buscando {len(faltando)} no Last.fm...")
+
+    def buscar(entrada):
+        if cancelar is not None and cancelar.is_set(): return None
+        album = sistema.resolver_album(*entrada)
+        if album: ao_importar(album)
+        return album
+
+    with ThreadPoolExecutor(workers, thread_name_prefix='importacao') as executor:
+        albuns = list(executor.map(buscar, faltando))
+    return [entrada for entrada, album in zip(faltando, albuns) if album is None]
@@ -0,0 +1,709 @@
+"""
+Índices de vizinhos mais próximos (cosseno) sobre a matriz TF-IDF normalizada.
+
+Todos seguem a mesma interface, no formato do NearestNeighbors do scikit-learn:
+    construir(matriz)              -> indexa a matriz inteira
+    atualizar(matriz, novas=())    -> troca a matriz (que cresceu) e indexa só as linhas novas
+    instantaneo()                  -> cópia somente leitura, imune a atualizações posteriores
+    kneighbors(X, n_neighbors)     -> (distancias, indices)
+    salvar(pasta) / carregar(pasta, matriz) -> persistência junto do pacote do modelo
+
+'exato' é a busca por força bruta (referência). 'ivf' é aproximado: agrupa os álbuns em listas
+(k-means esférico) e só compara a consulta com as listas cujos centróides são mais próximos.
+'fragmentado' é a mesma busca exata dividida entre processos, um por núcleo (fragmentos.py).
+'compacto' varre uma projeção densa e pequena das linhas (SVD ou aleatória, em int8 ou float16) e
+reavalia os melhores candidatos com o cosseno exato.
+
+TabelaVizinhos é outra coisa: os k vizinhos de cada álbum do catálogo, calculados de antemão.
+"""
+import copy
+import os
+
+import numpy as np
+from scipy.sparse import csr_matrix, issparse
+
+# ================= CONFIGURAÇÃO =================
+N_SONDAS_IVF = 16              # listas visitadas por consulta (mais sondas = mais recall, mais lento)
+FRACAO_COBERTA = 0.5           # linhas com menos que isso do peso (L2²) em colunas conhecidas pelo treino (centróides
+                               # do IVF, projeção do compacto) ficam numa lista à parte, varrida por toda consulta
+AMOSTRA_TREINO_IVF = 50_000    # álbuns usados para treinar os centróides
+BLOCO_ATRIBUICAO = 65_536      # linhas por bloco ao atribuir álbuns às listas (limita a memória)
+ELEMENTOS_BLOCO_TABELA = 1 << 24  # similaridades calculadas de uma vez ao montar a tabela (float64: 128 MB)
+DELTA_MINIMO_TABELA = 1024     # listas alteradas por inserções antes de fundi-las numa base nova
+MIN_LINHAS_FRAGMENTADO = 50_000  # abaixo disso a ida e volta aos processos custa mais que a busca
+AMOSTRA_TOP_K = 4              # amostra de AMOSTRA_TOP_K*sqrt(k*n) linhas para estimar o corte do top-k
+DIMENSOES_COMPACTO = 64        # colunas da projeção do índice compacto
+METODO_COMPACTO = 'projecao'   # 'projecao' (aleatória) ou 'svd'; o SVD junta álbuns do mesmo gênero e perde mais recall@k
+PRECISAO_COMPACTO = 'int8'     # 'int8' (1 byte por coluna + escala por linha) ou 'float16'
+FATOR_CANDIDATOS = 100         # o índice compacto reavalia k * FATOR_CANDIDATOS candidatos no TF-IDF (0 = não reavalia)
+AMOSTRA_TREINO_SVD = 50_000    # álbuns usados para treinar a projeção SVD
+BLOCO_COMPACTO = 4096          # linhas convertidas para float32 de uma vez (cabem no cache: ~3x mais rápido que 128k)
+
+
+def _normalizar_consulta(X):
+    X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+    normas = np.linalg.norm(X, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return X / normas
+
+
+def normalizar_linhas(matriz, copiar=True):
+    """
+    Cada linha com norma L2 = 1 (linhas zeradas continuam zeradas), como o normalize do scikit-learn.
+    Fica aqui para o caminho de consulta não importar o scikit-learn (só a construção do IVF o usa).
+    """
+    if not issparse(matriz): return _normalizar_consulta(matriz)
+    matriz = csr_matrix(matriz, dtype=np.float64, copy=copiar)
+    linhas = np.repeat(np.arange(matriz.shape[0]), np.diff(matriz.indptr))
+    normas = np.sqrt(np.bincount(linhas, weights=matriz.data ** 2, minlength=matriz.shape[0]))
+    normas[normas == 0] = 1.0
+    matriz.data /= normas[linhas]
+    return matriz
+
+
+def _top_k(similaridades, k):
+    # Top-k por linha, ordenado do mais parecido para o menos
+    k = min(k, similaridades.shape[1])
+    candidatos = np.argpartition(-similaridades, k - 1, axis=1)[:, :k]
+    sims_candidatos = np.take_along_axis(similaridades, candidatos, axis=1)
+    ordem = np.argsort(-sims_candidatos, axis=1, kind='stable')
+    return np.take_along_axis(candidatos, ordem, axis=1), np.take_along_axis(sims_candidatos, ordem, axis=1)
+
+
+def _top_k_colunas(similaridades, k):
+    """
+    _top_k de cada coluna de 'similaridades' (n x consultas, o formato de matriz @ X.T), sem transpor.
+    O k-ésimo maior de uma amostra de linhas é um limite inferior do k-ésimo maior da coluna: só quem
+    passa dele é ordenado (~sqrt(k*n) candidatos em vez de um argpartition sobre n, como no
+    recomendar_lote). Colunas cujo limite é <= 0 (consultas com poucas tags em comum com o catálogo,
+    muitas similaridades zeradas empatadas) vão pelo _top_k.
+    """
+    n, m = similaridades.shape
+    k = min(k, n)
+    passo = max(1, int(n / (AMOSTRA_TOP_K * np.sqrt(max(k, 1) * n))))
+    if k == 0 or passo == 1: return _top_k(similaridades.T, k)
+    amostra = similaridades[::passo]
+    limiar = np.partition(amostra, amostra.shape[0] - k, axis=0)[-k]
+    linhas_top = np.empty((m, k), dtype=np.int64)
+    sims_top = np.empty((m, k))
+    diretas = np.flatnonzero(limiar <= 0)
+    if len(diretas):
+        linhas_top[diretas], sims_top[diretas] = _top_k(np.ascontiguousarray(similaridades[:, diretas].T), k)
+        limiar[diretas] = np.inf
+    linha_c, coluna_c = np.divmod(np.flatnonzero(similaridades >= limiar), m)  # 2D nonzero é ~10x mais lento
+    valores = similaridades[linha_c, coluna_c]
+    ordem = np.lexsort((-valores, coluna_c))
+    coluna_c, linha_c, valores = coluna_c[ordem], linha_c[ordem], valores[ordem]
+    posicao = np.arange(len(coluna_c)) - np.searchsorted(coluna_c, coluna_c)
+    mantidos = posicao < k
+    linhas_top[coluna_c[mantidos], posicao[mantidos]] = linha_c[mantidos]
+    sims_top[coluna_c[mantidos], posicao[mantidos]] = valores[mantidos]
+    return linhas_top, sims_top
+
+
+def _pouco_cobertas(linhas, cobertas, fracao):
+    """Máscara das linhas com menos que 'fracao' do peso (L2²) nas colunas 'cobertas' (linhas zeradas: False)."""
+    quadrados = linhas.multiply(linhas) if issparse(linhas) else np.square(linhas)
+    n_colunas = min(quadrados.shape[1], len(cobertas))
+    peso_coberto = np.asarray(quadrados[:, :n_colunas] @ cobertas[:n_colunas].astype(np.float64)).ravel()
+    return peso_coberto < fracao * np.asarray(quadrados.sum(axis=1)).ravel()
+
+
+def _similaridades_linhas(matriz, linhas, q):
+    # Produto só das linhas pedidas, direto nos arrays CSR (evita o matriz[linhas] do scipy, que copia tudo)
+    inicio = matriz.indptr[linhas].astype(np.int64)
+    tamanhos = matriz.indptr[linhas + 1] - inicio
+    posicoes = np.repeat(inicio - np.cumsum(tamanhos) + tamanhos, tamanhos) + np.arange(tamanhos.sum())
+    contribuicoes = matriz.data[posicoes] * q[matriz.indices[posicoes]]
+    return np.bincount(np.repeat(np.arange(len(linhas)), tamanhos), weights=contribuicoes, minlength=len(linhas))
+
+
+class IndiceVizinhos:
+    tipo = None
+
+    def __init__(self):
+        self.matriz = None
+
+    def construir(self, matriz):
+        self.matriz = matriz
+
+    def atualizar(self, matriz, novas=()):
+        self.matriz = matriz
+
+    def kneighbors(self, X, n_neighbors=5):
+        raise NotImplementedError
+
+    def instantaneo(self):
+        """Cópia para leitura: o original pode seguir recebendo inserções sem que ela mude."""
+        return copy.copy(self)
+
+    def salvar(self, pasta):
+        pass
+
+    def carregar(self, pasta, matriz):
+        self.construir(matriz)
+
+
+class IndiceCosseno(IndiceVizinhos):
+    """
+    Busca exata (força bruta) por distância de cosseno.
+    Equivalente ao NearestNeighbors(metric='cosine', algorithm='brute'), mas como as linhas da matriz
+    TF-IDF já são normalizadas (L2), basta um produto matriz-vetor e a matriz pode ser trocada em O(1).
+    """
+    tipo = 'exato'
+
+    def __init__(self, matriz=None):
+        super().__init__()
+        self.matriz = matriz
+
+    def kneighbors(self, X, n_neighbors=5):
+        indices, sims = _top_k_colunas(np.asarray(self.matriz @ _normalizar_consulta(X).T), n_neighbors)
+        return 1.0 - sims, indices
+
+
+class IndiceIVF(IndiceVizinhos):
+    """
+    Índice invertido (IVF): centróides treinados com MiniBatchKMeans sobre as linhas normalizadas.
+    Cada álbum fica na lista do centróide mais parecido; inserções só anexam o álbum a uma lista.
+
+    Colunas que nenhum centróide conhece (tags novas, ou que não caíram na amostra do treino) não
+    ajudam a escolher a lista: um álbum só com elas teria similaridade 0 com todos os centróides e
+    cairia numa lista qualquer. Álbuns com a maior parte do peso nessas colunas ficam em 'globais',
+    que toda consulta varre, até a próxima construção treinar centróides com elas.
+    """
+    tipo = 'ivf'
+
+    def __init__(self, n_listas=None, n_sondas=N_SONDAS_IVF, amostra=AMOSTRA_TREINO_IVF, semente=0):
+        super().__init__()
+        self.n_listas = n_listas
+        self.n_sondas = n_sondas
+        self.amostra = amostra
+        self.semente = semente
+        self.centroides = None
+        self.ordem = np.zeros(0, dtype=np.int32)      # ids agrupados por lista
+        self.offsets = np.zeros(1, dtype=np.int64)    # lista l = ordem[offsets[l]:offsets[l+1]]
+        self.extras = []                              # inserções desde a última construção, por lista
+        self.globais = np.zeros(0, dtype=np.int32)    # ids fora das listas (varridos em toda consulta)
+        self.extras_globais = []                      # inserções desde a última construção que foram para 'globais'
+        self.cobertas = None                          # colunas em que algum centróide tem peso
+
+    def _ajustar_colunas(self, n_colunas):
+        # Tags novas não existiam no treino: o centróide tem peso zero nelas
+        if self.centroides.shape[1] < n_colunas:
+            extra = np.zeros((self.centroides.shape[0], n_colunas - self.centroides.shape[1]), dtype=np.float32)
+            self.centroides = np.hstack([self.centroides, extra])
+            self.cobertas = np.concatenate([self.cobertas, np.zeros(extra.shape[1], dtype=bool)])
+
+    def _atribuir(self, linhas):
+        """Lista de cada linha; -1 para as que têm pouco peso nas colunas cobertas (vão para 'globais')."""
+        listas = np.empty(linhas.shape[0], dtype=np.int32)
+        for ini in range(0, linhas.shape[0], BLOCO_ATRIBUICAO):
+            bloco = linhas[ini:ini + BLOCO_ATRIBUICAO]
+            escolhidas = np.asarray(bloco @ self.centroides.T).argmax(axis=1)
+            listas[ini:ini + bloco.shape[0]] = np.where(_pouco_cobertas(bloco, self.cobertas, FRACAO_COBERTA),
+                                                        -1, escolhidas)
+        return listas
+
+    def construir(self, matriz):
+        self.matriz = matriz
+        n = matriz.shape[0]
+        if n == 0:
+            self.centroides = None
+            return
+
+        n_listas = self.n_listas or int(np.clip(4 * np.sqrt(n), 1, 4096))
+        n_listas = min(n_listas, n)
+        rng = np.random.default_rng(self.semente)
+        amostra = matriz[np.sort(rng.choice(n, size=min(n, max(self.amostra, n_listas)), replace=False))]
+        from sklearn.cluster import MiniBatchKMeans  # pesado: só quem constrói o IVF paga a importação
+        kmeans = MiniBatchKMeans(n_clusters=n_listas, batch_size=4096, n_init=1, random_state=self.semente)
+        kmeans.fit(amostra)
+        self.centroides = normalizar_linhas(kmeans.cluster_centers_).astype(np.float32)
+        self.cobertas = self.centroides.any(axis=0)
+
+        listas = self._atribuir(matriz)
+        self._agrupar(listas, n_listas)
+        self.extras = [[] for _ in range(n_listas)]
+        self.extras_globais = []
+
+    def _agrupar(self, listas, n_listas):
+        ordem = np.argsort(listas, kind='stable').astype(np.int32)
+        n_globais = int(np.count_nonzero(listas < 0))  # -1 ordena primeiro
+        self.globais, self.ordem = ordem[:n_globais], ordem[n_globais:]
+        self.offsets = np.searchsorted(listas[self.ordem], np.arange(n_listas + 1)).astype(np.int64)
+
+    def atualizar(self, matriz, novas=()):
+        self.matriz = matriz
+        if self.centroides is None:
+            self.construir(matriz)
+            return
+        self._ajustar_colunas(matriz.shape[1])
+        if len(novas):
+            for idx, lista in zip(novas, self._atribuir(matriz[list(novas)])):
+                (self.extras_globais if lista < 0 else self.extras[lista]).append(int(idx))
+
+    def kneighbors(self, X, n_neighbors=5):
+        X = _normalizar_consulta(X)
+        self._ajustar_colunas(X.shape[1])
+        # Perfis de usuário têm poucas tags: só as colunas usadas entram no produto com os centróides
+        colunas = np.flatnonzero(X.any(axis=0))
+        sims_centroides = X[:, colunas] @ self.centroides[:, colunas].T
+        n_sondas = min(self.n_sondas, self.centroides.shape[0])
+        sondas = np.argpartition(-sims_centroides, n_sondas - 1, axis=1)[:, :n_sondas]
+
+        todas_dist, todos_idx = [], []
+        for q, listas in zip(X, sondas):
+            candidatos = np.concatenate([self.ordem[self.offsets[l]:self.offsets[l + 1]] for l in listas]
+                                        + [np.asarray(self.extras[l], dtype=np.int32) for l in listas]
+                                        + [self.globais, np.asarray(self.extras_globais, dtype=np.int32)])
+            if len(candidatos) < n_neighbors:
+                # Poucos candidatos nas listas visitadas: cai para a busca exata
+                candidatos = np.arange(self.matriz.shape[0], dtype=np.int32)
+            sims = _similaridades_linhas(self.matriz, candidatos, q)
+            posicoes, sims_top = _top_k(sims[None, :], n_neighbors)
+            todos_idx.append(candidatos[posicoes[0]])
+            todas_dist.append(1.0 - sims_top[0])
+        return np.vstack(todas_dist), np.vstack(todos_idx)
+
+    def instantaneo(self):
+        copia = copy.copy(self)
+        copia.extras = [list(e) for e in self.extras]
+        copia.extras_globais = list(self.extras_globais)
+        return copia
+
+    def salvar(self, pasta):
+        if self.centroides is None: return
+        # As inserções pendentes entram nas listas antes de gravar
+        n_listas = len(self.offsets) - 1
+        listas = np.empty(self.offsets[-1] + len(self.globais) + len(self.extras_globais)
+                          + sum(len(e) for e in self.extras), dtype=np.int32)
+        listas[self.ordem] = np.repeat(np.arange(n_listas), np.diff(self.offsets))
+        listas[self.globais] = -1
+        listas[self.extras_globais] = -1
+        for l, extras in enumerate(self.extras):
+            listas[extras] = l
+        copia = copy.copy(self)
+        copia._agrupar(listas, n_listas)
+        np.save(os.path.join(pasta, 'ivf_centroides.npy'), self.centroides)
+        np.save(os.path.join(pasta, 'ivf_ordem.npy'), copia.ordem)
+        np.save(os.path.join(pasta, 'ivf_offsets.npy'), copia.offsets)
+        np.save(os.path.join(pasta, 'ivf_globais.npy'), copia.globais)
+
+    def carregar(self, pasta, matriz):
+        if not os.path.exists(os.path.join(pasta, 'ivf_centroides.npy')):
+            self.construir(matriz)
+            return
+        self.matriz = matriz
+        self.centroides = np.load(os.path.join(pasta, 'ivf_centroides.npy'))
+        self.cobertas = self.centroides.any(axis=0)
+        self.ordem = np.load(os.path.join(pasta, 'ivf_ordem.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(pasta, 'ivf_offsets.npy'))
+        caminho_globais = os.path.join(pasta, 'ivf_globais.npy')  # pacotes antigos não têm
+        self.globais = np.load(caminho_globais) if os.path.exists(caminho_globais) else np.zeros(0, dtype=np.int32)
+        self.extras = [[] for _ in range(len(self.offsets) - 1)]
+        self.extras_globais = []
+
+
+class IndiceFragmentado(IndiceVizinhos):
+    """
+    Busca exata (mesmo resultado do IndiceCosseno) com as linhas divididas entre processos: cada um
+    calcula o top-k da sua faixa e a resposta é o top-k dos parciais. As linhas inseridas depois da
+    última construção são calculadas aqui, enquanto os processos trabalham. Matrizes pequenas, consultas
+    de um instantâneo cuja geração os processos já descartaram e processos que caíram também caem para
+    a busca local. Os processos só são criados na primeira matriz grande o bastante.
+    """
+    tipo = 'fragmentado'
+
+    def __init__(self, n_processos=None):
+        super().__init__()
+        self.n_processos = n_processos or os.cpu_count() or 1
+        self.pool = None        # compartilhado com os instantâneos
+        self.geracao = None     # matriz publicada nos processos (None: busca local)
+        self.n_base = 0         # linhas que os processos conhecem
+
+    def construir(self, matriz):
+        self.matriz = matriz
+        self.geracao, self.n_base = None, 0
+        if matriz.shape[0] < MIN_LINHAS_FRAGMENTADO: return
+        if self.pool is None or self.pool.quebrado:
+            from fragmentos import PoolFragmentos  # multiprocessing só para quem usa este índice
+            self.pool = PoolFragmentos(self.n_processos)
+        try:
+            self.geracao = self.pool.publicar(matriz)
+        except (OSError, EOFError):
+            return
+        self.n_base = matriz.shape[0]
+
+    def atualizar(self, matriz, novas=()):
+        self.matriz = matriz
+        if self.geracao is None and matriz.shape[0] >= MIN_LINHAS_FRAGMENTADO: self.construir(matriz)
+
+    def kneighbors(self, X, n_neighbors=5):
+        X = _normalizar_consulta(X)
+        if self.geracao is None or not self.pool.tem(self.geracao):
+            return IndiceCosseno(self.matriz).kneighbors(X, n_neighbors)
+        k = min(n_neighbors, self.matriz.shape[0])
+        pedido = self.pool.consultar(self.geracao, X, k)
+        if self.matriz.shape[0] > self.n_base:
+            locais, sims_locais = _top_k_colunas(np.asarray(self.matriz[self.n_base:] @ X.T), k)
+        try:
+            linhas, sims = pedido.result()
+        except (LookupError, OSError, EOFError):
+            return IndiceCosseno(self.matriz).kneighbors(X, n_neighbors)
+        if self.matriz.shape[0] > self.n_base:
+            linhas, sims = np.hstack([linhas, locais + self.n_base]), np.hstack([sims, sims_locais])
+            posicoes, sims = _top_k(sims, k)
+            linhas = np.take_along_axis(linhas, posicoes, axis=1)
+        return 1.0 - sims, linhas
+
+
+class IndiceCompacto(IndiceVizinhos):
+    """
+    Busca sobre uma cópia densa e pequena da matriz: cada linha é projetada em 'dimensoes' colunas
+    (metodo='svd': TruncatedSVD treinado numa amostra; 'projecao': aleatória, sem treino), normalizada
+    e guardada em int8 com uma escala por linha (ou em float16). A consulta é um produto denso, por
+    blocos, e os k * 'candidatos' melhores são reavaliados com o cosseno exato nas linhas do TF-IDF:
+    a varredura só lê a cópia pequena. Com candidatos=0 a resposta é a similaridade aproximada.
+
+    É aproximado mesmo com a reavaliação: quem não fica entre os candidatos na cópia pequena não volta.
+    No catálogo sintético do benchmark (30 tags/álbum, 50 gêneros) o padrão (projeção em 64 colunas int8,
+    k * 100 candidatos) acha ~75% do top-10 exato com 200 mil álbuns e ~50% com 1 milhão; mais colunas
+    ou candidatos sobem o recall, mas aí a varredura fica tão lenta quanto a busca exata. Para o
+    resultado exato, use 'exato' ou 'fragmentado'.
+
+    Inserções só projetam as linhas novas, escritas depois do fim que um instantâneo enxerga (como no
+    MatrizIncremental). Tags criadas depois do treino ficam fora da projeção até a próxima construção:
+    linhas com a maior parte do peso nelas (FRACAO_COBERTA) teriam uma projeção vazia ou enganosa, então
+    também entram em 'globais', reavaliadas com o cosseno exato em toda consulta.
+    """
+    tipo = 'compacto'
+
+    def __init__(self, dimensoes=DIMENSOES_COMPACTO, metodo=METODO_COMPACTO, precisao=PRECISAO_COMPACTO,
+                 candidatos=FATOR_CANDIDATOS, amostra=AMOSTRA_TREINO_SVD, semente=0):
+        super().__init__()
+        if metodo not in ('svd', 'projecao'): raise ValueError(f"método '{metodo}' desconhecido (svd ou projecao)")
+        if precisao not in ('int8', 'float16'): raise ValueError(f"precisão '{precisao}' desconhecida (int8 ou float16)")
+        self.dimensoes = dimensoes
+        self.metodo = metodo
+        self.precisao = precisao
+        self.candidatos = candidatos
+        self.amostra = amostra
+        self.semente = semente
+        self.projecao = None    # (colunas x dimensoes) float32
+        self.n = 0              # linhas projetadas; os buffers abaixo podem ter folga depois delas
+        self._codigos = np.zeros((0, dimensoes), dtype=precisao)
+        self._escalas = np.zeros(0, dtype=np.float32)
+        self.globais = []       # linhas pouco cobertas pela projeção (sempre reavaliadas)
+
+    @property
+    def codigos(self):
+        return self._codigos[:self.n]
+
+    @property
+    def escalas(self):
+        return self._escalas[:self.n]
+
+    def memoria(self):
+        """Bytes da cópia compacta (códigos + escalas + projeção)."""
+        projecao = 0 if self.projecao is None else self.projecao.nbytes
+        return self.codigos.nbytes + (self.escalas.nbytes if self.precisao == 'int8' else 0) + projecao
+
+    def _treinar(self, matriz):
+        n, n_colunas = matriz.shape
+        rng = np.random.default_rng(self.semente)
+        amostra = matriz[np.sort(rng.choice(n, size=min(n, self.amostra), replace=False))]
+        if self.metodo == 'svd' and min(amostra.shape) > self.dimensoes:
+            from sklearn.decomposition import TruncatedSVD  # pesado: só quem constrói paga a importação
+            svd = TruncatedSVD(n_components=self.dimensoes, algorithm='randomized', random_state=self.semente)
+            return svd.fit(amostra).components_.T.astype(np.float32)
+        # Projeção aleatória (Johnson-Lindenstrauss): também a reserva quando há poucas tags ou álbuns para o SVD
+        return (rng.standard_normal((n_colunas, self.dimensoes)) / np.sqrt(self.dimensoes)).astype(np.float32)
+
+    def _ajustar_colunas(self, n_colunas):
+        # Tags novas não existiam no treino: peso zero na projeção
+        if self.projecao.shape[0] < n_colunas:
+            extra = np.zeros((n_colunas - self.projecao.shape[0], self.dimensoes), dtype=np.float32)
+            self.projecao = np.vstack([self.projecao, extra])
+
+    def _projetar(self, X):
+        # Linhas (esparsas ou densas) -> vetores unitários de 'dimensoes' colunas, float32
+        n_colunas = min(X.shape[1], self.projecao.shape[0])
+        emb = np.asarray(X[:, :n_colunas] @ self.projecao[:n_colunas], dtype=np.float32)
+        normas = np.linalg.norm(emb, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        return emb / normas
+
+    def _anexar(self, linhas):
+        fim = self.n + linhas.shape[0]
+        if fim > len(self._codigos) or not self._codigos.flags.writeable:
+            # Buffers novos (crescimento geométrico, ou a primeira inserção num memmap do pacote)
+            capacidade = max(2 * fim, 1024)
+            codigos = np.zeros((capacidade, self.dimensoes), dtype=self.precisao)
+            escalas = np.ones(capacidade, dtype=np.float32)
+            codigos[:self.n], escalas[:self.n] = self.codigos, self.escalas
+            self._codigos, self._escalas = codigos, escalas
+        cobertas = self.projecao.any(axis=1)
+        for ini in range(0, linhas.shape[0], BLOCO_COMPACTO):
+            bloco = linhas[ini:ini + BLOCO_COMPACTO]
+            pouco_cobertas = np.flatnonzero(_pouco_cobertas(bloco, cobertas, FRACAO_COBERTA))
+            self.globais.extend((self.n + ini + pouco_cobertas).tolist())
+            emb = self._projetar(bloco)
+            destino = slice(self.n + ini, self.n + ini + emb.shape[0])
+            if self.precisao == 'int8':
+                escalas = np.abs(emb).max(axis=1) / 127
+                escalas[escalas == 0] = 1.0
+                self._codigos[destino] = np.rint(emb / escalas[:, None])
+                self._escalas[destino] = escalas
+            else:
+                self._codigos[destino] = emb
+        self.n = fim
+
+    def construir(self, matriz):
+        self.matriz = matriz
+        self.n = 0
+        self._codigos = np.zeros((0, self.dimensoes), dtype=self.precisao)
+        self._escalas = np.zeros(0, dtype=np.float32)
+        self.globais = []
+        if matriz.shape[0] == 0 or matriz.shape[1] == 0:
+            self.projecao = None
+            return
+        self.projecao = self._treinar(matriz)
+        self._anexar(matriz)
+
+    def atualizar(self, matriz, novas=()):
+        self.matriz = matriz
+        if self.projecao is None:
+            self.construir(matriz)
+            return
+        self._ajustar_colunas(matriz.shape[1])
+        if matriz.shape[0] > self.n: self._anexar(matriz[self.n:])
+
+    def kneighbors(self, X, n_neighbors=5):
+        X = _normalizar_consulta(X)
+        if self.n == 0: return IndiceCosseno(self.matriz).kneighbors(X, n_neighbors)
+        consultas = self._projetar(X)
+        k = min(n_neighbors, self.n)
+        globais = np.asarray(self.globais, dtype=np.int64)
+        n_candidatos = min(self.n - len(globais), k * self.candidatos if self.candidatos else k)
+        sims = np.empty((self.n, X.shape[0]), dtype=np.float32)
+        for ini in range(0, self.n, BLOCO_COMPACTO):
+            bloco = self.codigos[ini:ini + BLOCO_COMPACTO].astype(np.float32) @ consultas.T
+            if self.precisao == 'int8': bloco *= self.escalas[ini:ini + BLOCO_COMPACTO, None]
+            sims[ini:ini + bloco.shape[0]] = bloco
+        sims[globais] = -np.inf  # entram abaixo, com o cosseno exato
+        if n_candidatos > 0:
+            candidatos, aproximadas = _top_k_colunas(sims, n_candidatos)
+        else:  # todas as linhas estão em 'globais'
+            candidatos, aproximadas = np.zeros((X.shape[0], 0), dtype=np.int64), np.zeros((X.shape[0], 0))
+        if len(globais):
+            exatas_globais = np.vstack([_similaridades_linhas(self.matriz, globais, q) for q in X])
+            candidatos = np.hstack([candidatos, np.broadcast_to(globais, (X.shape[0], len(globais)))])
+        if not self.candidatos:
+            if len(globais): aproximadas = np.hstack([aproximadas, exatas_globais])
+            posicoes, sims_top = _top_k(aproximadas, k)
+            return 1.0 - sims_top, np.take_along_axis(candidatos, posicoes, axis=1)
+
+        exatas = np.vstack([_similaridades_linhas(self.matriz, linhas, q) for linhas, q in zip(candidatos, X)])
+        posicoes, sims_top = _top_k(exatas, k)
+        return 1.0 - sims_top, np.take_along_axis(candidatos, posicoes, axis=1)
+
+    def instantaneo(self):
+        copia = copy.copy(self)
+        copia.globais = list(self.globais)
+        return copia
+
+    def salvar(self, pasta):
+        if self.projecao is None: return
+        np.save(os.path.join(pasta, 'compacto_projecao.npy'), self.projecao)
+        np.save(os.path.join(pasta, 'compacto_codigos.npy'), self.codigos)
+        np.save(os.path.join(pasta, 'compacto_escalas.npy'), self.escalas)
+        np.save(os.path.join(pasta, 'compacto_globais.npy'), np.asarray(self.globais, dtype=np.int64))
+
+    def carregar(self, pasta, matriz):
+        caminho = os.path.join(pasta, 'compacto_codigos.npy')
+        codigos = np.load(caminho, mmap_mode='r') if os.path.exists(caminho) else None
+        if codigos is None or codigos.dtype != np.dtype(self.precisao) or codigos.shape[1] != self.dimensoes:
+            self.construir(matriz)  # ausente ou gravado com outra configuração
+            return
+        self.projecao = np.load(os.path.join(pasta, 'compacto_projecao.npy'))
+        self._codigos, self._escalas = codigos, np.load(os.path.join(pasta, 'compacto_escalas.npy'), mmap_mode='r')
+        caminho_globais = os.path.join(pasta, 'compacto_globais.npy')  # pacotes antigos não têm
+        self.globais = np.load(caminho_globais).tolist() if os.path.exists(caminho_globais) else []
+        self.n = len(codigos)
+        self.atualizar(matriz)
+
+
+class TabelaVizinhos:
+    """
+    Os k álbuns mais parecidos com cada álbum (só similaridade > 0), pré-calculados: vizinhos em int32
+    (-1 = vaga vazia) e similaridades em float16, 6 bytes por vizinho. Recomendar junta as listas dos
+    álbuns do perfil e reavalia só esses candidatos contra o centróide, sem comparar com a matriz inteira.
+
+    Quem não está na lista de um álbum tem similaridade com ele de no máximo a da última vaga: isso limita
+    a nota de quem ficou fora de todas as listas, e a resposta só sai da tabela quando o limite garante que
+    é a mesma da busca exata (a diferença possível é o arredondamento do float16, ~5e-4 na similaridade).
+
+    Uma inserção só altera a lista do álbum novo e as listas em que ele entra entre os k. Essas listas
+    ficam num dict à parte (a base nunca é alterada, como o mapa id -> linha do modelo): um instantâneo
+    copia o dict e não vê as inserções seguintes. Linhas mortas continuam ocupando a vaga até a reconstrução.
+    """
+
+    def __init__(self, k=50):
+        self.k = k
+        self.vizinhos = np.zeros((0, k), dtype=np.int32)
+        self.sims = np.zeros((0, k), dtype=np.float16)
+        self.alteradas = {}         # linha -> (vizinhos, sims) alterada ou acrescentada depois da base
+        self.n_linhas = 0
+        self._ultimas = None        # similaridade da última vaga de cada linha (0 se incompleta); só o escritor usa
+
+    def construir(self, matriz):
+        """Top-k exato de cada linha, em blocos de linhas (memória limitada por ELEMENTOS_BLOCO_TABELA)."""
+        n = matriz.shape[0]
+        vizinhos = np.full((n, self.k), -1, dtype=np.int32)
+        sims = np.zeros((n, self.k), dtype=np.float16)
+        transposta = matriz.T.tocsr()
+        tamanho_bloco = max(1, ELEMENTOS_BLOCO_TABELA // max(n, 1))
+        for ini in range(0, n if self.k else 0, tamanho_bloco):
+            bloco = (matriz[ini:ini + tamanho_bloco] @ transposta).tocsr()  # esparso: só pares com tag em comum
+            for i in range(bloco.shape[0]):
+                a, b = bloco.indptr[i], bloco.indptr[i + 1]
+                vizinhos[ini + i], sims[ini + i] = self._melhores(bloco.indices[a:b], bloco.data[a:b], ini + i)
+        self.vizinhos, self.sims = vizinhos, sims
+        self.alteradas = {}
+        self.n_linhas = n
+        self._ultimas = None
+
+    def _melhores(self, colunas, valores, propria, mortas=None):
+        # Lista de uma linha a partir das similaridades não nulas: as k maiores, empates pela menor linha
+        manter = (colunas != propria) & (valores > 0)
+        if mortas is not None: manter &= ~mortas[colunas]
+        colunas, valores = colunas[manter], valores[manter]
+        if len(valores) > self.k:
+            escolhidos = np.argpartition(-valores, self.k - 1)[:self.k]
+            colunas, valores = colunas[escolhidos], valores[escolhidos]
+        ordem = np.lexsort((colunas, -valores))
+        vizinhos = np.full(self.k, -1, dtype=np.int32)
+        sims = np.zeros(self.k, dtype=np.float16)
+        vizinhos[:len(ordem)], sims[:len(ordem)] = colunas[ordem], valores[ordem]
+        return vizinhos, sims
+
+    def lista(self, linha):
+        """(vizinhos, similaridades) da linha, do mais parecido para o menos."""
+        alterada = self.alteradas.get(linha)
+        return alterada if alterada is not None else (self.vizinhos[linha], self.sims[linha])
+
+    def _ultimas_vagas(self):
+        # Montado só na primeira inserção para a carga continuar O(1)
+        if self._ultimas is None:
+            ultimas = np.zeros(max(self.n_linhas * 2, 1024), dtype=np.float32)
+            if self.k:
+                ultimas[:len(self.sims)] = self.sims[:, -1]  # vaga vazia tem similaridade 0
+                for linha, (_, sims) in self.alteradas.items(): ultimas[linha] = sims[-1]
+            self._ultimas = ultimas
+        elif self.n_linhas >= len(self._ultimas):
+            ultimas = np.zeros(len(self._ultimas) * 2, dtype=np.float32)
+            ultimas[:len(self._ultimas)] = self._ultimas
+            self._ultimas = ultimas
+        return self._ultimas
+
+    def atualizar(self, matriz, nova, mortas=()):
+        """Inclui a linha 'nova' (a última da matriz): sua lista e as listas em que ela entra."""
+        ultimas = self._ultimas_vagas()
+        self.n_linhas = matriz.shape[0]
+        if not self.k: return
+        ini, fim = matriz.indptr[nova], matriz.indptr[nova + 1]
+        q = np.zeros(matriz.shape[1])
+        q[matriz.indices[ini:fim]] = matriz.data[ini:fim]
+        sims = np.asarray(matriz @ q)
+        mascara_mortas = np.zeros(len(sims), dtype=bool)
+        if mortas: mascara_mortas[np.fromiter(mortas, dtype=np.int64, count=len(mortas))] = True
+
+        vizinhos, sims_nova = self._melhores(np.arange(len(sims)), sims, nova, mascara_mortas)
+        self.alteradas[nova] = (vizinhos, sims_nova)
+        ultimas[nova] = sims_nova[-1]
+
+        # Listas em que o álbum novo passa à frente da última vaga (empates não desalojam ninguém)
+        sim16 = sims.astype(np.float16)
+        for linha in np.flatnonzero((sim16[:nova] > ultimas[:nova]) & ~mascara_mortas[:nova]):
+            antigos, sims_antigas = self.lista(linha)
+            ocupadas = int((antigos >= 0).sum())
+            posicao = int(np.searchsorted(-sims_antigas[:ocupadas].astype(np.float32), -sim16[linha], side='right'))
+            vizinhos_l = np.insert(antigos, posicao, nova)[:self.k]
+            sims_l = np.insert(sims_antigas, posicao, sim16[linha])[:self.k]
+            self.alteradas[int(linha)] = (vizinhos_l, sims_l)
+            ultimas[linha] = sims_l[-1]
+
+        if len(self.alteradas) > max(DELTA_MINIMO_TABELA, len(self.vizinhos) // 16):
+            self._fundir()
+
+    def _fundir(self):
+        # Base nova em vez de alterar a antiga, que pode estar em uso por um instantâneo
+        vizinhos = np.full((self.n_linhas, self.k), -1, dtype=np.int32)
+        sims = np.zeros((self.n_linhas, self.k), dtype=np.float16)
+        vizinhos[:len(self.vizinhos)] = self.vizinhos
+        sims[:len(self.sims)] = self.sims
+        for linha, (vizinhos_l, sims_l) in self.alteradas.items():
+            vizinhos[linha], sims[linha] = vizinhos_l, sims_l
+        self.vizinhos, self.sims = vizinhos, sims
+        self.alteradas = {}
+
+    def recomendar(self, matriz, linhas, qtd, excluir=()):
+        """
+        Top 'qtd' para o perfil (linhas da matriz) entre os vizinhos pré-calculados dos seus álbuns, com a
+        similaridade exata ao centróide. Retorna (linhas, sims), ou None quando a tabela não garante a
+        resposta da busca exata (aí quem chama usa o índice).
+        """
+        if not self.k: return None
+        listas = [self.lista(linha) for linha in linhas]
+        candidatos = np.unique(np.concatenate([vizinhos for vizinhos, _ in listas]))
+        fora = np.fromiter(set(linhas) | set(excluir), dtype=np.int64)
+        candidatos = candidatos[(candidatos >= 0) & ~np.isin(candidatos, fora)]
+        if len(candidatos) < qtd: return None
+
+        soma = np.zeros(matriz.shape[1])
+        for linha in linhas:
+            soma[matriz.indices[matriz.indptr[linha]:matriz.indptr[linha + 1]]] += \
+                matriz.data[matriz.indptr[linha]:matriz.indptr[linha + 1]]
+        norma = np.linalg.norm(soma)
+        if norma == 0: return None
+        sims = _similaridades_linhas(matriz, candidatos, soma / norma)
+        posicoes, top = _top_k(sims[None, :], qtd)
+        # Fora de todas as listas: similaridade com cada álbum do perfil <= a da sua última vaga
+        teto = sum(float(sims_l[-1]) for _, sims_l in listas) / norma
+        if top[0, -1] < teto: return None
+        return candidatos[posicoes[0]], top[0]
+
+    def instantaneo(self):
+        copia = copy.copy(self)
+        copia.alteradas = dict(self.alteradas)
+        copia._ultimas = None
+        return copia
+
+    def salvar(self, pasta):
+        if self.alteradas: self._fundir()
+        np.save(os.path.join(pasta, 'vizinhos.npy'), self.vizinhos)
+        np.save(os.path.join(pasta, 'vizinhos_sims.npy'), self.sims)
+
+    def carregar(self, pasta, matriz):
+        """Lê a tabela do pacote se tiver o mesmo k e o mesmo número de linhas; senão constrói. Retorna True se leu."""
+        caminho = os.path.join(pasta, 'vizinhos.npy')
+        if os.path.exists(caminho):
+            vizinhos = np.load(caminho, mmap_mode='r')
+            if vizinhos.shape == (matriz.shape[0], self.k):
+                self.vizinhos = vizinhos
+                self.sims = np.load(os.path.join(pasta, 'vizinhos_sims.npy'), mmap_mode='r')
+                self.alteradas = {}
+                self.n_linhas = matriz.shape[0]
+                self._ultimas = None
+                return True
+        self.construir(matriz)
+        return False
+
+
+TIPOS_INDICE = {classe.tipo: classe for classe in (IndiceCosseno, IndiceIVF, IndiceFragmentado, IndiceCompacto)}
+
+
+def criar_indice(tipo='exato', **opcoes):
+    if tipo not in TIPOS_INDICE:
+        raise ValueError(f"Índice '{tipo}' desconhecido (opções: {', '.join(TIPOS_INDICE)})")
+    return TIPOS_INDICE[tipo](**opcoes)
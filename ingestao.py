@@ -0,0 +1,111 @@
+import csv
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import pandas as pd
+
+from cliente_lastfm import buscar_tags
+
+# ================= CONFIGURAÇÃO =================
+ARQUIVO_CHECKPOINT = 'tags_coletadas.csv'   # (Album, Tag, Peso, Artista) de cada álbum já processado
+WORKERS_INGESTAO = 8
+
+
+def _ler_csv_checkpoint(caminho, **kwargs):
+    # Checkpoints de antes do artista têm só 3 colunas: o artista fica vazio
+    df = pd.read_csv(caminho, names=['Album', 'Tag', 'Peso', 'Artista'], keep_default_na=False, **kwargs)
+    df['Artista'] = df['Artista'].fillna('').astype(str)
+    return df
+
+
+def _ler_checkpoint(caminho):
+    """
+    Retorna o conjunto de (artista, álbum) já processados, descartando uma última linha cortada por queda.
+    Linhas antigas, sem artista, entram como ('', álbum).
+    """
+    if not os.path.exists(caminho): return set()
+
+    with open(caminho, 'rb+') as f:
+        conteudo = f.read()
+        if conteudo and not conteudo.endswith(b'\n'):
+            f.truncate(conteudo.rfind(b'\n') + 1)
+
+    processados = _ler_csv_checkpoint(caminho, dtype=str)
+    return set(zip(processados['Artista'], processados['Album']))
+
+
+def _buscar(network, cache, album, artista):
+    top_tags = buscar_tags(network, artista, album, limite=3, cache=cache, fallback_artista=False)
+    if not top_tags:
+        return album, []
+
+    max_weight = int(top_tags[0][1]) or 1
+    return album, [(nome.title(), int(peso) / max_weight) for nome, peso in top_tags]
+
+
+def ingerir(df_unique, network, cache=None, caminho=ARQUIVO_CHECKPOINT, workers=WORKERS_INGESTAO):
+    """
+    Busca as tags de todos os álbuns do CSV em paralelo (respeitando o limite global de requisições/s)
+    e grava cada álbum no checkpoint assim que fica pronto. Rodar de novo continua de onde parou.
+    Álbuns que falharam não entram no checkpoint (são tentados de novo na próxima execução).
+    Só as tags do Last.fm entram aqui: gêneros e descritores do CSV chegam ao modelo pelos blocos do
+    caracteristicas.py, então álbuns sem tags (ou que falharam) ficam só com eles, sem contá-los duas vezes.
+    """
+    processados = _ler_checkpoint(caminho)
+    # Checkpoints antigos (sem artista) vieram do CSV deduplicado por título: o artista era o primeiro do título
+    artista_antigo = dict(df_unique.drop_duplicates(subset=['release_name'])[['release_name', 'artist_name']]
+                          .itertuples(index=False, name=None))
+    colunas = ['release_name', 'artist_name']
+    pendentes = [linha for linha in df_unique[colunas].itertuples(index=False, name=None)
+                 if (linha[1], linha[0]) not in processados
+                 and not (('', linha[0]) in processados and artista_antigo.get(linha[0]) == linha[1])]
+    print(f"Checkpoint: {len(processados)} álbuns já processados, {len(pendentes)} pendentes.")
+
+    falhas = 0
+    inicio = time.monotonic()
+    with open(caminho, 'a', newline='', encoding='utf-8') as f, ThreadPoolExecutor(workers) as executor:
+        escritor = csv.writer(f)
+        fila = iter(pendentes)
+        em_andamento = {}
+        concluidos = 0
+
+        # Janela deslizante: no máximo 4 tarefas por worker em memória, mesmo com 100k+ álbuns
+        while True:
+            while len(em_andamento) < workers * 4:
+                linha = next(fila, None)
+                if linha is None: break
+                em_andamento[executor.submit(_buscar, network, cache, *linha)] = linha
+            if not em_andamento: break
+
+            prontos, _ = wait(em_andamento, return_when=FIRST_COMPLETED)
+            for futuro in prontos:
+                album, artista = em_andamento.pop(futuro)
+                try:
+                    _, tags = futuro.result()
+                except Exception as e:
+                    print(f"   -> Falha em {album}: {e}")
+                    falhas += 1
+                    continue
+
+                # Álbum sem tag nenhuma fica registrado com uma linha vazia para não ser buscado de novo
+                escritor.writerows([(album, tag, peso, artista) for tag, peso in tags] or [(album, '', 0, artista)])
+                f.flush()
+                concluidos += 1
+                if concluidos % 100 == 0:
+                    taxa = concluidos / (time.monotonic() - inicio)
+                    print(f"   {concluidos}/{len(pendentes)} álbuns ({taxa:.1f}/s)")
+
+    if falhas:
+        print(f"{falhas} álbuns falharam e ficam só com os dados do CSV (serão tentados de novo na próxima execução).")
+    return tags_coletadas(df_unique, caminho)
+
+
+def tags_coletadas(df_unique, caminho=ARQUIVO_CHECKPOINT):
+    """Tags já gravadas no checkpoint, como (Album, Tag, Peso, Artista), sem acessar a API."""
+    df_final = _ler_csv_checkpoint(caminho, dtype={'Album': str, 'Tag': str, 'Peso': float, 'Artista': str})
+    sem_artista = df_final['Artista'] == ''
+    if sem_artista.any():
+        artista_antigo = df_unique.drop_duplicates(subset=['release_name']).set_index('release_name')['artist_name']
+        df_final.loc[sem_artista, 'Artista'] = df_final.loc[sem_artista, 'Album'].map(artista_antigo).fillna('')
+    return df_final[df_final['Peso'] > 0].reset_index(drop=True)
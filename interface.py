@@ -1,26 +1,34 @@
+import time
+INICIO = time.perf_counter()  # antes dos imports pesados: base das medidas de tempo de abertura
+
 import customtkinter as ctk
+import queue
 import sys
 import threading
-import requests
+from tkinter import filedialog
 from PIL import Image
-from io import BytesIO
 from backend_logic import Sistema
+from cache_capas import BaixadorCapas
+from importacao_lista import importar, ler_lista
+from lista_virtual import ListaVirtual
+from telemetria import log, telemetria
+
+# ================= CONFIGURAÇÃO =================
+INTERVALO_LOG_MS = 100      # de quanto em quanto tempo o log acumulado vai para o terminal da janela
+ARQUIVO_METRICAS = None     # ex: 'metricas.json' para salvar spans e contadores ao fechar (profiling)
+ALTURA_LINHA_ALBUM = 27     # px por álbum na lista (as listas só têm widgets para as linhas visíveis)
+ALTURA_LINHA_CARDS = 270    # px por linha de cards de recomendação (2 por linha)
 
 ctk.set_appearance_mode("Dark")
 ctk.set_default_color_theme("dark-blue")
 
 class PrintRedirector:
-    def __init__(self, text_widget):
-        self.text_widget = text_widget
+    # Prints que sobraram (bibliotecas, threads) vão para o buffer do log: nenhuma chamada ao Tk fora da thread principal
+    def __init__(self, registro):
+        self.registro = registro
 
     def write(self, string):
-        if not string: return
-        try:
-            self.text_widget.configure(state="normal")
-            self.text_widget.insert("end", string)
-            self.text_widget.see("end")
-            self.text_widget.configure(state="disabled")
-        except: pass
+        self.registro.escrever(string)
 
     def flush(self): pass
 
@@ -39,8 +47,22 @@ class App(ctk.CTk):
             "placeholder": ["#FF9900", "#00A651", "#00BBDD", "#8C47FF"]
         }
 
-        self.sistema = Sistema()
+        # Log em buffer: as threads só acumulam o texto, e o timer abaixo o mostra de uma vez
+        log.em_buffer = True
+        sys.stdout = PrintRedirector(log)
+
+        # O modelo carrega em segundo plano: a janela aparece na hora e a busca por nome responde
+        # assim que o índice de nomes estiver lido; o botão de recomendar espera o modelo inteiro
+        self.sistema = Sistema(em_segundo_plano=True)
+        self.primeira_recomendacao = True
+        self.baixador = BaixadorCapas()
         self.lista_albuns_usuario = []
+        self.ids_usuario = set()
+        self.rodada = 0        # muda a cada busca/limpeza: resultados atrasados de rodadas antigas são ignorados
+        self.capas = {}        # posição do card -> capa já baixada (o card da posição a mostra quando visível)
+        # Importação de arquivo: as threads enfileiram os álbuns e o timer os põe na lista em lotes
+        self.fila_importacao = queue.Queue()
+        self.cancelar_importacao = threading.Event()
         
         self.title("KNAlbuns - Recomendador de álbuns com KNN")
         self.geometry("1280x720")
@@ -57,8 +79,36 @@ class App(ctk.CTk):
         self._setup_center_panel() # Coluna 1
         self._setup_right_panel()  # Coluna 2
 
-        # Redirecionamento do Print
-        sys.stdout = PrintRedirector(self.terminal)
+        self.after(INTERVALO_LOG_MS, self._descarregar_log)
+        self.after(INTERVALO_LOG_MS, self._verificar_modelo)
+        self.after(INTERVALO_LOG_MS, self._descarregar_importacao)
+        self.after_idle(lambda: self._marcar_inicio('inicio.primeira_tela'))
+        self.protocol("WM_DELETE_WINDOW", self._fechar)
+
+    def _marcar_inicio(self, nome):
+        ms = (time.perf_counter() - INICIO) * 1000
+        telemetria.registrar(nome, ms)
+        log(f"[Interface] {nome}: {ms:.0f} ms desde o início")
+
+    def _verificar_modelo(self):
+        if not self.sistema.pronto.is_set():
+            self.after(INTERVALO_LOG_MS, self._verificar_modelo)
+            return
+        self._marcar_inicio('inicio.modelo_pronto')
+        self.btn_rec.configure(state="normal", text="Gerar Recomendações")
+
+    def _descarregar_log(self):
+        texto = log.drenar()
+        if texto:
+            self.terminal.configure(state="normal")
+            self.terminal.insert("end", texto)
+            self.terminal.see("end")
+            self.terminal.configure(state="disabled")
+        self.after(INTERVALO_LOG_MS, self._descarregar_log)
+
+    def _fechar(self):
+        if ARQUIVO_METRICAS: telemetria.salvar_json(ARQUIVO_METRICAS)
+        self.destroy()
 
     def _carregar_imagem(self, path, size):
         """Helper para carregar e redimensionar imagens com segurança."""
@@ -70,7 +120,7 @@ class App(ctk.CTk):
             
             return ctk.CTkImage(img, img, size=size)
         except Exception as e:
-            print(f"Erro imagem ({path}): {e}")
+            log(f"Erro imagem ({path}): {e}")
             return None
 
     def _truncar_texto(self, texto, limite):
@@ -89,9 +139,10 @@ class App(ctk.CTk):
         menu_frame = ctk.CTkFrame(menu_bar, height=30, fg_color="transparent")
         menu_frame.pack(side="left", padx=10)
         
+        comandos = {"Arquivo": self.importar_lista}
         for btn_text in ["Opções", "Editar", "Arquivo"]:
             ctk.CTkButton(menu_frame, text=btn_text, fg_color="transparent",
-                          text_color="#f0f0f0", hover_color="#3c3c3c",
+                          text_color="#f0f0f0", hover_color="#3c3c3c", command=comandos.get(btn_text),
                           width=60, height=20, font=(self.font_main, 12)).pack(side="left", padx=5)
 
     def _setup_left_panel(self):
@@ -159,9 +210,10 @@ class App(ctk.CTk):
         btn_frame = ctk.CTkFrame(actions_frame, fg_color="transparent")
         btn_frame.pack(fill="x", pady=(5, 0))
 
-        self.btn_rec = ctk.CTkButton(btn_frame, text="Gerar Recomendações",
+        # Desligado até o modelo terminar de carregar (_verificar_modelo libera)
+        self.btn_rec = ctk.CTkButton(btn_frame, text="CARREGANDO MODELO...",
                                      fg_color=self.colors["accent"], hover_color=self.colors["accent_hover"],
-                                     command=self.iniciar_recomendacao, height=35)
+                                     command=self.iniciar_recomendacao, height=35, state="disabled")
         self.btn_rec.pack(side="left", expand=True, fill="x", padx=(0, 5))
         
         ctk.CTkButton(btn_frame, text="Limpar", width=80, fg_color="#505050", hover_color="#666666",
@@ -169,9 +221,9 @@ class App(ctk.CTk):
 
         ctk.CTkLabel(list_container, text="Lista de Álbuns:", font=(self.font_main, 16, "bold")).pack(padx=10, pady=(10, 5), anchor="w")
         
-        self.list_scroll = ctk.CTkScrollableFrame(list_container, fg_color=self.colors["bg_dark"], label_text=None)
+        self.list_scroll = ListaVirtual(list_container, ALTURA_LINHA_ALBUM, self._criar_linha_album,
+                                        self._vincular_linha_album, fg_color=self.colors["bg_dark"])
         self.list_scroll.pack(padx=10, pady=(0, 10), fill="both", expand=True)
-        self.list_scroll.columnconfigure(0, weight=1)
 
     def _setup_right_panel(self):
         self.results_container = ctk.CTkFrame(self, fg_color=self.colors["bg_med"])
@@ -179,9 +231,9 @@ class App(ctk.CTk):
         
         ctk.CTkLabel(self.results_container, text="Álbuns Recomendados:", font=(self.font_main, 18, "bold")).pack(pady=15)
         
-        self.scroll_results = ctk.CTkScrollableFrame(self.results_container, fg_color="transparent")
+        self.scroll_results = ListaVirtual(self.results_container, ALTURA_LINHA_CARDS, self.criar_card,
+                                           self._vincular_card, colunas=2, fg_color="transparent")
         self.scroll_results.pack(fill="both", expand=True, padx=5, pady=5)
-        self.scroll_results.columnconfigure((0, 1), weight=1)
 
     # --- Lógica ---
 
@@ -195,11 +247,11 @@ class App(ctk.CTk):
         status, dados = self.sistema.buscar_candidatos(nome)
         if status == 'CACHE_HIT':
             self.after(0, lambda: self._add_visual(dados))
-            print(f"Cache: {dados}")
-        elif status == 'API_OPTIONS':
+            log(f"Cache: {dados}")
+        elif status in ('API_OPTIONS', 'CACHE_OPTIONS'):
             self.after(0, lambda: self._popup_escolha(dados))
         elif status == 'NOT_FOUND':
-            print(f"Não encontrado: {nome}")
+            log(f"Não encontrado: {nome}")
 
     def _popup_escolha(self, candidatos):
         popup = ctk.CTkToplevel(self)
@@ -218,95 +270,158 @@ class App(ctk.CTk):
                           ).pack(fill="x", pady=2)
 
     def _processar_novo(self, candidato):
-        if self.sistema.processar_escolha_usuario(candidato['objeto'], candidato['titulo'], candidato['artista']):
-            self.after(0, lambda: self._add_visual(candidato['titulo']))
-
-    def _add_visual(self, nome):
-        if nome in self.lista_albuns_usuario: return
-        self.lista_albuns_usuario.append(nome)
-        row = len(self.lista_albuns_usuario) - 1
-        ctk.CTkLabel(self.list_scroll, text=f"• {nome}", anchor="w", 
-                     font=(self.font_main, 20), height=25).grid(row=row, column=0, sticky="ew", padx=10, pady=1)
+        if 'id' in candidato:  # já está no modelo (mesmo título de vários artistas no cache)
+            album = candidato
+        else:
+            album = self.sistema.processar_escolha_usuario(candidato['objeto'], candidato['titulo'], candidato['artista'])
+        if album:
+            self.after(0, lambda: self._add_visual(album))
+
+    def _add_visual(self, *albuns):
+        novos = [a for a in albuns if a['id'] not in self.ids_usuario]
+        novos = list({a['id']: a for a in novos}.values())
+        if not novos: return
+        self.ids_usuario.update(a['id'] for a in novos)
+        self.lista_albuns_usuario.extend(novos)
+        self.list_scroll.anexar(novos)
+
+    def _criar_linha_album(self, pai):
+        return ctk.CTkLabel(pai, text="", anchor="w", font=(self.font_main, 20), height=25, padx=10)
+
+    def _vincular_linha_album(self, label, posicao, album):
+        texto = f"• {album['titulo']} — {album['artista']}" if album['artista'] else f"• {album['titulo']}"
+        label.configure(text=texto)
+
+    def importar_lista(self):
+        caminho = filedialog.askopenfilename(title="Importar lista de álbuns",
+                                             filetypes=[("Listas de álbuns", "*.txt *.csv"), ("Todos", "*.*")])
+        if not caminho: return
+        threading.Thread(target=self._thread_importacao, args=(caminho, self.cancelar_importacao),
+                         daemon=True).start()
+
+    def _thread_importacao(self, caminho, cancelar):
+        try:
+            entradas = ler_lista(caminho)
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            log(f"[Importação] Erro ao ler {caminho}: {e}")
+            return
+        log(f"[Importação] {len(entradas)} álbum(ns) em {caminho}")
+        faltando = importar(self.sistema, entradas, lambda album: self.fila_importacao.put((cancelar, album)),
+                            cancelar)
+        if cancelar.is_set(): return
+        log(f"[Importação] {len(entradas) - len(faltando)} álbum(ns) importado(s), {len(faltando)} não encontrado(s)")
+        for titulo, artista in faltando[:10]:
+            log(f"  - {artista + ' - ' if artista else ''}{titulo}")
+        if len(faltando) > 10: log(f"  ... e mais {len(faltando) - 10}")
+
+    def _descarregar_importacao(self):
+        albuns = []
+        while True:
+            try:
+                cancelar, album = self.fila_importacao.get_nowait()
+            except queue.Empty:
+                break
+            if not cancelar.is_set(): albuns.append(album)  # importação de antes do "Limpar"
+        if albuns: self._add_visual(*albuns)
+        self.after(INTERVALO_LOG_MS, self._descarregar_importacao)
 
     def limpar(self):
-        self.lista_albuns_usuario.clear()
-        for w in self.list_scroll.winfo_children(): w.destroy()
-        for w in self.scroll_results.winfo_children(): w.destroy()
+        self.rodada += 1
+        self.cancelar_importacao.set()
+        self.cancelar_importacao = threading.Event()
+        self.capas.clear()
+        self.lista_albuns_usuario = []
+        self.ids_usuario = set()
+        self.list_scroll.limpar()
+        self.scroll_results.limpar()
 
     def iniciar_recomendacao(self):
         if not self.lista_albuns_usuario:
-            print("Adicione álbuns para gerar recomendações.")
+            log("Adicione álbuns para gerar recomendações.")
             return
         
         self.btn_rec.configure(state="disabled", text="BUSCANDO...")
-        for w in self.scroll_results.winfo_children(): w.destroy()
-        
-        threading.Thread(target=self._thread_recomendacao, args=(int(self.slider.get()),)).start()
-
-    def _thread_recomendacao(self, qtd):
-        print("\n=== INICIANDO RECOMENDAÇÃO ===")
-        print(f"Busca original: {self.lista_albuns_usuario}")
-
-        recomendacoes = self.sistema.gerar_recomendacoes_com_detalhes(self.lista_albuns_usuario, qtd=qtd)
-
-        print(f">>> TOP {qtd:02} RECOMENDAÇÕES <<<")
+        self.scroll_results.limpar()
+        self.rodada += 1
+        self.capas.clear()
+
+        # Cópia: a lista continua crescendo na thread principal durante uma importação
+        threading.Thread(target=self._thread_recomendacao,
+                         args=(list(self.lista_albuns_usuario), int(self.slider.get()), self.rodada)).start()
+
+    def _thread_recomendacao(self, albuns, qtd, rodada):
+        log("\n=== INICIANDO RECOMENDAÇÃO ===")
+        titulos = [a['titulo'] for a in albuns[:10]]
+        log(f"Busca original: {titulos}" + (f" e mais {len(albuns) - 10}" if len(albuns) > 10 else ""))
+
+        # Chamado nas threads do Last.fm assim que cada álbum fica pronto:
+        # o card aparece na hora e a capa é baixada em paralelo, sem esperar os outros
+        def ao_detalhar(posicao, item):
+            self.after(0, lambda: self._mostrar_card(rodada, posicao, item))
+            if item.get('image_url'):
+                self.baixador.agendar(item['image_url'],
+                                      lambda img: self.after(0, lambda: self._definir_capa(rodada, posicao, img)))
+
+        recomendacoes = self.sistema.gerar_recomendacoes_com_detalhes(albuns, qtd=qtd,
+                                                                      ao_detalhar=ao_detalhar)
+
+        log(f">>> TOP {qtd:02} RECOMENDAÇÕES <<<")
         for i, item in enumerate(recomendacoes, 1):
-            print(f"{i}: {item['album']} ({item['score']:.1f}%)")
-
-        print("\n=== DOWNLOAD DAS IMAGENS ===")
-        
-        session = requests.Session()
-        final_data = []
-
-        for item in recomendacoes:
-            img_tk = None
-            url = item.get('image_url')
-            if url:
-                try:
-                    print(f"Baixando: {item['album']}")
-                    resp = session.get(url, timeout=10)
-                    if resp.status_code == 200:
-                        img_pil = Image.open(BytesIO(resp.content))
-                        img_tk = ctk.CTkImage(light_image=img_pil, dark_image=img_pil, size=(160, 160))
-                except Exception as e:
-                    print(f"Erro download {item['album']}: {e}")
-
-            item['image_obj'] = img_tk
-            final_data.append(item)
-
-        print("\n=== FINALIZADO ===\n")
-        self.after(0, lambda: self._mostrar_resultados(final_data))
-
-    def _mostrar_resultados(self, dados):
-        self.btn_rec.configure(state="normal", text="Gerar Recomendações")
-        for i, item in enumerate(dados):
-            self.criar_card(i, item)
-
-    def criar_card(self, index, item):
-        card = ctk.CTkFrame(self.scroll_results, fg_color="transparent")
-        card.grid(row=index//2, column=index%2, padx=10, pady=10)
+            log(f"{i}: {item['album']} - {item['artist']} ({item['score']:.1f}%)")
+
+        if self.primeira_recomendacao:
+            self.primeira_recomendacao = False
+            self._marcar_inicio('inicio.primeira_recomendacao')
+        log("\n=== FINALIZADO (capas chegando em segundo plano) ===\n")
+        self.after(0, lambda: self.btn_rec.configure(state="normal", text="Gerar Recomendações"))
+
+    def _mostrar_card(self, rodada, posicao, item):
+        if rodada != self.rodada: return
+        self.scroll_results.atualizar(posicao, item)
+
+    def _definir_capa(self, rodada, posicao, img_pil):
+        if rodada != self.rodada or img_pil is None: return
+        self.capas[posicao] = ctk.CTkImage(light_image=img_pil, dark_image=img_pil, size=(160, 160))
+        self.scroll_results.atualizar(posicao)
+
+    def criar_card(self, pai):
+        # Card vazio do conjunto da lista virtual: _vincular_card o preenche com a recomendação da vez
+        card = ctk.CTkFrame(pai, fg_color="transparent")
         card.columnconfigure(0, weight=1)
 
         # Match Score
-        ctk.CTkLabel(card, text=f"{item.get('score', 0):.1f}% Match", 
-                     font=(self.font_main, 14, "bold"), text_color="#00bdb6").grid(row=0, column=0, sticky="w", pady=(0, 5))
-
-        # Imagem ou Placeholder
-        if item['image_obj']:
-            ctk.CTkLabel(card, text="", image=item['image_obj'], corner_radius=0).grid(row=1, column=0)
+        card.score = ctk.CTkLabel(card, text="", font=(self.font_main, 14, "bold"), text_color="#00bdb6")
+        card.score.grid(row=0, column=0, sticky="w", pady=(0, 5))
+
+        # Placeholder e capa na mesma célula: só um dos dois fica no grid
+        card.placeholder = ctk.CTkFrame(card, width=160, height=160, corner_radius=0)
+        card.placeholder.grid(row=1, column=0)
+        card.placeholder.grid_propagate(False)
+        ctk.CTkLabel(card.placeholder, text="Foto do album",
+                     font=(self.font_main, 14, "bold")).place(relx=0.5, rely=0.5, anchor="center")
+        card.capa = ctk.CTkLabel(card, text="", corner_radius=0)
+        card.capa.grid(row=1, column=0)
+        card.capa.grid_remove()
+
+        card.album = ctk.CTkLabel(card, text="", font=(self.font_main, 14, "bold"))
+        card.album.grid(row=2, column=0, sticky="w", pady=(5, 0))
+        card.artista = ctk.CTkLabel(card, text="", font=(self.font_main, 11), text_color="gray")
+        card.artista.grid(row=3, column=0, sticky="w")
+        return card
+
+    def _vincular_card(self, card, index, item):
+        card.score.configure(text=f"{item.get('score', 0):.1f}% Match")
+        card.album.configure(text=self._truncar_texto(item['album'], 18))
+        card.artista.configure(text=self._truncar_texto(item['artist'], 22))
+        capa = self.capas.get(index)
+        if capa is None:
+            card.capa.grid_remove()
+            card.placeholder.configure(fg_color=self.colors["placeholder"][index % len(self.colors["placeholder"])])
+            card.placeholder.grid()
         else:
-            color = self.colors["placeholder"][index % len(self.colors["placeholder"])]
-            placeholder = ctk.CTkFrame(card, width=160, height=160, fg_color=color, corner_radius=0)
-            placeholder.grid(row=1, column=0)
-            placeholder.grid_propagate(False)
-            ctk.CTkLabel(placeholder, text="Foto do album", 
-                         font=(self.font_main, 14, "bold")).place(relx=0.5, rely=0.5, anchor="center")
-
-        ctk.CTkLabel(card, text=self._truncar_texto(item['album'], 18), 
-                     font=(self.font_main, 14, "bold")).grid(row=2, column=0, sticky="w", pady=(5, 0))
-        
-        ctk.CTkLabel(card, text=self._truncar_texto(item['artist'], 22), 
-                     font=(self.font_main, 11), text_color="gray").grid(row=3, column=0, sticky="w")
+            card.capa.configure(image=capa)
+            card.placeholder.grid_remove()
+            card.capa.grid()
 
 if __name__ == "__main__":
     app = App()
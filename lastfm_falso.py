@@ -0,0 +1,189 @@
+"""
+Substituto local do pylast.LastFMNetwork para benchmarks e testes de carga.
+Responde de forma determinística (derivada do nome) com latência configurável, sem acessar a rede.
+
+ServidorLastfmFalso faz o mesmo por HTTP (a API REST que a RedeHttp usa), com falhas injetadas.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+TAGS_FALSAS = ['Rock', 'Electronic', 'Jazz', 'Hip-Hop', 'Ambient', 'Folk', 'Metal', 'Pop',
+               'Experimental', 'Soul', 'Punk', 'Indie', 'Classical', 'Post-Rock', 'Shoegaze']
+
+
+def _semente(*partes):
+    return int(hashlib.md5('|'.join(partes).encode()).hexdigest()[:8], 16)
+
+
+class _Item:
+    def __init__(self, nome):
+        self.nome = nome
+
+    def get_name(self):
+        return self.nome
+
+
+class _TopItem:
+    def __init__(self, nome, peso):
+        self.item = _Item(nome)
+        self.weight = peso
+
+
+class _Artista:
+    def __init__(self, rede, nome):
+        self.rede = rede
+        self.name = nome
+
+    def get_top_tags(self, limit=None):
+        self.rede._esperar()
+        return self.rede._tags(self.name)[:limit]
+
+
+class _Album:
+    def __init__(self, rede, artista, titulo, com_info=False):
+        self.rede = rede
+        self.artist = _Artista(rede, artista)
+        self.title = titulo
+        self.com_info = com_info  # resultados de busca já trazem a capa; get_album precisa de album.getInfo
+
+    def get_top_tags(self, limit=None):
+        self.rede._esperar()
+        return self.rede._tags(self.artist.name, self.title)[:limit]
+
+    def get_cover_image(self, size=3):
+        if not self.com_info:
+            self.rede._esperar()
+            self.com_info = True
+        return f"http://capas.local/{_semente(self.artist.name, self.title):08x}.png"
+
+
+class _Busca:
+    def __init__(self, rede, consulta):
+        self.rede = rede
+        self.consulta = consulta
+
+    def get_next_page(self):
+        self.rede._esperar()
+        artista = f"Artista {_semente(self.consulta) % 1000}"
+        return [_Album(self.rede, artista, self.consulta, com_info=True)]
+
+
+class LastFmFalso:
+    def __init__(self, latencia=0.2):
+        self.latencia = latencia
+        self.chamadas = 0
+
+    def _esperar(self):
+        self.chamadas += 1
+        if self.latencia: time.sleep(self.latencia)
+
+    def _tags(self, *chave):
+        semente = _semente(*chave)
+        n = 1 + semente % 3
+        nomes = [TAGS_FALSAS[(semente >> (4 * i)) % len(TAGS_FALSAS)] for i in range(n)]
+        return [_TopItem(nome, 100 - 30 * i) for i, nome in enumerate(dict.fromkeys(nomes))]
+
+    def search_for_album(self, album_name):
+        return _Busca(self, album_name)
+
+    def get_album(self, artist, title):
+        return _Album(self, artist, title)
+
+    def get_artist(self, artist_name):
+        return _Artista(self, artist_name)
+
+
+class _TratadorFalso(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive: a RedeHttp reaproveita as conexões
+    wbufsize = -1                  # cabeçalho e corpo num envio só (sem esperar o ACK atrasado do cliente)
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.falso.lock:
+            self.server.falso.conexoes += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        falso = self.server.falso
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        metodo = params.get('method', '')
+        with falso.lock:
+            falso.chamadas[metodo] += 1
+            sorteio = falso.rng.random()
+            fora_do_ar = falso.fora_do_ar
+        if falso.latencia: time.sleep(falso.latencia)
+
+        if fora_do_ar or sorteio < falso.taxa_falhas / 3:
+            return self._responder(503, {'error': 11, 'message': 'Service Offline'})
+        if sorteio < 2 * falso.taxa_falhas / 3:
+            return self._responder(200, {'error': 16, 'message': 'There was a temporary error processing your request'})
+        if sorteio < falso.taxa_falhas:
+            self.close_connection = True  # conexão derrubada sem resposta
+            return
+        self._responder(200, falso.responder(metodo, params))
+
+    def _responder(self, status, dados):
+        corpo = json.dumps(dados).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+
+class ServidorLastfmFalso:
+    """
+    API REST do Last.fm (album.getTopTags, artist.getTopTags, album.getInfo, album.search) num servidor
+    HTTP local. 'taxa_falhas' das requisições recebem HTTP 503, o erro temporário 16 da API ou têm a
+    conexão derrubada; com 'fora_do_ar' tudo responde 503. 'frac_sem_tags' dos álbuns não têm tags
+    próprias (forçam a busca pelo artista). 'chamadas' conta as requisições por método.
+    """
+
+    def __init__(self, latencia=0.0, taxa_falhas=0.0, frac_sem_tags=0.0, semente=0):
+        self.latencia = latencia
+        self.taxa_falhas = taxa_falhas
+        self.frac_sem_tags = frac_sem_tags
+        self.fora_do_ar = False
+        self.rng = random.Random(semente)
+        self.lock = threading.Lock()
+        self.chamadas = Counter()
+        self.conexoes = 0
+        self.tags = LastFmFalso(latencia=0)
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), _TratadorFalso)
+        self.servidor.daemon_threads = True
+        self.servidor.falso = self
+        self.url = f"http://127.0.0.1:{self.servidor.server_port}/2.0/"
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def sem_tags(self, artista, album):
+        return _semente(artista, album) % 1000 < self.frac_sem_tags * 1000
+
+    def responder(self, metodo, params):
+        artista, album = params.get('artist', ''), params.get('album', '')
+        capas = [{'#text': f"http://capas.local/{_semente(artista, album):08x}-{tamanho}.png", 'size': tamanho}
+                 for tamanho in ('small', 'medium', 'large', 'extralarge')]
+        if metodo == 'album.getTopTags':
+            tags = [] if self.sem_tags(artista, album) else self.tags._tags(artista, album)
+            return {'toptags': {'tag': [{'name': t.item.get_name(), 'count': t.weight} for t in tags]}}
+        if metodo == 'artist.getTopTags':
+            return {'toptags': {'tag': [{'name': t.item.get_name(), 'count': t.weight}
+                                        for t in self.tags._tags(artista)]}}
+        if metodo == 'album.getInfo':
+            return {'album': {'name': album, 'artist': artista, 'image': capas}}
+        if metodo == 'album.search':
+            artista = f"Artista {_semente(album) % 1000}"
+            return {'results': {'albummatches': {'album': [{'name': album, 'artist': artista, 'image': capas}]}}}
+        return {'error': 3, 'message': 'Invalid Method'}
+
+    def fechar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
@@ -0,0 +1,137 @@
+"""
+Lista virtualizada para a interface: só existem widgets para as linhas visíveis.
+
+Os itens ficam numa lista Python; um conjunto fixo de células (criadas uma vez, quantas cabem na altura
+da área mais LINHAS_EXTRAS) é reposicionado com place() e re-preenchido ao rolar. Mostrar, rolar ou
+limpar custa o mesmo com 10 ou 100 mil itens: nenhum widget é criado ou destruído depois do primeiro
+desenho (só quando a janela cresce). Com colunas > 1 vira uma grade de 'colunas' células por linha.
+
+Cada linha visível usa sempre a mesma célula enquanto está na tela (linha % linhas do conjunto), então
+rolar uma linha re-preenche uma linha só. Alterações (definir, anexar, atualizar) são juntadas num
+redesenho só, no próximo momento ocioso do Tk.
+"""
+import math
+
+import customtkinter as ctk
+
+# ================= CONFIGURAÇÃO =================
+LINHAS_EXTRAS = 1       # células além das que cabem na área (a linha que entra pela metade ao rolar)
+PIXELS_RODA = 60        # rolagem por clique da roda do mouse
+
+
+class ListaVirtual(ctk.CTkFrame):
+    """
+    Lista (ou grade, com colunas > 1) de itens com altura fixa por linha.
+
+    'criar(pai)' cria o widget de uma célula (filho de 'pai'); 'vincular(widget, posicao, item)' o
+    preenche com o item da posição. Posições com item None ficam vazias (ex: card que ainda não chegou).
+    """
+
+    def __init__(self, master, altura_linha, criar, vincular, colunas=1, **kwargs):
+        super().__init__(master, **kwargs)
+        self.altura_linha = altura_linha
+        self.criar = criar
+        self.vincular = vincular
+        self.colunas = colunas
+        self.itens = []
+        self.topo = 0               # pixels rolados
+        self.celulas = []           # conjunto fixo de widgets
+        self.vinculadas = []        # posição que cada célula mostra agora (None = escondida)
+        self.redesenho_agendado = False
+
+        self.area = ctk.CTkFrame(self, fg_color="transparent", corner_radius=0)
+        self.area.pack(side="left", fill="both", expand=True)
+        self.barra = ctk.CTkScrollbar(self, command=self._rolar_barra)
+        self.barra.pack(side="right", fill="y")
+        self.area.bind("<Configure>", lambda e: self._agendar())
+        # Os widgets das células mudam o tempo todo: a roda é tratada num bind global filtrado pelo caminho
+        for evento in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.bind_all(evento, self._roda, add="+")
+
+    def __len__(self):
+        return len(self.itens)
+
+    def definir(self, itens):
+        """Troca todos os itens e volta ao topo."""
+        self.itens = list(itens)
+        self.topo = 0
+        self.vinculadas = [None] * len(self.celulas)
+        self._agendar()
+
+    def anexar(self, itens):
+        self.itens.extend(itens)
+        self._agendar()
+
+    def atualizar(self, posicao, item=None):
+        """Re-preenche a posição (se estiver visível); com 'item', troca o item dela antes (crescendo a lista)."""
+        if item is not None:
+            if posicao >= len(self.itens): self.itens.extend([None] * (posicao + 1 - len(self.itens)))
+            self.itens[posicao] = item
+        self.vinculadas = [None if p == posicao else p for p in self.vinculadas]
+        self._agendar()
+
+    def limpar(self):
+        self.definir([])
+
+    def _agendar(self):
+        if not self.redesenho_agendado:
+            self.redesenho_agendado = True
+            self.after_idle(self._redesenhar)
+
+    def _altura_visivel(self):
+        # place() escala as coordenadas com o widget: as contas são feitas em pixels não escalados
+        return max(1, self.area.winfo_height() / self._get_widget_scaling())
+
+    def _altura_total(self):
+        return math.ceil(len(self.itens) / self.colunas) * self.altura_linha
+
+    def _redesenhar(self):
+        self.redesenho_agendado = False
+        altura, total = self._altura_visivel(), self._altura_total()
+        self.topo = max(0, min(self.topo, total - altura))
+        if total: self.barra.set(self.topo / total, min(1.0, (self.topo + altura) / total))
+        else: self.barra.set(0, 1)
+
+        n_linhas = math.ceil(altura / self.altura_linha) + LINHAS_EXTRAS
+        if len(self.celulas) < n_linhas * self.colunas:
+            # Janela cresceu: mais células, e o mapeamento linha -> célula muda para todas
+            while len(self.celulas) < n_linhas * self.colunas:
+                self.celulas.append(self.criar(self.area))
+            self.vinculadas = [None] * len(self.celulas)
+        linhas_conjunto = len(self.celulas) // self.colunas
+
+        primeira = int(self.topo // self.altura_linha)
+        usadas = set()
+        for linha in range(primeira, primeira + linhas_conjunto):
+            for coluna in range(self.colunas):
+                posicao = linha * self.colunas + coluna
+                item = self.itens[posicao] if posicao < len(self.itens) else None
+                if item is None: continue
+                c = (linha % linhas_conjunto) * self.colunas + coluna
+                usadas.add(c)
+                if self.vinculadas[c] != posicao:
+                    self.vincular(self.celulas[c], posicao, item)
+                    self.vinculadas[c] = posicao
+                self.celulas[c].place(relx=coluna / self.colunas, y=linha * self.altura_linha - self.topo,
+                                      relwidth=1 / self.colunas)
+        for c, celula in enumerate(self.celulas):
+            if c not in usadas:
+                celula.place_forget()
+                self.vinculadas[c] = None
+
+    def _rolar_para(self, topo):
+        self.topo = topo
+        self._agendar()
+
+    def _rolar_barra(self, acao, valor, unidade=None):
+        if acao == 'moveto':
+            self._rolar_para(float(valor) * self._altura_total())
+        elif unidade == 'pages':
+            self._rolar_para(self.topo + float(valor) * self._altura_visivel())
+        else:  # roda do mouse sobre a barra (o delta muda de escala entre sistemas: só o sentido conta)
+            self._rolar_para(self.topo + math.copysign(PIXELS_RODA, float(valor)))
+
+    def _roda(self, evento):
+        if not str(evento.widget).startswith(str(self.area) + '.'): return  # a barra rola sozinha
+        para_cima = evento.num == 4 or getattr(evento, 'delta', 0) > 0
+        self._rolar_para(self.topo + (-PIXELS_RODA if para_cima else PIXELS_RODA))
@@ -0,0 +1,579 @@
+import itertools
+from array import array
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from caracteristicas import BLOCOS, bloco_da_coluna, chave_equivalencia, validar_pesos
+from indices_vizinhos import TabelaVizinhos, criar_indice, normalizar_linhas
+
+# ================= CONFIGURAÇÃO =================
+LIMIAR_DERIVA = 0.05  # variação relativa (L1) do vetor IDF que dispara uma reconstrução completa
+ELEMENTOS_BLOCO_LOTE = 1 << 24  # similaridades calculadas de uma vez no lote (float64: 128 MB)
+AMOSTRA_LOTE = 4                # amostra de AMOSTRA_LOTE*sqrt(k*n) álbuns para estimar o corte do top-k
+DELTA_MINIMO = 1024             # inserções acumuladas antes de fundir o mapa id -> linha (e copiar o mapa base)
+
+
+def calcular_idf(freq_docs, n_docs):
+    # Mesma fórmula do TfidfTransformer (smooth_idf=True)
+    return np.log((1.0 + n_docs) / (1.0 + freq_docs)) + 1.0
+
+
+class MatrizIncremental:
+    """
+    Matriz CSR com inserção de linhas em O(1) amortizado.
+    Os buffers crescem geometricamente e a matriz exposta é apenas uma 'view' sobre eles.
+    Só se escreve depois do fim atual (ou em buffers novos, ao crescer): uma view já entregue nunca muda.
+    """
+
+    def __init__(self, n_colunas=0, capacidade_linhas=1024, capacidade_nnz=4096):
+        self.n_linhas = 0
+        self.n_colunas = n_colunas
+        self.nnz = 0
+        self.compartilhada = False
+        self._data = np.zeros(capacidade_nnz, dtype=np.float64)
+        self._indices = np.zeros(capacidade_nnz, dtype=np.int32)
+        self._indptr = np.zeros(capacidade_linhas + 1, dtype=np.int32)
+
+    @classmethod
+    def de_arrays(cls, data, indices, indptr, n_colunas):
+        """
+        Usa os arrays sem copiar (ex: np.memmap somente leitura, compartilhado entre processos).
+        A cópia privada só acontece na primeira alteração.
+        """
+        nova = cls.__new__(cls)
+        nova.n_linhas = len(indptr) - 1
+        nova.n_colunas = n_colunas
+        nova.nnz = len(data)
+        nova.compartilhada = True
+        nova._data, nova._indices, nova._indptr = data, indices, indptr
+        return nova
+
+    def _privatizar(self):
+        self.compartilhada = False
+        data = np.zeros(max(self.nnz * 2, 4096), dtype=np.float64)
+        indices = np.zeros(len(data), dtype=np.int32)
+        indptr = np.zeros(max(self.n_linhas * 2, 1024) + 1, dtype=np.int32)
+        data[:self.nnz] = self._data[:self.nnz]
+        indices[:self.nnz] = self._indices[:self.nnz]
+        indptr[:self.n_linhas + 1] = self._indptr[:self.n_linhas + 1]
+        self._data, self._indices, self._indptr = data, indices, indptr
+
+    @classmethod
+    def de_csr(cls, matriz):
+        matriz = csr_matrix(matriz)
+        matriz.sum_duplicates()
+        nova = cls(matriz.shape[1], max(matriz.shape[0] * 2, 1024), max(matriz.nnz * 2, 4096))
+        nova.n_linhas = matriz.shape[0]
+        nova.nnz = matriz.nnz
+        nova._data[:matriz.nnz] = matriz.data
+        nova._indices[:matriz.nnz] = matriz.indices
+        nova._indptr[:matriz.shape[0] + 1] = matriz.indptr
+        return nova
+
+    def _crescer(self, linhas_extra, nnz_extra):
+        if self.n_linhas + linhas_extra + 1 > len(self._indptr):
+            novo = np.zeros(max(len(self._indptr) * 2, self.n_linhas + linhas_extra + 1), dtype=np.int32)
+            novo[:self.n_linhas + 1] = self._indptr[:self.n_linhas + 1]
+            self._indptr = novo
+        if self.nnz + nnz_extra > len(self._data):
+            tamanho = max(len(self._data) * 2, self.nnz + nnz_extra)
+            data = np.zeros(tamanho, dtype=np.float64)
+            indices = np.zeros(tamanho, dtype=np.int32)
+            data[:self.nnz] = self._data[:self.nnz]
+            indices[:self.nnz] = self._indices[:self.nnz]
+            self._data, self._indices = data, indices
+
+    def adicionar_linha(self, colunas, valores):
+        if self.compartilhada: self._privatizar()
+        ordem = np.argsort(colunas)
+        colunas = np.asarray(colunas, dtype=np.int32)[ordem]
+        valores = np.asarray(valores, dtype=np.float64)[ordem]
+
+        self._crescer(1, len(colunas))
+        fim = self.nnz + len(colunas)
+        self._data[self.nnz:fim] = valores
+        self._indices[self.nnz:fim] = colunas
+        self.n_linhas += 1
+        self._indptr[self.n_linhas] = fim
+        self.nnz = fim
+        if len(colunas):
+            self.n_colunas = max(self.n_colunas, int(colunas[-1]) + 1)
+        return self.n_linhas - 1
+
+    def linha(self, idx):
+        ini, fim = self._indptr[idx], self._indptr[idx + 1]
+        return self._indices[ini:fim], self._data[ini:fim]
+
+    def como_csr(self):
+        # Monta a csr_matrix por atribuição direta: o construtor copiaria os buffers (O(nnz)).
+        matriz = csr_matrix((1, max(self.n_colunas, 1)))
+        matriz.data = self._data[:self.nnz]
+        matriz.indices = self._indices[:self.nnz]
+        matriz.indptr = self._indptr[:self.n_linhas + 1]
+        matriz._shape = (self.n_linhas, self.n_colunas)
+        return matriz
+
+
+class TabelaNomes:
+    """
+    Lista de nomes guardada como bytes UTF-8 concatenados + offsets (cabe num np.memmap).
+    Nomes acrescentados depois da carga ficam numa lista Python à parte.
+    """
+
+    def __init__(self, dados=b'', offsets=None):
+        self.dados = dados
+        self.offsets = np.zeros(1, dtype=np.int64) if offsets is None else offsets
+        self.extras = []
+
+    @classmethod
+    def de_lista(cls, nomes):
+        codificados = [str(n).encode('utf-8') for n in nomes]
+        offsets = np.zeros(len(codificados) + 1, dtype=np.int64)
+        np.cumsum([len(c) for c in codificados], out=offsets[1:])
+        return cls(np.frombuffer(b''.join(codificados), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1 + len(self.extras)
+
+    def __getitem__(self, i):
+        n_base = len(self.offsets) - 1
+        if i < 0: i += len(self)
+        if i >= n_base: return self.extras[i - n_base]
+        return bytes(self.dados[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, nome):
+        self.extras.append(nome)
+
+
+class TabelaIds:
+    """Ids inteiros por linha: array base (pode ser np.memmap) + lista Python com os acrescentados depois."""
+
+    def __init__(self, base=None):
+        self.base = np.zeros(0, dtype=np.int64) if base is None else base
+        self.extras = []
+
+    def __len__(self):
+        return len(self.base) + len(self.extras)
+
+    def __getitem__(self, i):
+        if i < 0: i += len(self)
+        if i >= len(self.base): return self.extras[i - len(self.base)]
+        return int(self.base[i])
+
+    def __iter__(self):
+        yield from self.base.tolist()
+        yield from self.extras
+
+    def append(self, id_album):
+        self.extras.append(id_album)
+
+    def como_array(self, n=None):
+        """As primeiras 'n' entradas (todas, se None) como array int64."""
+        n = len(self) if n is None else n
+        if n <= len(self.base): return np.asarray(self.base[:n], dtype=np.int64)
+        return np.concatenate([np.asarray(self.base, dtype=np.int64),
+                               np.asarray(self.extras[:n - len(self.base)], dtype=np.int64)])
+
+
+def chave_album(titulo, artista=''):
+    # Identidade de um álbum: o mesmo título de artistas diferentes são álbuns diferentes
+    return (artista or '', titulo)
+
+
+class ModeloTfidfIncremental:
+    """
+    Matriz álbum x tag em TF-IDF com atualização incremental.
+
+    Cada novo álbum vira uma linha nova calculada com o IDF congelado do modelo ('idf_modelo');
+    as estatísticas (frequência de documentos e total de álbuns) são atualizadas a cada inserção.
+    Quando o IDF real se afasta do congelado além de 'limiar_deriva', o modelo é reconstruído.
+    """
+
+    def __init__(self, limiar_deriva=LIMIAR_DERIVA, tipo_indice='exato', k_vizinhos=0):
+        self.limiar_deriva = limiar_deriva
+        self.matriz = MatrizIncremental()
+        self.indice = criar_indice(tipo_indice)
+        self.indice.construir(self.matriz.como_csr())
+        # Tabela de vizinhos pré-calculados (opcional): k > 0 a mantém junto do índice
+        self.vizinhos = TabelaVizinhos(k_vizinhos) if k_vizinhos else None
+        if self.vizinhos is not None: self.vizinhos.construir(self.matriz.como_csr())
+        self.nomes = []             # linha -> título do álbum (list ou TabelaNomes)
+        self.artistas = []          # linha -> artista do álbum (list ou TabelaNomes)
+        self.ids = TabelaIds()      # linha -> id estável do álbum (não muda com a reconstrução)
+        self.proximo_id = 0
+        self._ids_chaves = {}       # (artista, título) -> id; só recebe chaves novas (montado sob demanda)
+        self._linhas_base = array('q')  # id -> linha ativa ou -1 (montado sob demanda, nunca alterado)
+        self._linhas_delta = {}     # id -> linha das inserções posteriores ao mapa base
+        self.mortas = set()         # linhas substituídas, removidas na reconstrução
+        self.tags = []              # coluna -> nome da tag
+        self.colunas = {}           # nome da tag -> coluna
+        self.blocos = array('b')    # coluna -> posição do seu bloco em BLOCOS (pesos na consulta)
+        self._equivalentes = None   # chave_equivalencia -> colunas de gênero/descritor (montado sob demanda)
+        self.freq_docs = np.zeros(0)
+        self.idf_modelo = np.zeros(0)
+
+    @classmethod
+    def de_matriz(cls, matriz_tfidf, nomes, tags, limiar_deriva=LIMIAR_DERIVA, tipo_indice='exato', artistas=None,
+                  k_vizinhos=0):
+        """
+        Reconstrói o estado incremental a partir de uma matriz TF-IDF já treinada.
+        Sem 'artistas' (modelos antigos, só com títulos) o artista fica vazio; os ids são as linhas.
+        """
+        modelo = cls(limiar_deriva, tipo_indice, k_vizinhos)
+        modelo.matriz = MatrizIncremental.de_csr(matriz_tfidf)
+        modelo.matriz.n_colunas = len(tags)
+        modelo.nomes = list(nomes)
+        modelo.artistas = [''] * len(modelo.nomes) if artistas is None else list(artistas)
+        modelo.ids = TabelaIds(np.arange(len(modelo.nomes), dtype=np.int64))
+        modelo.proximo_id = len(modelo.nomes)
+        modelo._ids_chaves = None
+        modelo._linhas_base = None
+        modelo.tags = list(tags)
+        modelo.colunas = {tag: j for j, tag in enumerate(modelo.tags)}
+        modelo.blocos = _blocos_das_colunas(modelo.tags)
+
+        csr = modelo.matriz.como_csr()
+        modelo.freq_docs = np.bincount(csr.indices[csr.data != 0], minlength=len(tags)).astype(np.float64)
+        modelo.idf_modelo = calcular_idf(modelo.freq_docs, modelo.n_albuns)
+        modelo.indice.construir(csr)
+        if modelo.vizinhos is not None: modelo.vizinhos.construir(csr)
+        return modelo
+
+    @classmethod
+    def de_arrays(cls, data, indices, indptr, nomes, tags, freq_docs, idf_modelo, limiar_deriva=LIMIAR_DERIVA,
+                  indice=None, artistas=None, ids=None, proximo_id=None):
+        """
+        Monta o modelo sobre arrays já prontos (sem cópia), ex: os np.memmap do pacote salvo.
+        'indice' já carregado é reaproveitado; sem ele, um índice exato é construído.
+        """
+        modelo = cls(limiar_deriva)
+        modelo.matriz = MatrizIncremental.de_arrays(data, indices, indptr, len(tags))
+        modelo.nomes = nomes
+        modelo.artistas = artistas if artistas is not None else [''] * len(nomes)
+        modelo.ids = TabelaIds(ids if ids is not None else np.arange(len(nomes), dtype=np.int64))
+        modelo.proximo_id = proximo_id if proximo_id is not None else len(nomes)
+        modelo._ids_chaves = None
+        modelo._linhas_base = None
+        modelo.tags = list(tags)
+        modelo.colunas = {tag: j for j, tag in enumerate(modelo.tags)}
+        modelo.blocos = _blocos_das_colunas(modelo.tags)
+        modelo.freq_docs = np.array(freq_docs, dtype=np.float64)
+        modelo.idf_modelo = np.array(idf_modelo, dtype=np.float64)
+        if indice is not None:
+            modelo.indice = indice
+        else:
+            modelo.indice.construir(modelo.matriz.como_csr())
+        return modelo
+
+    def _mapear_para_csv(self, agregados):
+        """
+        Colunas de gênero/descritor do CSV com o mesmo nome das tags do Last.fm do álbum (peso da tag).
+        Álbuns adicionados pela aplicação só trazem tags do Last.fm: num modelo treinado sem o checkpoint
+        (só os blocos do CSV) eles não teriam nenhuma coluna em comum com o catálogo.
+        """
+        if self._equivalentes is None:
+            self._equivalentes = {}
+            for tag in self.tags:
+                if bloco_da_coluna(tag) in ('generos', 'descritores'):
+                    self._equivalentes.setdefault(chave_equivalencia(tag), []).append(tag)
+        mapeados = {}
+        for tag, peso in agregados.items():
+            if bloco_da_coluna(tag) != 'tags': continue
+            for coluna in self._equivalentes.get(chave_equivalencia(tag), ()):
+                if coluna not in agregados: mapeados[coluna] = max(mapeados.get(coluna, 0.0), peso)
+        return mapeados
+
+    def _base(self):
+        # Montado só no primeiro uso para a carga do modelo não ser O(álbuns)
+        if self._linhas_base is None:
+            self._linhas_base = _mapa_linhas(self.ids, len(self.nomes), self.mortas, self.proximo_id)
+            self._linhas_delta = {}
+        return self._linhas_base
+
+    def _chaves(self):
+        if self._ids_chaves is None:
+            self._ids_chaves = _mapa_chaves(self.nomes, self.artistas, self.ids, len(self.nomes))
+        return self._ids_chaves
+
+    @property
+    def n_albuns(self):
+        return len(self.nomes) - len(self.mortas)
+
+    @property
+    def matriz_tfidf(self):
+        return self.matriz.como_csr()
+
+    def id_album(self, titulo, artista=''):
+        return self._chaves().get(chave_album(titulo, artista))
+
+    def linha_do_id(self, id_album):
+        self._base()
+        return _linha_do_id(self, id_album)
+
+    def linha(self, titulo, artista=''):
+        id_album = self.id_album(titulo, artista)
+        return None if id_album is None else self.linha_do_id(id_album)
+
+    def instantaneo(self):
+        """Visão imutável do estado atual (custo proporcional às inserções desde a última fusão, não ao total)."""
+        return InstantaneoModelo(self.matriz.como_csr(), self.nomes, self.artistas, self.ids, self.blocos,
+                                 self.mortas, self.indice.instantaneo(), self._ids_chaves, self._linhas_base,
+                                 self._linhas_delta, self.vizinhos.instantaneo() if self.vizinhos is not None else None)
+
+    def deriva(self):
+        if self.n_albuns == 0: return 0.0
+        base = self.idf_modelo.sum()
+        if base == 0: return float('inf')
+        idf_atual = calcular_idf(self.freq_docs, self.n_albuns)
+        return float(np.abs(idf_atual - self.idf_modelo).sum() / base)
+
+    def adicionar_album(self, nome, tags_pesos, artista=''):
+        """
+        Insere (ou substitui) o álbum (artista, título) a partir de pares (tag, peso); a substituição mantém o id.
+        Retorna True se a deriva do IDF passou do limiar e o modelo precisa ser reconstruído.
+        """
+        # Agrega tags repetidas pela média, como o pivot_table fazia
+        agregados = {}
+        for tag, peso in tags_pesos:
+            agregados.setdefault(tag, []).append(float(peso))
+        agregados = {tag: np.mean(p) for tag, p in agregados.items() if np.mean(p) != 0}
+        agregados.update(self._mapear_para_csv(agregados))
+
+        # Substituição: a linha antiga vira morta (fica na matriz, ignorada nas buscas) e sai das estatísticas
+        self._base()
+        chaves = self._chaves()
+        id_album = chaves.get(chave_album(nome, artista))
+        antiga = None if id_album is None else self.linha_do_id(id_album)
+        if id_album is None:
+            id_album = self.proximo_id
+            self.proximo_id += 1
+            chaves[chave_album(nome, artista)] = id_album
+        if antiga is not None:
+            cols_antigas, vals_antigos = self.matriz.linha(antiga)
+            self.freq_docs[cols_antigas[vals_antigos != 0]] -= 1
+            self.mortas.add(antiga)
+
+        # Tags inéditas ganham coluna nova com o IDF do momento em que aparecem
+        n_novo = self.n_albuns + 1
+        for tag in agregados:
+            if tag not in self.colunas:
+                self.colunas[tag] = len(self.tags)
+                self.tags.append(tag)
+                self.blocos.append(BLOCOS.index(bloco_da_coluna(tag)))
+                if self._equivalentes is not None and bloco_da_coluna(tag) in ('generos', 'descritores'):
+                    self._equivalentes.setdefault(chave_equivalencia(tag), []).append(tag)
+                self.freq_docs = np.append(self.freq_docs, 0.0)
+                self.idf_modelo = np.append(self.idf_modelo, calcular_idf(1.0, n_novo))
+
+        colunas = np.array([self.colunas[t] for t in agregados], dtype=np.int32)
+        valores = np.array(list(agregados.values()), dtype=np.float64) * self.idf_modelo[colunas]
+        norma = np.linalg.norm(valores)
+        if norma > 0: valores /= norma
+
+        self.freq_docs[colunas] += 1
+        idx = self.matriz.adicionar_linha(colunas, valores)
+        self.nomes.append(nome)
+        self.artistas.append(artista or '')
+        self.ids.append(id_album)
+        self._linhas_delta[id_album] = idx
+        if len(self._linhas_delta) > max(DELTA_MINIMO, len(self._linhas_base) // 16):
+            # Mapa base novo em vez de alterar o antigo, que pode estar em uso por um instantâneo
+            base = array('q', self._linhas_base)
+            base.extend([-1] * (self.proximo_id - len(base)))
+            for id_delta, linha in self._linhas_delta.items(): base[id_delta] = linha
+            self._linhas_base = base
+            self._linhas_delta = {}
+        csr = self.matriz.como_csr()
+        self.indice.atualizar(csr, [idx])
+        if self.vizinhos is not None: self.vizinhos.atualizar(csr, idx, self.mortas)
+
+        return self.deriva() > self.limiar_deriva
+
+    def recomendar_lote(self, perfis, qtd=4, pesos=None):
+        return self.instantaneo().recomendar_lote(perfis, qtd, pesos)
+
+    def reconstruir(self):
+        """Recalcula o IDF e reescala todas as linhas (O(nnz), sem pivot), descartando linhas mortas."""
+        csr = self.matriz.como_csr()
+        if self.mortas:
+            vivas = np.setdiff1d(np.arange(len(self.nomes)), np.fromiter(self.mortas, dtype=np.int64))
+            csr = csr[vivas]
+            self.nomes = [self.nomes[i] for i in vivas]
+            self.artistas = [self.artistas[i] for i in vivas]
+            self.ids = TabelaIds(self.ids.como_array()[vivas])
+            self._linhas_base = None
+            self._linhas_delta = {}
+            self.mortas = set()
+        else:
+            csr = csr.copy()
+
+        # Como as linhas são normalizadas, tfidf_novo ∝ tfidf_antigo * (idf_novo / idf_modelo)
+        idf_novo = calcular_idf(self.freq_docs, self.n_albuns)
+        if csr.nnz:
+            csr.data *= (idf_novo / self.idf_modelo)[csr.indices]
+            csr = normalizar_linhas(csr, copiar=False)
+        csr.eliminate_zeros()
+
+        self.idf_modelo = idf_novo
+        self.matriz = MatrizIncremental.de_csr(csr)
+        self.matriz.n_colunas = len(self.tags)
+        self.indice.construir(self.matriz.como_csr())
+        if self.vizinhos is not None: self.vizinhos.construir(self.matriz.como_csr())  # o IDF mudou todas as listas
+
+
+def _mapa_linhas(ids, n_linhas, mortas, n_ids):
+    # id -> linha num array('q'): a consulta por id é uma indexação, sem hash de string
+    # (indexar um array do numpy elemento a elemento é mais lento que um array da biblioteca padrão)
+    linhas = np.arange(n_linhas, dtype=np.int64)
+    if mortas: linhas = np.setdiff1d(linhas, np.fromiter(mortas, dtype=np.int64, count=len(mortas)))
+    mapa = np.full(n_ids, -1, dtype=np.int64)
+    mapa[ids.como_array(n_linhas)[linhas]] = linhas
+    return array('q', mapa.tobytes())
+
+
+def _blocos_das_colunas(tags):
+    return array('b', [BLOCOS.index(bloco_da_coluna(tag)) for tag in tags])
+
+
+def _mapa_chaves(nomes, artistas, ids, n_linhas):
+    return {chave_album(nomes[i], artistas[i]): ids[i] for i in range(n_linhas)}
+
+
+def _linha_do_id(estado, id_album):
+    # Compartilhado pelo modelo e pelo instantâneo (mesmos atributos _linhas_base/_linhas_delta)
+    linha = estado._linhas_delta.get(id_album)
+    if linha is None and 0 <= id_album < len(estado._linhas_base):
+        linha = estado._linhas_base[id_album]
+        if linha < 0: return None
+    return linha
+
+
+class InstantaneoModelo:
+    """
+    Visão somente leitura do modelo num instante, publicada de uma vez só (troca de uma referência).
+    Compartilha buffers com o ModeloTfidfIncremental, que só escreve além do que esta visão enxerga
+    ou em objetos novos: quem consulta um instantâneo não precisa de trava e nunca o vê pela metade.
+    """
+
+    _geracoes = itertools.count(1)  # do processo todo: vale também entre modelos (ex: depois de recarregar)
+
+    def __init__(self, matriz, nomes, artistas, ids, blocos, mortas, indice, ids_chaves=None, linhas_base=None,
+                 linhas_delta=None, vizinhos=None):
+        self.geracao = next(self._geracoes)  # cresce a cada instantâneo: o maior é o mais novo
+        self.matriz_tfidf = matriz
+        # Compartilhados; só as primeiras matriz.shape[0] linhas (e matriz.shape[1] colunas) valem aqui
+        self.nomes = nomes
+        self.artistas = artistas
+        self.ids = ids
+        self.blocos = blocos
+        self._pesos_colunas = {}
+        self.mortas = frozenset(mortas)
+        self.indice = indice
+        self.vizinhos = vizinhos        # TabelaVizinhos ou None
+        self._ids_chaves = ids_chaves   # só ganha chaves novas, cujos ids este instantâneo não resolve
+        self._linhas_base = linhas_base
+        self._linhas_delta = dict(linhas_delta or {})
+
+    @property
+    def n_albuns(self):
+        return self.matriz_tfidf.shape[0] - len(self.mortas)
+
+    def linha_do_id(self, id_album):
+        if self._linhas_base is None:
+            # Modelo ainda sem mapa: o instantâneo monta o seu a partir do próprio estado
+            n = self.matriz_tfidf.shape[0]
+            n_ids = int(self.ids.como_array(n).max(initial=-1)) + 1
+            self._linhas_base = _mapa_linhas(self.ids, n, self.mortas, n_ids)
+            self._linhas_delta = {}
+        return _linha_do_id(self, id_album)
+
+    def id_album(self, titulo, artista=''):
+        if self._ids_chaves is None:
+            self._ids_chaves = _mapa_chaves(self.nomes, self.artistas, self.ids, self.matriz_tfidf.shape[0])
+        return self._ids_chaves.get(chave_album(titulo, artista))
+
+    def linha(self, titulo, artista=''):
+        if self._ids_chaves is None or self._linhas_base is None:
+            id_album = self.id_album(titulo, artista)
+            return None if id_album is None else self.linha_do_id(id_album)
+        id_album = self._ids_chaves.get((artista or '', titulo))  # = chave_album, sem a chamada extra
+        return None if id_album is None else _linha_do_id(self, id_album)
+
+    def pesos_colunas(self, pesos):
+        """
+        Peso de cada coluna para um dict {bloco: peso} (blocos ausentes usam PESOS_BLOCOS).
+        Retorna None quando todos os pesos são 1, isto é, quando a consulta não muda.
+        """
+        if not pesos: return None
+        por_bloco = tuple(validar_pesos(pesos).values())  # na ordem de BLOCOS
+        if por_bloco not in self._pesos_colunas:
+            n = self.matriz_tfidf.shape[1]
+            blocos = np.asarray(self.blocos[:n], dtype=np.int64)  # fatia = cópia (o original continua crescendo)
+            self._pesos_colunas[por_bloco] = None if all(p == 1.0 for p in por_bloco) else \
+                np.asarray(por_bloco, dtype=np.float64)[blocos]
+        return self._pesos_colunas[por_bloco]
+
+    def album(self, linha):
+        """Identificação do álbum de uma linha: {'id', 'album', 'artist'} (mesmas chaves dos detalhes)."""
+        return {'id': self.ids[linha], 'album': self.nomes[linha], 'artist': self.artistas[linha]}
+
+    def recomendar_lote(self, perfis, qtd=4, pesos=None):
+        """
+        Busca exata para muitos perfis (listas de linhas) de uma vez; 'pesos' por bloco como em pesos_colunas. Retorna (linhas, similaridades),
+        ambos (n_perfis x qtd), do mais parecido para o menos; posições sem resultado têm similaridade -inf.
+        Os centróides saem de um único produto esparso e as similaridades de multiplicações em blocos;
+        os álbuns do próprio perfil e as linhas mortas são mascarados antes do top-k.
+        """
+        csr = self.matriz_tfidf
+        n = csr.shape[0]
+        pos_perfil, pos_linha = [], []
+        for p, linhas in enumerate(perfis):
+            for idx in dict.fromkeys(linhas):
+                pos_perfil.append(p)
+                pos_linha.append(idx)
+
+        # Linha p da seleção soma os álbuns do perfil p; a escala some ao normalizar (= centróide)
+        selecao = csr_matrix((np.ones(len(pos_linha)), (pos_perfil, pos_linha)), shape=(len(perfis), n))
+        centroides = normalizar_linhas(selecao @ csr, copiar=False)
+        pesos_colunas = self.pesos_colunas(pesos)
+        if pesos_colunas is not None:
+            # Pesar as colunas só da consulta: sim = soma dos blocos x peso, sem tocar na matriz nem no índice
+            centroides = normalizar_linhas(centroides.multiply(pesos_colunas), copiar=False)
+        vazios = np.flatnonzero(np.diff(selecao.indptr) == 0)
+        mortas = np.fromiter(self.mortas, dtype=np.int64, count=len(self.mortas))
+
+        k = min(qtd, n)
+        linhas_top = np.zeros((len(perfis), k), dtype=np.int64)
+        sims_top = np.full((len(perfis), k), -np.inf)
+        if k == 0: return linhas_top, sims_top
+
+        tamanho_bloco = max(1, ELEMENTOS_BLOCO_LOTE // n)
+        for ini in range(0, len(perfis), tamanho_bloco):
+            fim = min(ini + tamanho_bloco, len(perfis))
+            sims = np.asarray(csr @ centroides[ini:fim].T.toarray())  # n x bloco
+            entradas = selecao[ini:fim].tocoo()
+            sims[entradas.col, entradas.row] = -np.inf
+            sims[mortas] = -np.inf
+            sims[:, vazios[(vazios >= ini) & (vazios < fim)] - ini] = -np.inf
+
+            # O k-ésimo maior de uma amostra de linhas é um limite inferior do k-ésimo maior de cada perfil:
+            # só quem passa dele é ordenado (~sqrt(k*n) candidatos em vez de um argpartition sobre n)
+            amostra = sims[::max(1, int(n / (AMOSTRA_LOTE * np.sqrt(k * n))))]
+            kk = min(k, amostra.shape[0])
+            limiar = np.partition(amostra, amostra.shape[0] - kk, axis=0)[-kk]
+            limiar[np.isneginf(limiar)] = np.finfo(np.float64).min
+            linha_c, perfil_c = np.divmod(np.flatnonzero(sims >= limiar), sims.shape[1])  # 2D nonzero é ~10x mais lento
+            valores = sims[linha_c, perfil_c]
+
+            ordem = np.lexsort((-valores, perfil_c))
+            perfil_c, linha_c, valores = perfil_c[ordem], linha_c[ordem], valores[ordem]
+            posicao = np.arange(len(perfil_c)) - np.searchsorted(perfil_c, perfil_c)
+            mantidos = posicao < k
+            linhas_top[ini + perfil_c[mantidos], posicao[mantidos]] = linha_c[mantidos]
+            sims_top[ini + perfil_c[mantidos], posicao[mantidos]] = valores[mantidos]
+        return linhas_top, sims_top
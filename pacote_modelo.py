@@ -0,0 +1,235 @@
+"""
+Pacote do modelo em disco: arrays crus (.npy) abertos com np.memmap, em vez dos pickles.
+
+    modelo/
+      ATUAL                 -> nome da versão em uso (trocado com os.replace, que é atômico)
+      v000003/
+        manifesto.json      -> formato, dimensões, tags
+        data.npy, indices.npy, indptr.npy   -> matriz TF-IDF (CSR)
+        freq_docs.npy, idf.npy              -> estatísticas do IDF
+        nomes.bin, nomes_offsets.npy        -> tabela compacta de títulos dos álbuns
+        artistas.bin, artistas_offsets.npy  -> artista de cada álbum (mesmo formato)
+        ids.npy             -> id estável de cada álbum (linha -> id)
+        indice_nomes.pkl    -> índice de busca por nome
+        ivf_*.npy           -> estrutura do índice de vizinhos aproximado (se houver)
+        vizinhos.npy, vizinhos_sims.npy     -> vizinhos pré-calculados de cada álbum (se houver)
+        diario.csv          -> álbuns adicionados depois que esta versão foi salva
+
+Cada salvamento escreve uma versão nova completa e só então aponta ATUAL para ela: uma queda no meio
+do salvamento deixa a versão anterior intacta. A única exceção é a tabela de vizinhos: se for pedida
+para uma versão que não a tem, ela é montada na carga e acrescentada à versão (arquivo a arquivo, com os.replace).
+"""
+import json
+import os
+import pickle
+import shutil
+
+import numpy as np
+
+from indices_vizinhos import TabelaVizinhos, criar_indice
+from modelo_incremental import ModeloTfidfIncremental, TabelaNomes, LIMIAR_DERIVA
+
+# ================= CONFIGURAÇÃO =================
+DIRETORIO_MODELO = 'modelo'
+VERSAO_FORMATO = 2  # 2: álbum identificado por (artista, título) com id estável; o 1 ainda é lido
+VERSOES_MANTIDAS = 2  # a anterior fica para processos que ainda a tenham mapeada
+
+
+def versao_atual(diretorio=DIRETORIO_MODELO):
+    try:
+        with open(os.path.join(diretorio, 'ATUAL'), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def caminho_diario(diretorio=DIRETORIO_MODELO):
+    versao = versao_atual(diretorio)
+    return None if versao is None else os.path.join(diretorio, versao, 'diario.csv')
+
+
+def existe_pacote(diretorio=DIRETORIO_MODELO):
+    return versao_atual(diretorio) is not None
+
+
+def _gravar(caminho, conteudo):
+    # Grava e força para o disco antes de a versão ser publicada
+    with open(caminho, 'wb') as f:
+        if isinstance(conteudo, np.ndarray):
+            np.save(f, conteudo)
+        elif callable(conteudo):
+            conteudo(f)
+        else:
+            f.write(conteudo)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _como_tabela(nomes):
+    # Tabela sem acréscimos (ex: a do treino em fluxo, em disco) é gravada como está, sem virar lista Python
+    if isinstance(nomes, TabelaNomes) and not nomes.extras: return nomes
+    return TabelaNomes.de_lista(nomes)
+
+
+def salvar_pacote(modelo, indice_nomes=None, diretorio=DIRETORIO_MODELO):
+    """Grava o modelo numa versão nova e publica atomicamente. O modelo deve estar reconstruído (sem linhas mortas)."""
+    os.makedirs(diretorio, exist_ok=True)
+    # Número acima de qualquer pasta existente (inclusive de um salvamento que caiu antes de publicar)
+    existentes = [int(v[1:].split('.')[0]) for v in os.listdir(diretorio) if v.startswith('v')]
+    numero = max(existentes, default=0) + 1
+    versao = f"v{numero:06d}"
+    destino = os.path.join(diretorio, versao)
+    temporario = destino + '.tmp'
+    shutil.rmtree(temporario, ignore_errors=True)
+    os.makedirs(temporario)
+
+    csr = modelo.matriz_tfidf
+    tabela = _como_tabela(modelo.nomes)
+    tabela_artistas = _como_tabela(modelo.artistas)
+    _gravar(os.path.join(temporario, 'data.npy'), np.asarray(csr.data, dtype=np.float64))
+    _gravar(os.path.join(temporario, 'indices.npy'), np.asarray(csr.indices, dtype=np.int32))
+    _gravar(os.path.join(temporario, 'indptr.npy'), np.asarray(csr.indptr, dtype=np.int32))
+    _gravar(os.path.join(temporario, 'freq_docs.npy'), modelo.freq_docs)
+    _gravar(os.path.join(temporario, 'idf.npy'), modelo.idf_modelo)
+    _gravar(os.path.join(temporario, 'nomes.bin'), memoryview(np.ascontiguousarray(tabela.dados)))
+    _gravar(os.path.join(temporario, 'nomes_offsets.npy'), tabela.offsets)
+    _gravar(os.path.join(temporario, 'artistas.bin'), memoryview(np.ascontiguousarray(tabela_artistas.dados)))
+    _gravar(os.path.join(temporario, 'artistas_offsets.npy'), tabela_artistas.offsets)
+    _gravar(os.path.join(temporario, 'ids.npy'), modelo.ids.como_array())
+    if indice_nomes is not None:
+        # pickle puro: o joblib.load passa pelo unpickler em Python (~6x mais lento para um índice grande).
+        # Direto no arquivo: o pickle.dumps montaria os bytes inteiros antes (~metade do pico ao salvar)
+        _gravar(os.path.join(temporario, 'indice_nomes.pkl'),
+                lambda f: pickle.dump(indice_nomes, f, pickle.HIGHEST_PROTOCOL))
+    modelo.indice.salvar(temporario)
+    if modelo.vizinhos is not None: modelo.vizinhos.salvar(temporario)
+
+    manifesto = {
+        'formato': VERSAO_FORMATO,
+        'n_albuns': csr.shape[0],
+        'n_tags': len(modelo.tags),
+        'nnz': int(csr.nnz),
+        'proximo_id': int(modelo.proximo_id),
+        'tags': modelo.tags,
+        'indice': modelo.indice.tipo,
+    }
+    _gravar(os.path.join(temporario, 'manifesto.json'), json.dumps(manifesto, ensure_ascii=False).encode('utf-8'))
+
+    # Publica: renomeia a versão pronta e troca o ponteiro ATUAL
+    os.rename(temporario, destino)
+    ponteiro = os.path.join(diretorio, 'ATUAL.tmp')
+    _gravar(ponteiro, versao.encode('utf-8'))
+    os.replace(ponteiro, os.path.join(diretorio, 'ATUAL'))
+
+    # Limpa versões antigas e restos de salvamentos interrompidos
+    pastas = [v for v in os.listdir(diretorio) if v.startswith('v')]
+    finais = sorted(v for v in pastas if not v.endswith('.tmp'))
+    for antiga in [v for v in pastas if v.endswith('.tmp')] + finais[:-VERSOES_MANTIDAS]:
+        shutil.rmtree(os.path.join(diretorio, antiga), ignore_errors=True)
+    return versao
+
+
+def _abrir_versao(diretorio):
+    versao = versao_atual(diretorio)
+    if versao is None: raise FileNotFoundError("Pacote do modelo não encontrado")
+    pasta = os.path.join(diretorio, versao)
+    with open(os.path.join(pasta, 'manifesto.json'), encoding='utf-8') as f:
+        manifesto = json.load(f)
+    if manifesto['formato'] not in (1, VERSAO_FORMATO):
+        raise ValueError(f"Formato de modelo {manifesto['formato']} não suportado")
+    return pasta, manifesto
+
+
+def _abrir(pasta, nome):
+    return np.load(os.path.join(pasta, nome), mmap_mode='r')
+
+
+def _tabela(pasta, prefixo):
+    caminho = os.path.join(pasta, f'{prefixo}.bin')
+    dados = np.memmap(caminho, dtype=np.uint8, mode='r') if os.path.getsize(caminho) else np.zeros(0, dtype=np.uint8)
+    return TabelaNomes(dados, _abrir(pasta, f'{prefixo}_offsets.npy'))
+
+
+class CatalogoPacote:
+    """
+    Títulos, artistas e ids do pacote (memmaps, sem a matriz): o bastante para a busca por nome
+    responder enquanto o modelo inteiro ainda carrega.
+    """
+
+    def __init__(self, pasta, manifesto):
+        self.nomes = _tabela(pasta, 'nomes')
+        self.artistas, self.ids = None, None
+        if manifesto['formato'] >= 2:
+            self.artistas, self.ids = _tabela(pasta, 'artistas'), _abrir(pasta, 'ids.npy')
+
+    def album(self, id_album):
+        """{'id', 'titulo', 'artista'} do álbum, ou None se ele não está no pacote (ex: veio do diário)."""
+        if self.ids is None:  # formato 1: id = linha
+            linha = id_album if 0 <= id_album < len(self.nomes) else None
+        else:
+            encontradas = np.flatnonzero(self.ids == id_album)  # O(n), mas só até o modelo ficar pronto
+            linha = int(encontradas[0]) if len(encontradas) else None
+        if linha is None: return None
+        artista = self.artistas[linha] if self.artistas is not None else ''
+        return {'id': id_album, 'titulo': self.nomes[linha], 'artista': artista}
+
+
+def _ler_indice_nomes(pasta):
+    caminho = os.path.join(pasta, 'indice_nomes.pkl')
+    if not os.path.exists(caminho): return None
+    with open(caminho, 'rb') as f:
+        return pickle.load(f)  # também lê os salvos pelo joblib.dump das versões anteriores
+
+
+def carregar_indice_nomes(diretorio=DIRETORIO_MODELO):
+    """Índice de nomes da versão atual (ou None) e o catálogo leve do pacote, sem abrir a matriz."""
+    pasta, manifesto = _abrir_versao(diretorio)
+    return _ler_indice_nomes(pasta), CatalogoPacote(pasta, manifesto)
+
+
+def _anexar_vizinhos(pasta, vizinhos):
+    # Tabela montada na carga: fica na versão para a próxima abertura não pagar a montagem de novo
+    try:
+        for nome, array in (('vizinhos_sims.npy', vizinhos.sims), ('vizinhos.npy', vizinhos.vizinhos)):
+            temporario = os.path.join(pasta, f'{nome}.{os.getpid()}.tmp')
+            _gravar(temporario, np.asarray(array))
+            os.replace(temporario, os.path.join(pasta, nome))  # 'vizinhos.npy' por último: quem o vê acha os dois
+    except OSError:
+        pass  # pacote somente leitura: a tabela é montada de novo na próxima carga
+
+
+def carregar_pacote(diretorio=DIRETORIO_MODELO, limiar_deriva=LIMIAR_DERIVA, tipo_indice='exato',
+                    com_indice_nomes=True, k_vizinhos=0):
+    """
+    Abre a versão atual com np.memmap (tempo de carga quase constante; páginas compartilhadas
+    entre processos). Retorna (modelo, indice_nomes ou None); com_indice_nomes=False pula o índice
+    de nomes (quem já o leu com carregar_indice_nomes).
+    O índice de vizinhos é lido do pacote se for do tipo pedido; senão é construído. Com k_vizinhos > 0
+    o mesmo vale para a tabela de vizinhos pré-calculados.
+    """
+    pasta, manifesto = _abrir_versao(diretorio)
+
+    def abrir(nome):
+        return _abrir(pasta, nome)
+
+    def tabela(prefixo):
+        return _tabela(pasta, prefixo)
+
+    # Formato 1 só tinha títulos: artista vazio e ids iguais às linhas (atribuídos pelo próprio modelo)
+    artistas, ids, proximo_id = None, None, None
+    if manifesto['formato'] >= 2:
+        artistas, ids, proximo_id = tabela('artistas'), abrir('ids.npy'), manifesto['proximo_id']
+    modelo = ModeloTfidfIncremental.de_arrays(abrir('data.npy'), abrir('indices.npy'), abrir('indptr.npy'),
+                                              tabela('nomes'), manifesto['tags'], abrir('freq_docs.npy'),
+                                              abrir('idf.npy'), limiar_deriva, indice=criar_indice(tipo_indice),
+                                              artistas=artistas, ids=ids, proximo_id=proximo_id)
+    if manifesto.get('indice', 'exato') == tipo_indice:
+        modelo.indice.carregar(pasta, modelo.matriz.como_csr())
+    else:
+        modelo.indice.construir(modelo.matriz.como_csr())
+    if k_vizinhos:
+        modelo.vizinhos = TabelaVizinhos(k_vizinhos)
+        if not modelo.vizinhos.carregar(pasta, modelo.matriz.como_csr()):
+            _anexar_vizinhos(pasta, modelo.vizinhos)
+
+    return modelo, _ler_indice_nomes(pasta) if com_indice_nomes else None
@@ -0,0 +1,288 @@
+"""
+Camada de rede do Last.fm: conexões reaproveitadas, novas tentativas com espera exponencial e disjuntor.
+
+    RedeHttp        -> fala a API REST (JSON) do Last.fm por uma requests.Session compartilhada (keep-alive).
+                       Expõe só o que o projeto usa do pylast (search_for_album, get_album, get_artist,
+                       get_top_tags, get_cover_image), com os mesmos nomes e resultados: o resto do código
+                       não muda. Substitui o pylast em produção porque ele abre um cliente HTTPS novo a cada
+                       chamada e não aceita uma sessão compartilhada; tests/test_rede_lastfm.py compara as
+                       respostas e os erros dos dois sobre os mesmos dados da API.
+    RedeResiliente  -> envolve qualquer rede nesse formato (RedeHttp, pylast.LastFMNetwork, LastFmFalso):
+                       erros transitórios (queda de conexão, timeout, HTTP 429/5xx, códigos 8/11/16/29 da API)
+                       são repetidos com espera exponencial com jitter; depois de FALHAS_PARA_ABRIR falhas
+                       seguidas o disjuntor abre e as chamadas falham na hora (CircuitoAberto) por
+                       TEMPO_ABERTO segundos. Quem chama cai para o cache ou para o CSV (cliente_lastfm, ingestao).
+                       Dentro de um cliente_lastfm.prazo_requisicoes, não tenta de novo depois do prazo.
+                       Objetos devolvidos (resultados de busca, o artista de um álbum...) também são envolvidos.
+
+Para testar contra falhas, aponte a RedeHttp para o ServidorLastfmFalso (lastfm_falso.py).
+"""
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cliente_lastfm import MAX_WORKERS, TIMEOUT_REQUISICAO, tempo_restante
+from telemetria import telemetria
+
+# ================= CONFIGURAÇÃO =================
+URL_API = 'https://ws.audioscrobbler.com/2.0/'
+TENTATIVAS = 4                  # chamadas por pedido (1 = sem novas tentativas)
+ESPERA_BASE = 0.5               # s; a espera antes da tentativa i é sorteada em [0, ESPERA_BASE * 2**i]
+ESPERA_MAXIMA = 8.0
+FALHAS_PARA_ABRIR = 5           # falhas transitórias seguidas que abrem o disjuntor
+TEMPO_ABERTO = 30.0             # s com o disjuntor aberto antes de deixar uma chamada de teste passar
+STATUS_HTTP_TRANSITORIOS = {429, 500, 502, 503, 504}
+CODIGOS_TRANSITORIOS = {'8', '11', '16', '29'}  # erro de operação, serviço fora, erro temporário, limite de taxa
+
+
+class ErroLastfm(Exception):
+    """Erro devolvido pela API; 'status' é o código do Last.fm (ou o status HTTP), como no pylast.WSError."""
+
+    def __init__(self, status, mensagem=''):
+        super().__init__(f"Last.fm {status}: {mensagem}")
+        self.status = str(status)
+
+
+class CircuitoAberto(ErroLastfm):
+    def __init__(self, espera):
+        super().__init__('circuito', f"API indisponível, nova tentativa em {espera:.0f} s")
+
+
+def transitorio(erro):
+    """Se vale a pena repetir a chamada: falha de rede ou erro temporário do servidor."""
+    if isinstance(erro, CircuitoAberto): return False
+    if isinstance(erro, (OSError, TimeoutError)): return True  # inclui as exceções do requests
+    if getattr(erro, 'underlying_error', None) is not None: return True  # pylast.NetworkError
+    return str(getattr(erro, 'status', '')) in CODIGOS_TRANSITORIOS | {str(s) for s in STATUS_HTTP_TRANSITORIOS}
+
+
+class Disjuntor:
+    """Fechado -> aberto após 'limite' falhas seguidas -> (depois de 'tempo_aberto') uma chamada de teste."""
+
+    def __init__(self, limite=FALHAS_PARA_ABRIR, tempo_aberto=TEMPO_ABERTO):
+        self.limite = limite
+        self.tempo_aberto = tempo_aberto
+        self.falhas = 0
+        self.aberto_ate = None      # None = fechado
+        self.testando = False       # meio-aberto: uma chamada de teste em andamento
+        self.lock = threading.Lock()
+
+    @property
+    def estado(self):
+        with self.lock:
+            if self.aberto_ate is None: return 'fechado'
+            return 'meio-aberto' if self.testando or time.monotonic() >= self.aberto_ate else 'aberto'
+
+    def permitir(self):
+        """Levanta CircuitoAberto enquanto o disjuntor está aberto (ou já há uma chamada de teste)."""
+        with self.lock:
+            if self.aberto_ate is None: return
+            agora = time.monotonic()
+            if agora < self.aberto_ate or self.testando:
+                telemetria.contar('api.circuito_aberto')
+                raise CircuitoAberto(max(0.0, self.aberto_ate - agora))
+            self.testando = True
+
+    def sucesso(self):
+        with self.lock:
+            self.falhas, self.aberto_ate, self.testando = 0, None, False
+
+    def falha(self):
+        with self.lock:
+            self.falhas += 1
+            if self.testando or self.falhas >= self.limite:
+                if self.aberto_ate is None: telemetria.contar('api.circuito_abriu')
+                self.aberto_ate = time.monotonic() + self.tempo_aberto
+                self.testando = False
+
+
+def _envolver(rede, valor):
+    """Objetos da rede (os que têm métodos get_*), sozinhos ou em lista, voltam envolvidos; o resto, como veio."""
+    if isinstance(valor, list): return [_envolver(rede, v) for v in valor]
+    if any(nome.startswith('get_') for nome in dir(type(valor))): return _Envolvido(rede, valor)
+    return valor
+
+
+class _Envolvido:
+    """
+    Álbum, artista ou busca da rede original cujos métodos get_* passam pela RedeResiliente. O que eles
+    devolvem (ex: os álbuns de get_next_page) e atributos como 'album.artist' também vêm envolvidos.
+    """
+
+    def __init__(self, rede, alvo):
+        self._rede = rede
+        self._alvo = alvo
+
+    def __getattr__(self, nome):
+        atributo = getattr(self._alvo, nome)
+        if not nome.startswith('get_') or not callable(atributo): return _envolver(self._rede, atributo)
+        return lambda *args, **kwargs: _envolver(self._rede, self._rede.chamar(atributo, *args, **kwargs))
+
+
+class RedeResiliente:
+    def __init__(self, rede, tentativas=TENTATIVAS, disjuntor=None, espera_base=ESPERA_BASE):
+        self.rede = rede
+        self.tentativas = tentativas
+        self.disjuntor = disjuntor or Disjuntor()
+        self.espera_base = espera_base
+
+    def chamar(self, funcao, *args, **kwargs):
+        for tentativa in range(self.tentativas):
+            restante = tempo_restante()
+            if restante is not None and restante <= 0: raise TimeoutError("prazo da requisição esgotado")
+            self.disjuntor.permitir()
+            try:
+                resultado = funcao(*args, **kwargs)
+            except Exception as e:
+                if not transitorio(e):
+                    self.disjuntor.sucesso()  # a API respondeu (ex: álbum não existe): não é queda
+                    raise
+                self.disjuntor.falha()
+                telemetria.contar('api.falhas')
+                if tentativa == self.tentativas - 1: raise
+                telemetria.contar('api.novas_tentativas')
+                # Jitter "cheio": clientes que falharam juntos não voltam todos no mesmo instante
+                espera = random.uniform(0, min(ESPERA_MAXIMA, self.espera_base * 2 ** tentativa))
+                restante = tempo_restante()
+                if restante is not None and espera >= restante: raise  # a nova tentativa passaria do prazo
+                time.sleep(espera)
+            else:
+                self.disjuntor.sucesso()
+                return resultado
+
+    def search_for_album(self, album_name):
+        return _Envolvido(self, self.rede.search_for_album(album_name))
+
+    def get_album(self, artist, title):
+        return _Envolvido(self, self.rede.get_album(artist, title))
+
+    def get_artist(self, artist_name):
+        return _Envolvido(self, self.rede.get_artist(artist_name))
+
+
+# ---------------- Cliente HTTP (formato do pylast) ----------------
+
+class _Item:
+    def __init__(self, nome):
+        self.nome = nome
+
+    def get_name(self):
+        return self.nome
+
+
+class _TopItem:
+    def __init__(self, nome, peso):
+        self.item = _Item(nome)
+        self.weight = peso
+
+
+def _lista(valor):
+    # O JSON do Last.fm troca a lista por um objeto quando há um item só
+    if valor is None: return []
+    return valor if isinstance(valor, list) else [valor]
+
+
+def _imagem(imagens, size):
+    imagens = _lista(imagens)
+    if not imagens: return None
+    return imagens[min(size, len(imagens) - 1)].get('#text') or None
+
+
+def _top_tags(dados, limit):
+    tags = _lista((dados.get('toptags') or {}).get('tag'))[:limit or None]  # limit=0: todas, como no pylast
+    return [_TopItem(t['name'], int(t.get('count', 0))) for t in tags]
+
+
+class _ArtistaHttp:
+    def __init__(self, rede, nome):
+        self.rede = rede
+        self.name = nome
+
+    def get_name(self):
+        return self.name
+
+    def get_top_tags(self, limit=None):
+        return _top_tags(self.rede.pedir('artist.getTopTags', artist=self.name, autocorrect=1), limit)
+
+
+class _AlbumHttp:
+    def __init__(self, rede, artista, titulo, imagens=None):
+        self.rede = rede
+        self.artist = _ArtistaHttp(rede, artista)
+        self.title = titulo
+        self.imagens = imagens  # resultados de busca já trazem as capas
+
+    def get_name(self):
+        return self.title
+
+    def get_top_tags(self, limit=None):
+        return _top_tags(self.rede.pedir('album.getTopTags', artist=self.artist.name, album=self.title,
+                                         autocorrect=1), limit)
+
+    def get_cover_image(self, size=3):
+        if self.imagens is None:
+            dados = self.rede.pedir('album.getInfo', artist=self.artist.name, album=self.title, autocorrect=1)
+            self.imagens = (dados.get('album') or {}).get('image')
+        return _imagem(self.imagens, size)
+
+
+class _BuscaHttp:
+    def __init__(self, rede, consulta):
+        self.rede = rede
+        self.consulta = consulta
+        self.pagina = 0
+
+    def get_next_page(self):
+        # A página só avança depois da resposta: a RedeResiliente repete esta chamada quando ela falha
+        dados = self.rede.pedir('album.search', album=self.consulta, page=self.pagina + 1)
+        self.pagina += 1
+        albuns = _lista(((dados.get('results') or {}).get('albummatches') or {}).get('album'))
+        return [_AlbumHttp(self.rede, a.get('artist', ''), a.get('name', ''), a.get('image') or []) for a in albuns]
+
+
+class RedeHttp:
+    """Cliente da API REST do Last.fm com uma sessão HTTP compartilhada (até MAX_WORKERS conexões abertas)."""
+
+    def __init__(self, api_key, url=URL_API, timeout=TIMEOUT_REQUISICAO, reaproveitar_conexoes=True):
+        self.api_key = api_key
+        self.url = url
+        self.timeout = timeout
+        self.sessao = None
+        if reaproveitar_conexoes:
+            self.sessao = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS)
+            self.sessao.mount('http://', adaptador)
+            self.sessao.mount('https://', adaptador)
+
+    def pedir(self, metodo, **params):
+        params = dict(params, method=metodo, api_key=self.api_key, format='json')
+        timeout = self.timeout
+        restante = tempo_restante()  # prazo de quem chamou (cliente_lastfm.prazo_requisicoes)
+        if restante is not None:
+            if restante <= 0: raise TimeoutError("prazo da requisição esgotado")
+            timeout = min(timeout, restante)
+        with telemetria.span('api.http'):
+            if self.sessao is None:
+                resposta = requests.get(self.url, params=params, timeout=timeout)
+            else:
+                resposta = self.sessao.get(self.url, params=params, timeout=timeout)
+        if resposta.status_code in STATUS_HTTP_TRANSITORIOS:
+            raise ErroLastfm(resposta.status_code, resposta.reason)
+        dados = resposta.json()
+        if 'error' in dados: raise ErroLastfm(dados['error'], dados.get('message', ''))
+        return dados
+
+    def search_for_album(self, album_name):
+        return _BuscaHttp(self, album_name)
+
+    def get_album(self, artist, title):
+        return _AlbumHttp(self, artist, title)
+
+    def get_artist(self, artist_name):
+        return _ArtistaHttp(self, artist_name)
+
+    def fechar(self):
+        if self.sessao is not None: self.sessao.close()
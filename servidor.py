@@ -0,0 +1,173 @@
+"""
+Servidor HTTP (sem interface gráfica) sobre o Sistema: o modelo é carregado uma vez e atende muitos clientes.
+
+Uso:
+    python servidor.py [--porta 8000] [--lastfm-falso]
+
+Endpoints (JSON):
+    GET  /saude                         -> {"status": "ok", "albuns": n}
+    GET  /buscar?nome=...               -> {"status": "CACHE_HIT" | "CACHE_OPTIONS" | "API_OPTIONS" | ..., "dados": ...}
+    POST /albuns      {"titulo", "artista"}                   -> adiciona o álbum (tags do Last.fm), retorna o id
+    POST /recomendar  {"albuns": [...], "qtd": 4, "detalhes": true, "pesos": {"descritores": 2.0, ...}}
+                      (cada álbum: id, {"titulo", "artista"} ou só o título; pesos por bloco opcionais)
+    GET  /metricas                      -> histogramas de latência por endpoint, spans e contadores do backend
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from caracteristicas import validar_pesos
+from telemetria import HistogramaLatencia, telemetria
+
+# ================= CONFIGURAÇÃO =================
+PORTA_PADRAO = 8000
+MAX_RECOMENDACOES = 20
+
+
+class ServidorRecomendacao(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, endereco, sistema):
+        super().__init__(endereco, ManipuladorRequisicoes)
+        self.sistema = sistema
+        self.latencias = {}
+        self.lock_latencias = threading.Lock()
+
+    def registrar_latencia(self, rota, ms):
+        with self.lock_latencias:
+            histograma = self.latencias.setdefault(rota, HistogramaLatencia())
+        histograma.registrar(ms)
+
+
+class ManipuladorRequisicoes(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # conexões reaproveitadas (keep-alive)
+    disable_nagle_algorithm = True  # cabeçalho e corpo saem em escritas separadas: sem isso, +40 ms por resposta
+
+    def log_message(self, *args): pass  # as métricas substituem o log por requisição
+
+    def _responder(self, codigo, corpo):
+        dados = json.dumps(corpo, ensure_ascii=False, default=float).encode('utf-8')
+        self.send_response(codigo)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _ler_json(self):
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(tamanho) or b'{}')
+
+    def _despachar(self, metodo):
+        url = urlparse(self.path)
+        rota = f"{metodo} {url.path}"
+        tratador = ROTAS.get(rota)
+        inicio = time.perf_counter()
+        try:
+            if tratador is None:
+                codigo, corpo = 404, {'erro': f"rota desconhecida: {rota}"}
+            else:
+                codigo, corpo = tratador(self.server.sistema, self, url)
+        except (ValueError, KeyError, TypeError) as e:
+            codigo, corpo = 400, {'erro': f"requisição inválida: {e}"}
+        except Exception as e:
+            codigo, corpo = 500, {'erro': str(e)}
+        self._responder(codigo, corpo)
+        if tratador is not None:
+            self.server.registrar_latencia(rota, (time.perf_counter() - inicio) * 1000)
+
+    def do_GET(self):
+        self._despachar('GET')
+
+    def do_POST(self):
+        self._despachar('POST')
+
+
+def _saude(sistema, req, url):
+    return 200, {'status': 'ok', 'albuns': sistema.instantaneo.n_albuns}
+
+
+def _buscar(sistema, req, url):
+    nome = parse_qs(url.query)['nome'][0]
+    status, dados = sistema.buscar_candidatos(nome)
+    if status == 'API_OPTIONS':
+        dados = [{'titulo': c['titulo'], 'artista': c['artista']} for c in dados]  # sem o objeto do pylast
+    return 200, {'status': status, 'dados': dados}
+
+
+def _adicionar(sistema, req, url):
+    corpo = req._ler_json()
+    album = sistema.processar_escolha_usuario(None, corpo['titulo'], corpo['artista'])
+    if album:
+        return 201, {'status': 'ok', 'album': album}
+    return 422, {'erro': f"sem tags para {corpo['titulo']}"}
+
+
+def _recomendar(sistema, req, url):
+    corpo = req._ler_json()
+    albuns = list(corpo['albuns'])
+    qtd = min(int(corpo.get('qtd', 4)), MAX_RECOMENDACOES)
+    pesos = validar_pesos(corpo['pesos']) if corpo.get('pesos') else None  # bloco desconhecido -> 400
+    if corpo.get('detalhes', True):
+        recomendacoes = sistema.gerar_recomendacoes_com_detalhes(albuns, qtd=qtd, pesos=pesos)
+    else:
+        recomendacoes = sistema.recomendar(albuns, qtd, pesos)
+    return 200, {'recomendacoes': recomendacoes}
+
+
+def _metricas(sistema, req, url):
+    with req.server.lock_latencias:
+        latencias = dict(req.server.latencias)
+    return 200, {'latencias': {rota: h.resumo() for rota, h in latencias.items()},
+                 'cache_metadados': sistema.cache.estatisticas(),
+                 'cache_recomendacoes': sistema.cache_recomendacoes.estatisticas(), 'telemetria': telemetria.resumo()}
+
+
+ROTAS = {
+    'GET /saude': _saude,
+    'GET /buscar': _buscar,
+    'POST /albuns': _adicionar,
+    'POST /recomendar': _recomendar,
+    'GET /metricas': _metricas,
+}
+
+
+def iniciar_servidor(sistema, host='127.0.0.1', porta=PORTA_PADRAO):
+    """Cria o servidor (porta 0 = qualquer porta livre). Quem chama roda serve_forever()."""
+    return ServidorRecomendacao((host, porta), sistema)
+
+
+def main():
+    from indices_vizinhos import TIPOS_INDICE
+    parser = argparse.ArgumentParser(description="Servidor HTTP do KNAlbuns")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=PORTA_PADRAO)
+    parser.add_argument('--lastfm-falso', action='store_true',
+                        help="usa o Last.fm falso local (testes de carga sem acessar a rede)")
+    parser.add_argument('--latencia-falsa', type=float, default=0.05)
+    parser.add_argument('--metricas-json', help="ao encerrar, salva spans e contadores neste arquivo")
+    parser.add_argument('--indice', choices=list(TIPOS_INDICE),
+                        help="índice de vizinhos (padrão: TIPO_INDICE do backend_logic); 'fragmentado' divide "
+                             "a busca exata entre processos, um por núcleo")
+    args = parser.parse_args()
+
+    from backend_logic import Sistema, TIPO_INDICE
+    network = None
+    if args.lastfm_falso:
+        from lastfm_falso import LastFmFalso
+        network = LastFmFalso(latencia=args.latencia_falsa)
+    servidor = iniciar_servidor(Sistema(tipo_indice=args.indice or TIPO_INDICE, network=network), args.host, args.porta)
+    print(f"[Servidor] Ouvindo em http://{args.host}:{servidor.server_port}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        if args.metricas_json: telemetria.salvar_json(args.metricas_json)
+
+
+if __name__ == '__main__':
+    main()
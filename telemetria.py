@@ -0,0 +1,164 @@
+"""
+Telemetria leve do backend: spans cronometrados (histograma de latência por nome), contadores
+e um registro de log em buffer.
+
+    with telemetria.span('knn'): ...           # tempo do trecho
+    @telemetria.cronometrar('busca')            # tempo de cada chamada da função
+    telemetria.contar('api.chamadas')           # contador
+    log("[Backend] ...")                        # mensagem (no lugar do print)
+
+Sem consumidor, o log sai direto no stdout (scripts e servidor). A interface liga o buffer
+(log.em_buffer = True) e descarrega tudo de uma vez, num timer da thread principal.
+telemetria.resumo() / salvar_json() exportam spans e contadores para sessões de profiling.
+"""
+import bisect
+import functools
+import json
+import threading
+import time
+from collections import deque
+
+# ================= CONFIGURAÇÃO =================
+LIMITES_HISTOGRAMA_MS = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+MAX_TRECHOS_LOG = 10_000    # trechos guardados no buffer; os mais antigos são descartados
+
+
+class HistogramaLatencia:
+    """Histograma de latência com baldes fixos (ms), thread-safe. Percentis estimados pelo limite do balde."""
+
+    def __init__(self, limites=LIMITES_HISTOGRAMA_MS):
+        self.limites = list(limites)
+        self.contagens = [0] * (len(self.limites) + 1)  # último balde: acima do maior limite
+        self.total = 0
+        self.soma_ms = 0.0
+        self.max_ms = 0.0
+        self.lock = threading.Lock()
+
+    def registrar(self, ms):
+        with self.lock:
+            self.contagens[bisect.bisect_left(self.limites, ms)] += 1
+            self.total += 1
+            self.soma_ms += ms
+            if ms > self.max_ms: self.max_ms = ms
+
+    def percentil(self, p):
+        with self.lock:
+            if self.total == 0: return 0.0
+            alvo = p / 100 * self.total
+            acumulado = 0
+            for limite, contagem in zip(self.limites + [float('inf')], self.contagens):
+                acumulado += contagem
+                if acumulado >= alvo: return limite
+        return float('inf')
+
+    def resumo(self):
+        with self.lock:
+            baldes = {f"<={limite}ms": c for limite, c in zip(self.limites, self.contagens)}
+            baldes[f">{self.limites[-1]}ms"] = self.contagens[-1]
+            total, media = self.total, self.soma_ms / self.total if self.total else 0.0
+            maximo = self.max_ms
+        return {'total': total, 'media_ms': round(media, 3), 'max_ms': round(maximo, 3),
+                'p50_ms': self.percentil(50), 'p99_ms': self.percentil(99), 'baldes': baldes}
+
+
+class RegistroLog:
+    """
+    Destino das mensagens do backend. Escrever só acrescenta o texto numa fila (seguro em qualquer
+    thread); quem consome chama drenar() de tempos em tempos e mostra tudo de uma vez.
+    """
+
+    def __init__(self, max_trechos=MAX_TRECHOS_LOG):
+        self.em_buffer = False  # False: imprime na hora (não há consumidor)
+        self.trechos = deque(maxlen=max_trechos)
+        self.lock = threading.Lock()
+
+    def escrever(self, texto):
+        """Texto cru, como o write() de um arquivo (usado também para redirecionar o stdout)."""
+        if not texto: return
+        if not self.em_buffer:
+            print(texto, end='')
+            return
+        with self.lock:
+            self.trechos.append(texto)
+
+    def __call__(self, mensagem):
+        self.escrever(f"{mensagem}\n")
+
+    def drenar(self):
+        """Todo o texto acumulado desde a última chamada ('' se nada chegou)."""
+        with self.lock:
+            if not self.trechos: return ''
+            texto = ''.join(self.trechos)
+            self.trechos.clear()
+        return texto
+
+
+class _Span:
+    __slots__ = ('telemetria', 'nome', 'inicio')
+
+    def __init__(self, telemetria, nome):
+        self.telemetria = telemetria
+        self.nome = nome
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.telemetria.registrar(self.nome, (time.perf_counter() - self.inicio) * 1000)
+
+
+class Telemetria:
+    def __init__(self):
+        self.spans = {}         # nome -> HistogramaLatencia
+        self.contadores = {}
+        self.lock = threading.Lock()
+        self.inicio = time.time()
+
+    def span(self, nome):
+        return _Span(self, nome)
+
+    def cronometrar(self, nome):
+        """Decorador: cada chamada da função vira um span 'nome'."""
+        def decorador(funcao):
+            @functools.wraps(funcao)
+            def cronometrada(*args, **kwargs):
+                inicio = time.perf_counter()
+                try:
+                    return funcao(*args, **kwargs)
+                finally:
+                    self.registrar(nome, (time.perf_counter() - inicio) * 1000)
+            return cronometrada
+        return decorador
+
+    def registrar(self, nome, ms):
+        histograma = self.spans.get(nome)
+        if histograma is None:
+            with self.lock:
+                histograma = self.spans.setdefault(nome, HistogramaLatencia())
+        histograma.registrar(ms)
+
+    def contar(self, nome, n=1):
+        with self.lock:
+            self.contadores[nome] = self.contadores.get(nome, 0) + n
+
+    def resumo(self):
+        with self.lock:
+            spans, contadores = dict(self.spans), dict(self.contadores)
+        return {'desde': self.inicio, 'spans': {nome: h.resumo() for nome, h in sorted(spans.items())},
+                'contadores': dict(sorted(contadores.items()))}
+
+    def salvar_json(self, caminho):
+        with open(caminho, 'w', encoding='utf-8') as f:
+            json.dump(self.resumo(), f, ensure_ascii=False, indent=2)
+
+    def zerar(self):
+        with self.lock:
+            self.spans.clear()
+            self.contadores.clear()
+            self.inicio = time.time()
+
+
+# Compartilhados pelo processo inteiro (backend, cliente do Last.fm, capas, interface, servidor)
+telemetria = Telemetria()
+log = RegistroLog()
@@ -0,0 +1,52 @@
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import gerar_catalogo_sintetico  # noqa: E402
+from cliente_lastfm import limitador_global  # noqa: E402
+from indice_nomes import IndiceNomes  # noqa: E402
+from modelo_incremental import ModeloTfidfIncremental  # noqa: E402
+from pacote_modelo import salvar_pacote  # noqa: E402
+
+
+@pytest.fixture
+def pasta(tmp_path, monkeypatch):
+    """Diretório atual temporário: o Sistema lê/grava modelo/ e metadados.db nele."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def sem_limite():
+    """Limitador global sem cota (o Last.fm dos testes é falso), restaurado no fim."""
+    original = limitador_global.taxa, limitador_global.capacidade
+    limitador_global.taxa = limitador_global.capacidade = limitador_global.fichas = 1e9
+    yield
+    limitador_global.taxa, limitador_global.capacidade = original
+    limitador_global.fichas = min(limitador_global.fichas, limitador_global.capacidade)
+
+
+@pytest.fixture
+def criar_sistema(pasta, sem_limite):
+    """criar_sistema(network, modelo=None): Sistema sobre o pacote salvo de 'modelo' (padrão: catálogo sintético)."""
+    from backend_logic import Sistema
+    sistemas = []
+
+    def criar(network, modelo=None):
+        if modelo is None:
+            matriz, nomes, tags, _ = gerar_catalogo_sintetico(300, n_tags=50)
+            modelo = ModeloTfidfIncremental.de_matriz(matriz, nomes, tags, artistas=[f"Artista {i % 30}"
+                                                                                    for i in range(len(nomes))])
+        with contextlib.redirect_stdout(io.StringIO()):
+            salvar_pacote(modelo, IndiceNomes(modelo.nomes, modelo.ids))
+            sistema = Sistema(network=network)
+        sistemas.append(sistema)
+        return sistema
+
+    yield criar
+    for sistema in sistemas: sistema.cache.fechar()
@@ -0,0 +1,102 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from cache_recomendacoes import CacheRecomendacoes
+from lastfm_falso import LastFmFalso, _Album
+from rede_lastfm import ErroLastfm
+
+
+class LastFmInstavel(LastFmFalso):
+    """Last.fm falso cujas capas falham enquanto 'fora_do_ar' estiver ligado."""
+
+    def __init__(self):
+        super().__init__(latencia=0)
+        self.fora_do_ar = False
+
+    def get_album(self, artist, title):
+        album = _Album(self, artist, title)
+        capa = album.get_cover_image
+
+        def get_cover_image(size=3):
+            if self.fora_do_ar: raise ErroLastfm(11, 'Service Offline')
+            return capa(size)
+
+        album.get_cover_image = get_cover_image
+        return album
+
+
+def test_detalhes_com_falha_nao_ficam_no_cache(criar_sistema):
+    rede = LastFmInstavel()
+    sistema = criar_sistema(rede)
+    perfil = [{'id': 0}, {'id': 1}]
+
+    rede.fora_do_ar = True
+    degradadas = sistema.gerar_recomendacoes_com_detalhes(perfil, 4)
+    assert len(degradadas) == 4
+    assert all(rec['image_url'] is None for rec in degradadas)
+
+    # A API voltou: o mesmo perfil busca as capas de novo em vez de repetir a lista sem detalhes
+    rede.fora_do_ar = False
+    recuperadas = sistema.gerar_recomendacoes_com_detalhes(perfil, 4)
+    assert [rec['id'] for rec in recuperadas] == [rec['id'] for rec in degradadas]
+    assert all(rec['image_url'] for rec in recuperadas)
+
+    # Lista completa: agora sim vem do cache, sem chamar a API
+    chamadas = rede.chamadas
+    assert sistema.gerar_recomendacoes_com_detalhes(perfil, 4) == recuperadas
+    assert rede.chamadas == chamadas
+
+
+def _contador(resultado):
+    chamadas = []
+
+    def calcular(n):
+        chamadas.append(n)
+        return resultado[:n]
+    return calcular, chamadas
+
+
+def test_instantaneo_antigo_nao_limpa_o_cache_do_novo():
+    cache = CacheRecomendacoes()
+    antigo, novo = SimpleNamespace(geracao=1), SimpleNamespace(geracao=2)
+    calcular, chamadas = _contador([{'id': i} for i in range(30)])
+
+    cache.obter(antigo, 'perfil', 5, calcular)
+    cache.obter(novo, 'perfil', 5, calcular)        # instantâneo mais novo: descarta o do antigo
+    assert len(chamadas) == 2
+
+    # Pedido atrasado com o instantâneo antigo: calcula direto, sem trocar o que está guardado
+    assert cache.obter(antigo, 'perfil', 5, calcular) == [{'id': i} for i in range(5)]
+    assert len(chamadas) == 3
+    assert cache.versao is novo
+    cache.obter(novo, 'perfil', 5, calcular)
+    assert len(chamadas) == 3
+    assert cache.estatisticas()['antigos'] == 1
+
+
+def test_instantaneo_antigo_nao_quebra_a_coalescencia():
+    cache = CacheRecomendacoes()
+    antigo, novo = SimpleNamespace(geracao=1), SimpleNamespace(geracao=2)
+    cache.obter(antigo, 'outro', 5, _contador([{'id': 0}])[0])
+    liberar, comecou = threading.Event(), threading.Event()
+    chamadas = []
+
+    def lento(n):
+        chamadas.append(n)
+        comecou.set()
+        liberar.wait(5)
+        return [{'id': i} for i in range(n)]
+
+    with ThreadPoolExecutor(2) as executor:
+        primeiro = executor.submit(cache.obter, novo, 'perfil', 5, lento)
+        assert comecou.wait(5)
+        cache.obter(antigo, 'perfil', 5, _contador([{'id': 9}])[0])  # não pode zerar o em_andamento
+        segundo = executor.submit(cache.obter, novo, 'perfil', 5, lento)
+        fim = time.monotonic() + 5
+        while cache.estatisticas()['coalescidos'] == 0 and time.monotonic() < fim:
+            time.sleep(0.001)
+        liberar.set()
+        assert primeiro.result() == segundo.result() == [{'id': i} for i in range(5)]
+    assert len(chamadas) == 1
@@ -0,0 +1,113 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from cliente_lastfm import LimitadorTaxa, detalhar_album, detalhar_albuns, prazo_requisicoes, tempo_restante
+from lastfm_falso import ServidorLastfmFalso
+from rede_lastfm import Disjuntor, ErroLastfm, RedeHttp, RedeResiliente
+
+REC = {'id': 0, 'album': 'Souvlaki', 'artist': 'Slowdive', 'score': 90.0}
+
+
+@pytest.fixture
+def servidor():
+    falso = ServidorLastfmFalso()
+    yield falso
+    falso.fechar()
+
+
+def test_limitador_libera_a_rajada_e_depois_segue_a_taxa():
+    limitador = LimitadorTaxa(taxa=50, capacidade=5)
+    assert all(limitador.adquirir(0) for _ in range(5))
+    assert not limitador.adquirir(0)  # rajada gasta, sem tempo para esperar ficha nova
+
+    inicio = time.monotonic()
+    for _ in range(10): assert limitador.adquirir(1)
+    assert time.monotonic() - inicio >= 10 / 50 * 0.9
+
+
+def test_limitador_desiste_na_hora_quando_a_espera_passa_do_timeout():
+    limitador = LimitadorTaxa(taxa=1, capacidade=1)
+    assert limitador.adquirir()
+    inicio = time.monotonic()
+    assert not limitador.adquirir(0.2)  # a próxima ficha só sai em ~1 s
+    assert time.monotonic() - inicio < 0.1
+
+
+def test_limitador_nao_passa_da_taxa_com_varias_threads():
+    limitador = LimitadorTaxa(taxa=100, capacidade=5)
+    liberadas = []
+    inicio = time.monotonic()
+
+    def pedir():
+        for _ in range(10):
+            limitador.adquirir()
+            liberadas.append(time.monotonic() - inicio)
+
+    with ThreadPoolExecutor(4) as executor:
+        for futuro in [executor.submit(pedir) for _ in range(4)]: futuro.result()
+    # Em qualquer instante t: no máximo a rajada + t * taxa fichas (com folga para o relógio)
+    for n, t in enumerate(sorted(liberadas), 1):
+        assert n <= 5 + t * 100 + 1
+
+
+def test_prazos_aninhados_ficam_com_o_mais_curto():
+    assert tempo_restante() is None
+    with prazo_requisicoes(10):
+        with prazo_requisicoes(0.5):
+            assert tempo_restante() <= 0.5
+        with prazo_requisicoes(60):
+            assert 9 < tempo_restante() <= 10
+    assert tempo_restante() is None
+
+
+def test_timeout_do_detalhar_album_vale_para_o_http(servidor):
+    servidor.latencia = 2.0
+    rede = RedeHttp('chave', url=servidor.url)  # timeout próprio de 10 s
+    inicio = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        detalhar_album(rede, REC, LimitadorTaxa(taxa=1e9, capacidade=1e9), timeout=0.3)
+    assert time.monotonic() - inicio < 1.0
+
+
+def test_espera_no_limitador_sai_do_prazo_do_http(servidor):
+    limitador = LimitadorTaxa(taxa=5, capacidade=1)
+    limitador.adquirir()
+    timeouts = []
+    rede = RedeHttp('chave', url=servidor.url)
+    get = rede.sessao.get
+    rede.sessao.get = lambda url, params, timeout: timeouts.append(timeout) or get(url, params=params, timeout=timeout)
+
+    detalhado = detalhar_album(rede, REC, limitador, timeout=1.0)  # ~0.2 s esperando ficha
+    assert detalhado['image_url']
+    assert timeouts and timeouts[0] <= 0.85
+
+
+def test_rede_resiliente_nao_tenta_de_novo_depois_do_prazo(servidor):
+    servidor.fora_do_ar = True
+    rede = RedeResiliente(RedeHttp('chave', url=servidor.url), tentativas=10, disjuntor=Disjuntor(limite=100),
+                          espera_base=0.2)
+    inicio = time.monotonic()
+    with pytest.raises((ErroLastfm, TimeoutError)):
+        detalhar_album(rede, REC, LimitadorTaxa(taxa=1e9, capacidade=1e9), timeout=0.3)
+    assert time.monotonic() - inicio < 0.6
+    assert sum(servidor.chamadas.values()) < 10
+
+
+def test_detalhar_albuns_nao_trabalha_depois_de_desistir(servidor):
+    servidor.latencia = 0.3
+    rede = RedeHttp('chave', url=servidor.url)
+    recs = [dict(REC, id=i, album=f"Album {i}") for i in range(6)]
+    falhas = []
+    with ThreadPoolExecutor(1) as executor:  # um worker só: os outros álbuns esperam na fila do pool
+        inicio = time.monotonic()
+        detalhados = detalhar_albuns(rede, recs, timeout=0.45, executor=executor,
+                                     limitador=LimitadorTaxa(taxa=1e9, capacidade=1e9), ao_falhar=falhas.append)
+        assert time.monotonic() - inicio < 0.7
+    # O pool terminou logo depois do prazo: quem estava na fila desistiu em vez de chamar a API
+    assert time.monotonic() - inicio < 1.2
+    assert detalhados[0]['image_url'] and len(falhas) == 5
+    assert sum(servidor.chamadas.values()) <= 3
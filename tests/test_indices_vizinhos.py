@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix, hstack, vstack
+
+from benchmark import gerar_catalogo_sintetico
+from indices_vizinhos import IndiceCosseno, criar_indice, normalizar_linhas
+
+N_ALBUNS = 3000
+N_NOVAS = 5
+
+
+def _catalogo_com_album_de_tags_novas():
+    """Catálogo indexado + a matriz depois de um álbum só com tags (colunas) que não existiam na construção."""
+    matriz, _, _, _ = gerar_catalogo_sintetico(N_ALBUNS, n_tags=200, temas=20)
+    novo = np.zeros((1, matriz.shape[1] + N_NOVAS))
+    novo[0, -N_NOVAS:] = [0.6, 0.8, 0, 0, 0]
+    crescida = vstack([hstack([matriz, csr_matrix((N_ALBUNS, N_NOVAS))]), csr_matrix(normalizar_linhas(novo))])
+    return matriz, csr_matrix(crescida)
+
+
+@pytest.mark.parametrize('tipo', ['ivf', 'compacto'])
+def test_album_so_com_colunas_novas_e_encontrado(tipo, tmp_path):
+    matriz, crescida = _catalogo_com_album_de_tags_novas()
+    indice = criar_indice(tipo)
+    indice.construir(matriz)
+    indice.atualizar(crescida, novas=[N_ALBUNS])
+
+    # Perfil misto: um álbum antigo + as tags novas (a busca exata põe o álbum novo no top-10)
+    consulta = normalizar_linhas(crescida[[7]].toarray() + crescida[[N_ALBUNS]].toarray())
+    _, exatos = IndiceCosseno(crescida).kneighbors(consulta, 10)
+    assert N_ALBUNS in exatos[0]
+
+    for candidato in (indice, indice.instantaneo()):
+        _, achados = candidato.kneighbors(consulta, 10)
+        assert N_ALBUNS in achados[0]
+        _, achados = candidato.kneighbors(crescida[[N_ALBUNS]].toarray(), 1)
+        assert achados[0, 0] == N_ALBUNS
+
+    # Gravado e lido de novo (como no pacote do modelo), o álbum continua achável
+    indice.salvar(tmp_path)
+    relido = criar_indice(tipo)
+    relido.carregar(tmp_path, crescida)
+    _, achados = relido.kneighbors(consulta, 10)
+    assert N_ALBUNS in achados[0]
@@ -0,0 +1,46 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from modelo_incremental import ModeloTfidfIncremental
+
+TAGS_CSV = ['genero:Post-Rock', 'genero:Shoegaze', 'genero:Hip Hop', 'genero:Jazz',
+            'descritor:melancholic', 'descritor:energetic', 'nota:alta']
+LINHAS_CSV = [  # (título, pesos nas colunas de TAGS_CSV)
+    ('Post-Rock Triste', [1, 0, 0, 0, 1, 0, 1]),
+    ('Shoegaze Triste', [0, 1, 0, 0, 1, 0, 0]),
+    ('Rap Animado', [0, 0, 1, 0, 0, 1, 1]),
+    ('Jazz Animado', [0, 0, 0, 1, 0, 1, 0]),
+    ('Jazz Calmo', [0, 0, 0, 1, 0, 0, 1]),
+]
+
+
+def _modelo_so_csv():
+    """Modelo treinado só com os blocos do CSV (sem colunas de tags do Last.fm)."""
+    matriz = np.array([pesos for _, pesos in LINHAS_CSV], dtype=np.float64)
+    matriz /= np.linalg.norm(matriz, axis=1, keepdims=True)
+    return ModeloTfidfIncremental.de_matriz(csr_matrix(matriz), [t for t, _ in LINHAS_CSV], TAGS_CSV,
+                                            artistas=['Banda'] * len(LINHAS_CSV))
+
+
+def test_tags_do_lastfm_casam_com_generos_e_descritores_do_csv():
+    modelo = _modelo_so_csv()
+    modelo.adicionar_album('Novo', [('post rock', 1.0), ('Melancholic', 0.8), ('Indie', 0.5)], artista='Outra')
+
+    colunas, valores = modelo.matriz.linha(modelo.n_albuns - 1)
+    nomes = {modelo.tags[c] for c, v in zip(colunas, valores) if v != 0}
+    assert {'genero:Post-Rock', 'descritor:melancholic'} <= nomes
+    assert 'genero:Indie' not in modelo.colunas  # tag sem equivalente no CSV não inventa gênero
+
+    linhas, sims = modelo.recomendar_lote([[modelo.n_albuns - 1]], qtd=2)
+    assert linhas[0, 0] == 0  # 'Post-Rock Triste'
+    assert (sims[0] > 0).all()
+
+
+def test_album_adicionado_a_modelo_so_csv_tem_recomendacoes(criar_sistema):
+    sistema = criar_sistema(None, modelo=_modelo_so_csv())
+    dados = [{'Album': 'Novo Rap', 'Tag': tag, 'Peso': peso} for tag, peso in [('Hip-Hop', 1.0), ('Energetic', 0.7)]]
+    novo = sistema.adicionar_album('Novo Rap', dados, artista='MC')
+
+    recs = sistema.recomendar([{'id': novo}], qtd=2)
+    assert [rec['album'] for rec in recs] == ['Rap Animado', 'Jazz Animado']
+    assert all(rec['score'] > 0 for rec in recs)
@@ -0,0 +1,165 @@
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+from xml.sax.saxutils import escape
+
+import pylast
+import pytest
+
+from rede_lastfm import CircuitoAberto, Disjuntor, ErroLastfm, RedeHttp, RedeResiliente
+
+httpx = pylast.httpx  # o cliente HTTP que o pylast instalado usa
+
+TAMANHOS = ['small', 'medium', 'large', 'extralarge', 'mega']
+ALBUNS = {  # (artista, título) -> (tags [(nome, contagem)], capas por tamanho)
+    ('Radiohead', 'OK Computer'): ([('alternative', 100), ('rock', 87), ('90s', 31)],
+                                   ['s.png', 'm.png', 'l.png', 'xl.png', '']),
+    ('Slowdive', 'Souvlaki'): ([('shoegaze', 100)], ['s2.png', 'm2.png', 'l2.png', 'xl2.png', 'mg2.png']),
+    ('Desconhecido', 'Sem Tags'): ([], []),
+}
+ARTISTAS = {'Radiohead': [('alternative', 100), ('britpop', 40)], 'Slowdive': [('shoegaze', 100)]}
+
+
+def _resposta(params):
+    """Mesmos dados da API para os dois clientes: (status HTTP, {'erro': (código, mensagem)} ou o conteúdo)."""
+    metodo = params['method']
+    if params.get('artist') == 'Fora do Ar': return 503, None
+    if metodo == 'album.search':
+        consulta = params['album'].casefold()
+        return 200, {'busca': [(a, t, ALBUNS[a, t][1]) for a, t in ALBUNS if consulta in t.casefold()]}
+    if metodo == 'artist.getTopTags':
+        if params['artist'] not in ARTISTAS: return 200, {'erro': (6, 'The artist you supplied could not be found')}
+        return 200, {'tags': ARTISTAS[params['artist']]}
+    chave = (params['artist'], params['album'])
+    if chave not in ALBUNS: return 200, {'erro': (6, 'Album not found')}
+    tags, capas = ALBUNS[chave]
+    return 200, {'tags': tags} if metodo == 'album.getTopTags' else {'capas': capas}
+
+
+def _json(conteudo):
+    imagens = lambda capas: [{'#text': url, 'size': tamanho} for url, tamanho in zip(capas, TAMANHOS)]
+    if 'erro' in conteudo: return {'error': conteudo['erro'][0], 'message': conteudo['erro'][1]}
+    if 'tags' in conteudo:
+        tags = [{'name': nome, 'count': n} for nome, n in conteudo['tags']]
+        return {'toptags': {'tag': tags[0] if len(tags) == 1 else tags}}  # um item só: objeto, não lista
+    if 'capas' in conteudo: return {'album': {'image': imagens(conteudo['capas'])}}
+    return {'results': {'albummatches': {'album': [{'artist': a, 'name': t, 'image': imagens(c)}
+                                                   for a, t, c in conteudo['busca']]}}}
+
+
+def _xml(conteudo):
+    imagens = lambda capas: ''.join(f'<image size="{tamanho}">{escape(url)}</image>'
+                                    for url, tamanho in zip(capas, TAMANHOS))
+    if 'erro' in conteudo: return f'<lfm status="failed"><error code="{conteudo["erro"][0]}">{conteudo["erro"][1]}</error></lfm>'
+    if 'tags' in conteudo:
+        corpo = ''.join(f'<tag><name>{escape(nome)}</name><count>{n}</count></tag>' for nome, n in conteudo['tags'])
+        corpo = f'<toptags>{corpo}</toptags>'
+    elif 'capas' in conteudo:
+        corpo = f'<album>{imagens(conteudo["capas"])}</album>'
+    else:
+        corpo = ''.join(f'<album><name>{escape(t)}</name><artist>{escape(a)}</artist>{imagens(c)}</album>'
+                        for a, t, c in conteudo['busca'])
+        corpo = f'<results><opensearch:totalResults>{len(conteudo["busca"])}</opensearch:totalResults>' \
+                f'<albummatches>{corpo}</albummatches></results>'
+    return f'<?xml version="1.0" encoding="utf-8"?><lfm status="ok">{corpo}</lfm>'
+
+
+class _SessaoFalsa:
+    """Faz o papel da requests.Session da RedeHttp, respondendo com _resposta em JSON."""
+
+    def __init__(self):
+        self.pedidos = []
+
+    def get(self, url, params, **kwargs):
+        self.pedidos.append(params)
+        status, conteudo = _resposta(params)
+        if conteudo is None: return SimpleNamespace(status_code=status, reason='Service Unavailable')
+        return SimpleNamespace(status_code=status, reason='OK', json=lambda: _json(conteudo))
+
+    def close(self):
+        pass
+
+
+def _rede_http():
+    rede = RedeHttp('chave')
+    rede.sessao.close()
+    rede.sessao = _SessaoFalsa()
+    return rede, rede.sessao.pedidos
+
+
+def _rede_pylast():
+    """pylast de verdade, com o transporte HTTP trocado por um que responde com _resposta em XML."""
+    pedidos = []
+
+    def responder(requisicao):
+        params = {k: v[0] for k, v in parse_qs(requisicao.content.decode()).items()}
+        pedidos.append(params)
+        status, conteudo = _resposta(params)
+        return httpx.Response(status, text='' if conteudo is None else _xml(conteudo))
+
+    rede = pylast.LastFMNetwork(api_key='chave')
+    rede.proxy = {'https://': httpx.MockTransport(responder)}
+    return rede, pedidos
+
+
+def _resultado(consulta, rede):
+    """Resposta normalizada (ou o código do erro) de uma consulta do jeito que o projeto a usa."""
+    try:
+        valor = consulta(rede)
+    except (ErroLastfm, pylast.WSError) as e:
+        return 'erro', str(e.status)
+    if isinstance(valor, list) and valor and hasattr(valor[0], 'weight'):
+        return [(t.item.get_name(), int(t.weight)) for t in valor]  # como em cliente_lastfm._tags_da_api
+    if isinstance(valor, list):
+        return [(a.artist.name, a.title, a.get_cover_image(size=3)) for a in valor]
+    return valor
+
+
+CONSULTAS = {
+    'tags do álbum': lambda rede: rede.get_album('Radiohead', 'OK Computer').get_top_tags(limit=2),
+    'tags do álbum, limite 0': lambda rede: rede.get_album('Radiohead', 'OK Computer').get_top_tags(limit=0),
+    'uma tag só': lambda rede: rede.get_album('Slowdive', 'Souvlaki').get_top_tags(),
+    'sem tags': lambda rede: rede.get_album('Desconhecido', 'Sem Tags').get_top_tags(),
+    'tags do artista': lambda rede: rede.get_artist('Radiohead').get_top_tags(limit=5),
+    'capa': lambda rede: rede.get_album('Slowdive', 'Souvlaki').get_cover_image(size=3),
+    'capa pequena': lambda rede: rede.get_album('Radiohead', 'OK Computer').get_cover_image(size=0),
+    'capa vazia': lambda rede: rede.get_album('Radiohead', 'OK Computer').get_cover_image(size=4),
+    'álbum inexistente': lambda rede: rede.get_album('Radiohead', 'Nada').get_cover_image(size=3),
+    'artista inexistente': lambda rede: rede.get_artist('Ninguém').get_top_tags(),
+    'fora do ar': lambda rede: rede.get_artist('Fora do Ar').get_top_tags(),
+    'busca': lambda rede: rede.search_for_album('o').get_next_page(),
+    'busca vazia': lambda rede: rede.search_for_album('zzz').get_next_page(),
+}
+
+
+@pytest.mark.parametrize('consulta', CONSULTAS.values(), ids=CONSULTAS.keys())
+def test_rede_http_responde_como_o_pylast(consulta):
+    (http, pedidos_http), (original, pedidos_pylast) = _rede_http(), _rede_pylast()
+    assert _resultado(consulta, http) == _resultado(consulta, original)
+    assert [p['method'] for p in pedidos_http] == [p['method'] for p in pedidos_pylast]
+
+
+@pytest.mark.parametrize('artista, chamadas', [('Fora do Ar', 3), ('Ninguém', 1)])
+def test_rede_resiliente_repete_os_mesmos_erros_nos_dois(artista, chamadas):
+    for rede, pedidos in (_rede_http(), _rede_pylast()):
+        resiliente = RedeResiliente(rede, tentativas=3, disjuntor=Disjuntor(limite=10), espera_base=0)
+        with pytest.raises((ErroLastfm, pylast.WSError)):
+            resiliente.get_artist(artista).get_top_tags()
+        assert len(pedidos) == chamadas  # 503 é repetido, "não encontrado" (6) não
+
+
+def test_objetos_devolvidos_tambem_passam_pela_rede_resiliente():
+    rede, pedidos = _rede_http()
+    disjuntor = Disjuntor(limite=1, tempo_aberto=60)
+    resiliente = RedeResiliente(rede, tentativas=2, disjuntor=disjuntor, espera_base=0)
+    album = resiliente.search_for_album('ok').get_next_page()[0]
+    assert album.artist.get_top_tags()[0].item.get_name() == 'alternative'
+
+    # O artista de um resultado de busca cai no disjuntor como qualquer chamada da rede
+    album.artist._alvo.name = 'Fora do Ar'
+    with pytest.raises(ErroLastfm):
+        album.artist.get_top_tags()
+    assert disjuntor.estado == 'aberto'
+    antes = len(pedidos)
+    with pytest.raises(CircuitoAberto):
+        album.artist.get_top_tags()
+    assert len(pedidos) == antes
@@ -1,17 +1,38 @@
+import argparse
+
 import pandas as pd
-import joblib
-import pylast
-import time
-from sklearn.neighbors import NearestNeighbors
-from scipy.sparse import csr_matrix
 from sklearn.feature_extraction.text import TfidfTransformer
+from armazem_tags import ArmazemAlbumTag
+from cache_metadados import CacheMetadados
+from caracteristicas import construir_blocos
+from ingestao import ingerir
+from indice_nomes import IndiceNomes
+from modelo_incremental import ModeloTfidfIncremental
+from pacote_modelo import salvar_pacote
 
 # ================= CONFIGURAÇÃO DA API LAST.FM =================
 API_KEY = "API_KEY"
 API_SECRET = "API_SECRET"
+ARQUIVO_CSV = 'rym_clean1.csv'
+
+parser = argparse.ArgumentParser(description="Treina o modelo a partir do CSV do RYM")
+parser.add_argument('--csv', default=ARQUIVO_CSV)
+parser.add_argument('--fluxo', action='store_true',
+                    help="lê o CSV em blocos com memória limitada (CSVs maiores que a memória); "
+                         "não chama a API, usa só as tags já coletadas em tags_coletadas.csv")
+args = parser.parse_args()
+
+if args.fluxo:
+    from treino_fluxo import treinar_em_fluxo
+    versao = treinar_em_fluxo(args.csv)
+    print(f"Treinamento concluído ({versao})! Execute o interface.py agora.")
+    exit()
 
 try:
-    network = pylast.LastFMNetwork(api_key=API_KEY, api_secret=API_SECRET)
+    from rede_lastfm import RedeHttp, RedeResiliente
+    # Falhas passageiras são repetidas; com a API fora do ar o disjuntor abre e os álbuns usam o CSV
+    # (ficam fora do checkpoint e são buscados de novo na próxima execução)
+    network = RedeResiliente(RedeHttp(API_KEY))
 except:
     print("Erro: Configure API_KEY no script.")
     exit()
@@ -19,8 +40,8 @@ except:
 # ================= 1. CARREGAR E PROCESSAR DADOS =================
 print("1. Lendo arquivo CSV...")
 try:
-    df_source = pd.read_csv('rym_clean1.csv')
-    df_unique = df_source.drop_duplicates(subset=['release_name']).copy()
+    df_source = pd.read_csv(args.csv)
+    df_unique = df_source.drop_duplicates(subset=['artist_name', 'release_name']).copy()
     
     # Opcional: Limite para testes (remova para produção)
     # df_unique = df_unique.head(50) 
@@ -30,63 +51,36 @@ except FileNotFoundError:
     print("Erro: CSV não encontrado.")
     exit()
 
-data_list = []
+cache = CacheMetadados()  # tags já buscadas em execuções anteriores não voltam à API
 
 print("2. Buscando dados no Last.fm...")
-
-for index, row in df_unique.iterrows():
-    album_name = row['release_name']
-    artist_name = row['artist_name']
-    
-    print(f"Processando: {album_name}...")
-    
-    try:
-        album_obj = network.get_album(artist_name, album_name)
-        top_tags = album_obj.get_top_tags(limit=3)
-        
-        if not top_tags:
-            genero_csv = str(row['primary_genres']).split(',')[0]
-            data_list.append([album_name, genero_csv, 1.0])
-            continue
-
-        max_weight = int(top_tags[0].weight) or 1
-
-        for tag_item in top_tags:
-            tag_name = tag_item.item.get_name().title()
-            tag_weight = int(tag_item.weight)
-            normalized_weight = tag_weight / max_weight
-            
-            # Atenção: Usando lista aqui em vez de tupla para facilitar pandas
-            data_list.append([album_name, tag_name, normalized_weight])
-            
-        time.sleep(0.2) # Rate limit
-
-    except Exception as e:
-        print(f"   -> Pulo: {e}")
-        continue
+# Busca paralela com checkpoint em disco: se o script cair, rodar de novo continua de onde parou.
+# Apague tags_coletadas.csv para refazer a coleta do zero.
+df_final = ingerir(df_unique, network, cache=cache)
+print(f"Cache de metadados: {cache.estatisticas()}")
 
 # ================= 3. CRIAR E SALVAR TUDO =================
 print("3. Gerando modelos...")
 
-# DataFrame Bruto (Essencial para permitir atualizações no main.py)
-df_final = pd.DataFrame(data_list, columns=['Album', 'Tag', 'Peso'])
+# Características do próprio CSV (gêneros, descritores, notas), recalculadas só se as colunas mudaram
+blocos = construir_blocos(df_unique)
 
-# Processamento Matemático
-matriz_albuns = df_final.pivot_table(index='Album', columns='Tag', values='Peso').fillna(0)
-matriz_esparsa = csr_matrix(matriz_albuns.values)
+# Processamento Matemático: álbum x tag direto em esparso (sem o pivot_table denso)
+armazem = ArmazemAlbumTag.de_dataframe(df_final)
+del df_final
+for df_bloco in blocos.values():
+    armazem.adicionar_dataframe(df_bloco)
+del blocos
+matriz_esparsa, chaves_albuns, nomes_tags = armazem.como_csr()
 transformer = TfidfTransformer()
 matriz_tfidf = transformer.fit_transform(matriz_esparsa)
 
-knn = NearestNeighbors(metric='cosine', algorithm='brute')
-knn.fit(matriz_tfidf)
-
-print("4. Salvando arquivos (incluindo dados brutos)...")
-
-# SALVAMOS O DATAFRAME BRUTO AGORA:
-joblib.dump(df_final, 'dados_brutos.pkl')
+# O KNN é força bruta sobre a própria matriz TF-IDF: não precisa de arquivo próprio
+artistas = [artista for artista, _ in chaves_albuns]
+titulos = [titulo for _, titulo in chaves_albuns]
+modelo = ModeloTfidfIncremental.de_matriz(matriz_tfidf, titulos, nomes_tags, artistas=artistas)
 
-joblib.dump(knn, 'modelo_knn.pkl')
-joblib.dump(matriz_tfidf, 'matriz_tfidf.pkl')
-joblib.dump(matriz_albuns.index, 'lista_nomes.pkl')
+print("4. Salvando pacote do modelo...")
+versao = salvar_pacote(modelo, IndiceNomes(modelo.nomes, modelo.ids))
 
-print("Treinamento concluído! Execute o main.py agora.")
\ No newline at end of file
+print(f"Treinamento concluído ({versao})! Execute o interface.py agora.")
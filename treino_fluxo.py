@@ -0,0 +1,339 @@
+"""
+Treino em fluxo, para CSVs maiores que a memória (python treinar.py --fluxo).
+
+    1. O CSV é lido em blocos; (artista, título) repetidos são descartados com um conjunto em disco
+       (SQLite com o hash de 64 bits da chave -> linha do álbum), sem guardar as chaves na memória.
+    2. Cada bloco vira entradas (linha, coluna, peso) dos blocos de características do CSV, despejadas
+       em arquivos crus. As tags do Last.fm já coletadas (tags_coletadas.csv, também lido em blocos)
+       entram do mesmo jeito, casadas com a linha do álbum pelo conjunto em disco.
+    3. As entradas são repartidas em baldes de linhas consecutivas (~ENTRADAS_POR_PASSADA cada), um
+       arquivo por balde.
+    4. TF-IDF em duas passadas sobre a matriz em disco: a primeira lê um balde por vez, funde as
+       entradas repetidas (média, como o ArmazemAlbumTag), grava as linhas em CSR e conta a frequência
+       de documentos de cada tag; a segunda aplica o IDF e normaliza as linhas (mesma fórmula do
+       TfidfTransformer), reescrevendo os pesos no lugar.
+
+Todas as leituras e escritas são sequenciais e em blocos: em memória ficam só o vocabulário de tags
+e um bloco/balde por vez (o índice de nomes, montado só para salvar o pacote, é a exceção: ver
+treinar_em_fluxo). A matriz, os títulos e o conjunto de álbuns vistos ficam na pasta de
+trabalho, apagada no fim. As linhas seguem a ordem do CSV (o treino em memória ordena por artista/título).
+Não chama a API: álbuns sem tags no checkpoint ficam só com os blocos do CSV (colete antes com o
+treino normal, ou pelo ingestao.ingerir, para ter as tags do Last.fm). Linhas do checkpoint de álbuns
+que não estão neste CSV, ou sem artista (checkpoints antigos), são ignoradas.
+"""
+import os
+import shutil
+import sqlite3
+
+import numpy as np
+
+from caracteristicas import CONSTRUTORES, PREFIXOS
+from ingestao import ARQUIVO_CHECKPOINT
+from modelo_incremental import ModeloTfidfIncremental, TabelaNomes, calcular_idf
+
+# ================= CONFIGURAÇÃO =================
+DIRETORIO_FLUXO = 'treino_fluxo'    # arquivos intermediários (apagados no fim)
+LINHAS_POR_BLOCO = 50_000           # linhas do CSV (e do checkpoint) lidas por vez
+ENTRADAS_POR_PASSADA = 4_000_000    # entradas da matriz tratadas por vez no agrupamento e no TF-IDF
+COLUNA_POPULARIDADE = PREFIXOS['notas'] + 'popularidade'  # normalizada pelo máximo global, só no fim
+
+
+def _hash_chaves(artistas, titulos):
+    import pandas as pd
+    quadro = pd.DataFrame({'artista': artistas, 'titulo': titulos})
+    return pd.util.hash_pandas_object(quadro, index=False).to_numpy().view(np.int64)
+
+
+class ConjuntoAlbuns:
+    """
+    (artista, título) -> linha do álbum, em SQLite. Guarda o hash de 64 bits da chave: duas chaves
+    diferentes com o mesmo hash (~1 em 10^11 para 10^4 álbuns, ~1 em 10^5 para 10^7) virariam um álbum só.
+    """
+
+    def __init__(self, caminho):
+        self.conexao = sqlite3.connect(caminho)
+        self.conexao.execute('PRAGMA journal_mode=OFF')
+        self.conexao.execute('PRAGMA synchronous=OFF')
+        self.conexao.execute('CREATE TABLE IF NOT EXISTS albuns (chave INTEGER PRIMARY KEY, linha INTEGER NOT NULL)')
+        self.conexao.execute('CREATE TEMP TABLE bloco (chave INTEGER PRIMARY KEY)')
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def _existentes(self, chaves):
+        cursor = self.conexao.cursor()
+        cursor.execute('DELETE FROM bloco')
+        cursor.executemany('INSERT OR IGNORE INTO bloco VALUES (?)', ((c,) for c in chaves.tolist()))
+        return dict(cursor.execute('SELECT b.chave, a.linha FROM bloco b JOIN albuns a ON a.chave = b.chave'))
+
+    def registrar(self, chaves):
+        """Máscara das chaves ainda não vistas (só a 1ª de repetidas no próprio bloco) e as linhas novas delas."""
+        _, primeiras = np.unique(chaves, return_index=True)
+        novas = np.zeros(len(chaves), dtype=bool)
+        novas[primeiras] = True
+        existentes = self._existentes(chaves[novas])
+        if existentes:
+            novas &= ~np.isin(chaves, np.fromiter(existentes, dtype=np.int64, count=len(existentes)))
+        linhas = np.arange(self.n, self.n + int(novas.sum()), dtype=np.int64)
+        self.conexao.executemany('INSERT INTO albuns VALUES (?, ?)', zip(chaves[novas].tolist(), linhas.tolist()))
+        self.n += len(linhas)
+        return novas, linhas
+
+    def linhas(self, chaves):
+        """Linha de cada chave, -1 para as desconhecidas."""
+        existentes = self._existentes(np.unique(chaves))
+        return np.fromiter((existentes.get(c, -1) for c in chaves.tolist()), dtype=np.int64, count=len(chaves))
+
+    def fechar(self):
+        self.conexao.close()
+
+
+class _Despejo:
+    """Arquivos crus só de acréscimo, um por array (tipo fixo), lidos de volta em blocos ou com np.memmap."""
+
+    def __init__(self, pasta, tipos):
+        self.caminhos = {nome: os.path.join(pasta, f'{nome}.bin') for nome in tipos}
+        self.tipos = tipos
+        self.n = 0
+        for caminho in self.caminhos.values():
+            open(caminho, 'wb').close()
+
+    def escrever(self, **arrays):
+        # Abre a cada escrita: com um despejo por balde, manter tudo aberto esgotaria os descritores
+        for nome, array in arrays.items():
+            with open(self.caminhos[nome], 'ab') as f:
+                f.write(np.ascontiguousarray(array, dtype=self.tipos[nome]).tobytes())
+        self.n += len(next(iter(arrays.values())))
+
+    def ler(self, nome, inicio=0, fim=None):
+        fim = self.n if fim is None else fim
+        tipo = np.dtype(self.tipos[nome])
+        return np.fromfile(self.caminhos[nome], dtype=tipo, count=fim - inicio, offset=inicio * tipo.itemsize)
+
+    def blocos(self, tamanho):
+        for inicio in range(0, self.n, tamanho):
+            fim = min(inicio + tamanho, self.n)
+            yield tuple(self.ler(nome, inicio, fim) for nome in self.tipos)
+
+    def abrir(self, nome):
+        if self.n == 0: return np.zeros(0, dtype=self.tipos[nome])
+        return np.memmap(self.caminhos[nome], dtype=self.tipos[nome], mode='r', shape=(self.n,))
+
+    def apagar(self):
+        for caminho in self.caminhos.values():
+            os.remove(caminho)
+
+
+class _TabelaEmDisco:
+    """Títulos/artistas escritos bloco a bloco no formato da TabelaNomes (bytes + offsets)."""
+
+    def __init__(self, pasta, prefixo):
+        self.dados = _Despejo(pasta, {f'{prefixo}': np.uint8})
+        self.offsets = _Despejo(pasta, {f'{prefixo}_offsets': np.int64})
+        self.prefixo = prefixo
+        self.tamanho = 0
+        self.offsets.escrever(**{f'{prefixo}_offsets': [0]})
+
+    def escrever(self, nomes):
+        codificados = [str(n).encode('utf-8') for n in nomes]
+        fins = self.tamanho + np.cumsum([len(c) for c in codificados], dtype=np.int64)
+        self.dados.escrever(**{self.prefixo: np.frombuffer(b''.join(codificados), dtype=np.uint8)})
+        self.offsets.escrever(**{f'{self.prefixo}_offsets': fins})
+        if len(fins): self.tamanho = int(fins[-1])
+
+    def tabela(self):
+        return TabelaNomes(self.dados.abrir(self.prefixo), self.offsets.abrir(f'{self.prefixo}_offsets'))
+
+
+class _Vocabulario:
+    """Tag -> coluna, na ordem em que aparecem (reordenadas alfabeticamente só na passada do TF-IDF)."""
+
+    def __init__(self):
+        self.colunas = {}
+
+    def __call__(self, tags):
+        import pandas as pd
+        codigos, unicas = pd.factorize(pd.Series(tags, dtype=object), sort=False)
+        mapa = np.fromiter((self.colunas.setdefault(t, len(self.colunas)) for t in unicas),
+                           dtype=np.int32, count=len(unicas))
+        return mapa[codigos]
+
+
+def _entradas_csv(df, linhas, vocabulario):
+    """Entradas (linha, coluna, peso) dos blocos do CSV para um bloco de álbuns novos; e o log1p máximo de votos."""
+    import pandas as pd
+    partes = []
+    for bloco, (construtor, _, _) in CONSTRUTORES.items():
+        # Popularidade sai crua (log1p dos votos): o máximo só é conhecido no fim do arquivo
+        partes.append(construtor(df, maximo_votos=1.0) if bloco == 'notas' else construtor(df))
+    longo = pd.concat(partes, ignore_index=True)
+    chaves = pd.MultiIndex.from_arrays([df['artist_name'], df['release_name']])
+    posicoes = chaves.get_indexer(pd.MultiIndex.from_arrays([longo['Artista'], longo['Album']]))
+    votos = np.log1p(pd.to_numeric(df['rating_count'], errors='coerce').to_numpy(dtype=np.float64))
+    return linhas[posicoes], vocabulario(longo['Tag'].to_numpy()), longo['Peso'].to_numpy(np.float64), \
+        np.nanmax(votos, initial=0.0)
+
+
+def _ler_blocos(caminho_csv, linhas_por_bloco):
+    import pandas as pd
+    for df in pd.read_csv(caminho_csv, chunksize=linhas_por_bloco):
+        df['artist_name'] = df['artist_name'].fillna('').astype(str)
+        df['release_name'] = df['release_name'].astype(str)
+        yield df
+
+
+def _ler_checkpoint_blocos(caminho, linhas_por_bloco):
+    import pandas as pd
+    # Sem o truncamento do ingestao._ler_checkpoint: uma última linha cortada vira peso inválido e sai no filtro
+    for df in pd.read_csv(caminho, names=['Album', 'Tag', 'Peso', 'Artista'], keep_default_na=False,
+                          dtype={'Album': str, 'Tag': str, 'Artista': str}, chunksize=linhas_por_bloco):
+        df['Peso'] = pd.to_numeric(df['Peso'], errors='coerce')
+        df['Artista'] = df['Artista'].fillna('')
+        yield df[df['Peso'] > 0]
+
+
+def _particionar(despejo, n_linhas, pasta, entradas_por_passada):
+    """Reparte as entradas em baldes de linhas consecutivas; retorna (linhas por balde, despejos dos baldes)."""
+    linhas_por_balde = max(1, int(n_linhas * entradas_por_passada / max(despejo.n, 1)))
+    baldes = [_Despejo(pasta, {f'balde{b}_linhas': np.int32, f'balde{b}_colunas': np.int32,
+                               f'balde{b}_pesos': np.float64})
+              for b in range(-(-n_linhas // linhas_por_balde))]
+    for linhas, colunas, pesos in despejo.blocos(entradas_por_passada):
+        numeros = linhas // linhas_por_balde
+        ordem = np.argsort(numeros, kind='stable')
+        linhas, colunas, pesos = linhas[ordem], colunas[ordem], pesos[ordem]
+        cortes = np.searchsorted(numeros[ordem], np.arange(len(baldes) + 1))
+        for b, despejo_balde in enumerate(baldes):
+            a, z = cortes[b], cortes[b + 1]
+            if a == z: continue
+            despejo_balde.escrever(**dict(zip(despejo_balde.tipos, (linhas[a:z], colunas[a:z], pesos[a:z]))))
+    despejo.apagar()
+    return linhas_por_balde, baldes
+
+
+def _primeira_passada(baldes, linhas_por_balde, n_linhas, nova_coluna, escalas, pasta):
+    """Funde repetidas (média) balde a balde, grava a matriz em CSR e conta a frequência de documentos."""
+    from scipy.sparse import csr_matrix
+    n_tags = len(nova_coluna)
+    matriz = _Despejo(pasta, {'data': np.float64, 'indices': np.int32})
+    indptr = _Despejo(pasta, {'indptr': np.int32})
+    indptr.escrever(indptr=[0])
+    freq_docs = np.zeros(n_tags, dtype=np.int64)
+    for b, balde in enumerate(baldes):
+        inicio = b * linhas_por_balde
+        formato = (min(linhas_por_balde, n_linhas - inicio), n_tags)
+        linhas, colunas, pesos = (balde.ler(nome) for nome in balde.tipos)
+        posicao = (linhas - inicio, nova_coluna[colunas])
+        soma = csr_matrix((pesos, posicao), shape=formato)
+        contagem = csr_matrix((np.ones(len(pesos)), posicao), shape=formato)
+        soma.sum_duplicates()
+        contagem.sum_duplicates()
+        soma.data /= contagem.data  # mesma estrutura nas duas: soma / repetições = média
+        soma.data *= escalas[soma.indices]
+        freq_docs += np.bincount(soma.indices, minlength=n_tags)
+        if matriz.n + soma.nnz >= 2 ** 31:
+            raise ValueError("a matriz passa de 2^31 entradas, o limite do indptr int32 do modelo")
+        indptr.escrever(indptr=matriz.n + soma.indptr[1:])
+        matriz.escrever(data=soma.data, indices=soma.indices)
+        balde.apagar()
+    return matriz, indptr, freq_docs.astype(np.float64)
+
+
+def _segunda_passada(matriz, indptr, idf, linhas_por_passada):
+    """Multiplica pelo IDF e normaliza cada linha (L2), reescrevendo os pesos no lugar."""
+    n_linhas = indptr.n - 1
+    with open(matriz.caminhos['data'], 'r+b') as f:
+        for inicio in range(0, n_linhas, linhas_por_passada):
+            fim = min(inicio + linhas_por_passada, n_linhas)
+            ponteiros = indptr.ler('indptr', inicio, fim + 1).astype(np.int64)
+            a, z = ponteiros[0], ponteiros[-1]
+            valores = matriz.ler('data', a, z) * idf[matriz.ler('indices', a, z)]
+            linhas = np.repeat(np.arange(fim - inicio), np.diff(ponteiros))
+            normas = np.sqrt(np.bincount(linhas, weights=valores * valores, minlength=fim - inicio))
+            normas[normas == 0] = 1.0
+            f.seek(a * 8)
+            f.write((valores / normas[linhas]).tobytes())
+
+
+def montar_em_fluxo(caminho_csv, caminho_tags=ARQUIVO_CHECKPOINT, pasta=DIRETORIO_FLUXO,
+                    linhas_por_bloco=LINHAS_POR_BLOCO, entradas_por_passada=ENTRADAS_POR_PASSADA, **kwargs):
+    """
+    Modelo TF-IDF montado em fluxo a partir do CSV (e do checkpoint de tags, se existir).
+    Os arrays do modelo são np.memmap dentro de 'pasta': salve o pacote antes de apagá-la.
+    kwargs vão para o ModeloTfidfIncremental.de_arrays (limiar_deriva, indice).
+    """
+    shutil.rmtree(pasta, ignore_errors=True)
+    os.makedirs(pasta)
+    conjunto = ConjuntoAlbuns(os.path.join(pasta, 'albuns.db'))
+    despejo = _Despejo(pasta, {'linhas': np.int32, 'colunas': np.int32, 'pesos': np.float64})
+    titulos, artistas = _TabelaEmDisco(pasta, 'nomes'), _TabelaEmDisco(pasta, 'artistas')
+    vocabulario = _Vocabulario()
+    sem_checkpoint = not os.path.exists(caminho_tags)
+
+    print("1. Lendo o CSV em blocos...")
+    lidas, maximo_votos = 0, 0.0
+    for df in _ler_blocos(caminho_csv, linhas_por_bloco):
+        lidas += len(df)
+        novas, linhas = conjunto.registrar(_hash_chaves(df['artist_name'].to_numpy(), df['release_name'].to_numpy()))
+        df = df[novas]
+        titulos.escrever(df['release_name'])
+        artistas.escrever(df['artist_name'])
+        linhas_entradas, colunas, pesos, maximo = _entradas_csv(df, linhas, vocabulario)
+        despejo.escrever(linhas=linhas_entradas, colunas=colunas, pesos=pesos)
+        maximo_votos = max(maximo_votos, maximo)
+        print(f"   {lidas} linhas lidas, {len(conjunto)} álbuns únicos")
+
+    if not sem_checkpoint:
+        print("2. Tags do Last.fm do checkpoint...")
+        casadas = ignoradas = 0
+        for df in _ler_checkpoint_blocos(caminho_tags, linhas_por_bloco):
+            linhas = conjunto.linhas(_hash_chaves(df['Artista'].to_numpy(), df['Album'].to_numpy()))
+            conhecidas = linhas >= 0
+            despejo.escrever(linhas=linhas[conhecidas], colunas=vocabulario(df['Tag'].to_numpy()[conhecidas]),
+                             pesos=df['Peso'].to_numpy(np.float64)[conhecidas])
+            casadas += int(conhecidas.sum())
+            ignoradas += int((~conhecidas).sum())
+        print(f"   {casadas} tags casadas, {ignoradas} ignoradas")
+    conjunto.fechar()
+
+    print("3. Repartindo as entradas por faixa de álbuns...")
+    n_linhas = len(conjunto)
+    linhas_por_balde, baldes = _particionar(despejo, n_linhas, pasta, entradas_por_passada)
+
+    print("4. TF-IDF (frequência de documentos, depois pesos)...")
+    tags = list(vocabulario.colunas)
+    ordem_tags = np.argsort(np.array(tags, dtype=object), kind='stable')
+    nova_coluna = np.empty(len(tags), dtype=np.int32)
+    nova_coluna[ordem_tags] = np.arange(len(tags), dtype=np.int32)
+    escalas = np.ones(len(tags))
+    if COLUNA_POPULARIDADE in vocabulario.colunas:
+        escalas[nova_coluna[vocabulario.colunas[COLUNA_POPULARIDADE]]] = 1.0 / (maximo_votos or 1.0)
+    matriz, indptr, freq_docs = _primeira_passada(baldes, linhas_por_balde, n_linhas, nova_coluna, escalas, pasta)
+    idf = calcular_idf(freq_docs, n_linhas)
+    _segunda_passada(matriz, indptr, idf, linhas_por_balde)
+
+    tags_ordenadas = [tags[j] for j in ordem_tags]
+    return ModeloTfidfIncremental.de_arrays(matriz.abrir('data'), matriz.abrir('indices'), indptr.abrir('indptr'),
+                                            titulos.tabela(), tags_ordenadas, freq_docs, idf,
+                                            artistas=artistas.tabela(), **kwargs)
+
+
+def treinar_em_fluxo(caminho_csv, caminho_tags=ARQUIVO_CHECKPOINT, pasta=DIRETORIO_FLUXO, **kwargs):
+    """
+    Monta em fluxo, salva o pacote do modelo e apaga a pasta de trabalho. Retorna a versão salva.
+
+    O índice de nomes não é montado em fluxo: ele é um objeto Python inteiro na memória (~400 bytes por
+    álbum), gravado em pickle junto do pacote (o pickler soma ~200 bytes por álbum enquanto grava). Com
+    1 milhão de álbuns o pico vai de ~430 MB (só a matriz) a ~960 MB (python benchmark.py fluxo). A
+    aplicação paga os mesmos ~400 bytes por álbum ao abrir o pacote, então o treino não pede muito mais
+    memória do que usar o resultado pediria.
+    """
+    from indice_nomes import IndiceNomes
+    from pacote_modelo import salvar_pacote
+    modelo = montar_em_fluxo(caminho_csv, caminho_tags, pasta, **kwargs)
+    print("5. Salvando pacote do modelo...")
+    try:
+        return salvar_pacote(modelo, IndiceNomes(modelo.nomes, modelo.ids))
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)